@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+from websockets.asyncio.client import ClientConnection, connect
+
+from config import ServerConfig
+from encoding import CODECS, JSON, Codec
+
+# drives simulated players against a local server over loopback:
+#   python bench.py --rooms 200 --players 8 --duration 30
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_server(config: ServerConfig) -> None:
+    from log import setup_logging
+
+    setup_logging(config.log_level)
+    if config.workers > 1:
+        from shard import run_sharded
+
+        run_sharded(config)
+    else:
+        from server import MafiaServer
+
+        server = MafiaServer(config)
+        try:
+            asyncio.run(server.start())
+        except KeyboardInterrupt:
+            pass
+
+
+class CountingConnection(ClientConnection):
+    # counts bytes as they come off the socket, before decompression
+    wire_bytes: int = 0
+
+    def data_received(self, data: bytes) -> None:
+        CountingConnection.wire_bytes += len(data)
+        super().data_received(data)
+
+
+def tree_pids(pid: int) -> List[int]:
+    # a process and all of its descendants
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    found = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        found.append(current)
+        pending.extend(children.get(current, []))
+    return found
+
+
+def tree_rss(pid: int) -> int:
+    # resident set size of a process and all of its descendants, in bytes
+    total = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for current in tree_pids(pid):
+        try:
+            with open(f"/proc/{current}/statm") as statm:
+                total += int(statm.read().split()[1]) * page_size
+        except OSError:
+            pass
+    return total
+
+
+def tree_cpu(pid: int) -> float:
+    # user plus system seconds used so far by a process and its descendants
+    ticks = 0
+    for current in tree_pids(pid):
+        try:
+            with open(f"/proc/{current}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.sent: int = 0
+        self.received: int = 0
+        self.frames: int = 0
+        self.bytes: int = 0
+        self.latencies: List[float] = []
+        self.phase_lags: List[float] = []
+        self.games: int = 0
+        self.errors: int = 0
+        self.disconnects: int = 0
+
+
+class Table:
+    # one benchmark room: the host bot plus everyone who joins it
+    def __init__(self, stats: Stats, size: int) -> None:
+        self.stats: Stats = stats
+        self.size: int = size
+        self.code: Optional[str] = None
+        self.joined: asyncio.Event = asyncio.Event()
+        self.phase: Optional[str] = None
+        self.last_action_at: float = 0.0
+        self.started: bool = False
+
+    def ready(self, players: int, minimum_players: int) -> bool:
+        # after the first game, carry on with whoever is left as long as the
+        # room's minimum is met
+        return players >= (minimum_players if self.started else self.size)
+
+    def observe_phase(self, phase: str) -> None:
+        if phase == self.phase:
+            return
+        if self.phase in ("night", "day") and self.last_action_at:
+            self.stats.phase_lags.append(time.monotonic() - self.last_action_at)
+        self.phase = phase
+        self.last_action_at = 0.0
+
+
+class Bot:
+    def __init__(
+        self, table: Table, name: str, chat_per_phase: float, codec: Codec
+    ) -> None:
+        self.table: Table = table
+        self.codec: Codec = codec
+        self.name: str = name
+        self.chat_per_phase: float = chat_per_phase
+        self.websocket: Optional[ClientConnection] = None
+        self.game_state: Dict[str, Any] = {}
+        self.player_info: Dict[str, Any] = {}
+        self.players: Dict[str, Dict[str, Any]] = {}
+        self.phase: Optional[str] = None
+        self.acted: bool = False
+
+    @property
+    def is_host(self) -> bool:
+        return bool(self.game_state.get("is_host"))
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        assert self.websocket is not None
+        self.table.stats.sent += 1
+        await self.websocket.send(self.codec.encode(event), text=self.codec.text)
+
+    async def run(self, url: str, first: Dict[str, Any]) -> None:
+        async with connect(
+            url,
+            max_queue=None,
+            subprotocols=[self.codec.subprotocol],
+            create_connection=CountingConnection,
+        ) as websocket:
+            self.websocket = websocket
+            await self.send(first)
+            async for frame in websocket:
+                self.table.stats.frames += 1
+                self.table.stats.bytes += len(frame)
+                data = self.codec.decode(frame)
+                for event in data if isinstance(data, list) else [data]:
+                    self.table.stats.received += 1
+                    await self.handle(event)
+        # the server closed on us; the benchmark cancels bots at the deadline
+        self.table.stats.disconnects += 1
+
+    async def handle(self, event: Dict[str, Any]) -> None:
+        kind = event["type"]
+        if kind == "room_created":
+            self.table.code = event["room_code"]
+            self.table.joined.set()
+        elif kind == "state_snapshot":
+            self.game_state = dict(event["game_state"])
+            self.player_info = dict(event["player_info"])
+            self.players = {p["id"]: p for p in event["players"]}
+        elif kind == "state_patch":
+            self.game_state.update(event.get("game_state", {}))
+            self.player_info.update(event.get("player_info", {}))
+        elif kind == "players_patch":
+            for entry in event["changed"]:
+                self.players[entry["id"]] = entry
+            for player_id in event["removed"]:
+                self.players.pop(player_id, None)
+        elif kind == "chat_message":
+            chat = event["chat"]
+            if not chat.get("is_server") and chat["message"].startswith("t="):
+                sent_at = float(chat["message"][2:])
+                self.table.stats.latencies.append(time.monotonic() - sent_at)
+            return
+        elif kind == "error":
+            self.table.stats.errors += 1
+            return
+        else:
+            return
+
+        phase: Optional[str] = self.game_state.get("phase")
+        if phase is not None:
+            self.table.observe_phase(phase)
+        await self.act()
+
+    async def act(self) -> None:
+        phase = self.game_state.get("phase")
+        me = self.player_info.get("id")
+
+        # night and day alternate, so a phase change is a fresh turn
+        if phase != self.phase:
+            self.phase = phase
+            self.acted = False
+        if self.acted:
+            return
+
+        if phase in ("waiting", "finished"):
+            if not self.is_host:
+                return
+            minimum_players: int = self.game_state.get("minimum_players", 0)
+            if phase == "waiting" and self.table.ready(
+                len(self.players), minimum_players
+            ):
+                self.acted = True
+                self.table.started = True
+                await self.send({"type": "start_game"})
+            elif phase == "finished":
+                # every bot sees the game end, but only the host counts it
+                self.acted = True
+                self.table.stats.games += 1
+                await self.send({"type": "replay_game"})
+            return
+
+        alive = sorted(
+            player_id
+            for player_id, player in self.players.items()
+            if player["is_alive"] and player_id != me
+        )
+        if not alive:
+            return
+
+        if phase == "night" and self.player_info.get("can_act_at_night"):
+            self.acted = True
+            self.table.last_action_at = time.monotonic()
+            await self.send({"type": "night_action", "target": random.choice(alive)})
+        elif phase == "day" and self.player_info.get("is_alive"):
+            self.acted = True
+            if random.random() < self.chat_per_phase:
+                await self.send({"type": "chat", "message": f"t={time.monotonic()}"})
+            # everyone votes for the same player so a consensus is reached
+            self.table.last_action_at = time.monotonic()
+            await self.send({"type": "vote", "target": alive[0]})
+
+
+async def run_table(
+    url: str, stats: Stats, size: int, chat_per_phase: float, codec: Codec
+) -> None:
+    table = Table(stats, size)
+    host = Bot(table, "bot0", chat_per_phase, codec)
+    tasks = [asyncio.create_task(host.run(url, {"type": "new_room", "name": "bot0"}))]
+    await table.joined.wait()
+
+    for seat in range(1, size):
+        bot = Bot(table, f"bot{seat}", chat_per_phase, codec)
+        first = {"type": "join_room", "room_code": table.code, "name": bot.name}
+        tasks.append(asyncio.create_task(bot.run(url, first)))
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def wait_for_server(url: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with connect(url):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def drive(args: argparse.Namespace, url: str, server_pid: int) -> Dict[str, Any]:
+    await wait_for_server(url)
+    stats = Stats()
+    codec = CODECS.get(f"mafia.{args.protocol}", JSON)
+    cpu_before = tree_cpu(server_pid)
+    wire_before = CountingConnection.wire_bytes
+    started = time.monotonic()
+    deadline = started + args.duration
+
+    tables = []
+    for _ in range(args.rooms):
+        tables.append(
+            asyncio.create_task(
+                run_table(url, stats, args.players, args.chat_per_phase, codec)
+            )
+        )
+        await asyncio.sleep(args.ramp / max(1, args.rooms))
+
+    peak_rss = 0
+    while time.monotonic() < deadline:
+        peak_rss = max(peak_rss, tree_rss(server_pid))
+        await asyncio.sleep(0.5)
+
+    elapsed = time.monotonic() - started
+    cpu = tree_cpu(server_pid) - cpu_before
+    wire = CountingConnection.wire_bytes - wire_before
+    for task in tables:
+        task.cancel()
+    await asyncio.gather(*tables, return_exceptions=True)
+    return {
+        "rooms": args.rooms,
+        "players": args.rooms * args.players,
+        "workers": args.workers,
+        "protocol": codec.name,
+        "compression": args.compression,
+        "batch_size": args.batch_size,
+        "seconds": round(elapsed, 2),
+        "games_finished": stats.games,
+        "messages_sent_per_sec": round(stats.sent / elapsed, 1),
+        "events_received_per_sec": round(stats.received / elapsed, 1),
+        "frames_received_per_sec": round(stats.frames / elapsed, 1),
+        "bytes_received_per_sec": round(stats.bytes / elapsed, 1),
+        "bytes_per_frame": round(stats.bytes / max(1, stats.frames), 1),
+        "wire_bytes_per_sec": round(wire / elapsed, 1),
+        "wire_bytes_per_frame": round(wire / max(1, stats.frames), 1),
+        "server_cpu_us_per_frame": round(cpu * 1e6 / max(1, stats.frames), 1),
+        "delivery_p50_ms": round(percentile(stats.latencies, 0.5) * 1000, 3),
+        "delivery_p99_ms": round(percentile(stats.latencies, 0.99) * 1000, 3),
+        "phase_lag_p50_ms": round(percentile(stats.phase_lags, 0.5) * 1000, 3),
+        "phase_lag_p99_ms": round(percentile(stats.phase_lags, 0.99) * 1000, 3),
+        "server_peak_rss_mb": round(peak_rss / 2**20, 1),
+        "errors": stats.errors,
+        "disconnects": stats.disconnects,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mafia server load benchmark")
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--players", type=int, default=8, help="players per room")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds to open rooms")
+    parser.add_argument("--chat-per-phase", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--protocol", choices=["json", "msgpack"], default="json")
+    parser.add_argument(
+        "--compression", choices=["off", "deflate", "shared"], default="deflate"
+    )
+    parser.add_argument("--compression-threshold", type=int, default=64)
+    parser.add_argument(
+        "--snapshot-path", default="", help="snapshot rooms to this sqlite file"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="1 sends every event on its own"
+    )
+    parser.add_argument("--json", action="store_true", help="print one JSON line")
+    args = parser.parse_args()
+
+    # every simulated player is a socket in this process
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    port = free_port()
+    context = multiprocessing.get_context("spawn")
+    config = ServerConfig()
+    config.host = "127.0.0.1"
+    config.port = port
+    config.workers = args.workers
+    config.log_level = "WARNING"
+    config.compression = args.compression
+    config.compression_threshold = args.compression_threshold
+    config.snapshot_path = args.snapshot_path
+    config.batch_size = args.batch_size
+    server = context.Process(target=run_server, args=(config,), daemon=False)
+    server.start()
+    try:
+        report = asyncio.run(drive(args, f"ws://127.0.0.1:{port}", server.pid))
+    finally:
+        # with several workers the server process is only the supervisor, and
+        # its workers would otherwise keep the port open after it is gone.
+        # SIGINT rather than SIGTERM, which would wait for games to finish
+        for pid in reversed(tree_pids(server.pid)):
+            try:
+                os.kill(pid, signal.SIGINT)
+            except OSError:
+                pass
+        server.join()
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>26}: {value}")
+
+
+if __name__ == "__main__":
+    main()
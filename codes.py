@@ -0,0 +1,98 @@
+import secrets
+import string
+import time
+from collections import deque
+from math import gcd
+from typing import Callable, Deque, Set, Tuple
+
+ALPHABET: str = string.ascii_uppercase + string.digits
+BASE: int = len(ALPHABET)
+
+
+def encode_code(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def decode_code(room_code: str) -> int:
+    value = 0
+    for char in room_code.upper():
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f"invalid room code {room_code!r}")
+        value = value * BASE + digit
+    return value
+
+
+class RoomCodeAllocator:
+    # walks a random permutation of the keyspace, so every fresh code is unique
+    # without a retry loop; a shard only gets the values congruent to its index.
+    # released codes are reused after a cooldown, and the code length grows
+    # once the current keyspace is exhausted or too full
+    def __init__(
+        self,
+        shard: int = 0,
+        num_shards: int = 1,
+        min_length: int = 4,
+        max_occupancy: float = 0.5,
+        cooldown: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.shard: int = shard
+        self.num_shards: int = num_shards
+        self.max_occupancy: float = max_occupancy
+        self.cooldown: float = cooldown
+        self.clock: Callable[[], float] = clock
+        self.live: Set[str] = set()
+        self.cooling: Deque[Tuple[float, str]] = deque()
+        self.start_keyspace(min_length)
+
+    def start_keyspace(self, length: int) -> None:
+        self.length: int = length
+        self.size: int = BASE**length // self.num_shards
+        self.issued: int = 0
+        if self.size <= 1:
+            # a shard of one code has nothing to permute
+            self.multiplier: int = 1
+            self.offset: int = 0
+            return
+        self.multiplier = 1 + secrets.randbelow(self.size - 1)
+        while gcd(self.multiplier, self.size) != 1:
+            self.multiplier = 1 + secrets.randbelow(self.size - 1)
+        self.offset = secrets.randbelow(self.size)
+
+    def allocate(self) -> str:
+        if self.cooling and self.cooling[0][0] <= self.clock():
+            _, room_code = self.cooling.popleft()
+            if room_code not in self.live:
+                self.live.add(room_code)
+                return room_code
+
+        while True:
+            # a while, as a length can have fewer codes than there are shards
+            while (
+                self.issued >= self.size
+                or len(self.live) >= self.max_occupancy * self.size
+            ):
+                self.start_keyspace(self.length + 1)
+
+            value: int = (self.multiplier * self.issued + self.offset) % self.size
+            self.issued += 1
+            room_code = encode_code(
+                value * self.num_shards + self.shard, self.length
+            )
+            # only codes restored with reserve() can already be live
+            if room_code not in self.live:
+                self.live.add(room_code)
+                return room_code
+
+    def reserve(self, room_code: str) -> None:
+        self.live.add(room_code)
+
+    def release(self, room_code: str) -> None:
+        if room_code in self.live:
+            self.live.remove(room_code)
+            self.cooling.append((self.clock() + self.cooldown, room_code))
@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from websockets.extensions.base import ServerExtensionFactory
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import CTRL_OPCODES, Frame, Opcode
+from websockets.typing import ExtensionParameter
+
+from metrics import COMPRESSION_BYTES, COMPRESSION_CACHE_HITS, COMPRESSION_SKIPPED
+
+
+class CompressionPolicy:
+    # how outbound frames are compressed. frames smaller than threshold go out
+    # as they are, since deflate costs more CPU than it saves on them. shared
+    # compresses each broadcast payload once for every recipient, which needs a
+    # fresh compressor per message (no context takeover) so the output does not
+    # depend on what the connection sent before
+    __slots__ = (
+        "enabled",
+        "threshold",
+        "level",
+        "mem_level",
+        "window_bits",
+        "context_takeover",
+        "shared",
+        "cache_size",
+    )
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        threshold: int = 64,
+        level: int = 6,
+        mem_level: int = 5,
+        window_bits: int = 12,
+        context_takeover: bool = True,
+        shared: bool = False,
+        cache_size: int = 256,
+    ) -> None:
+        self.enabled: bool = enabled
+        self.threshold: int = threshold
+        self.level: int = level
+        self.mem_level: int = mem_level
+        self.window_bits: int = window_bits
+        self.context_takeover: bool = context_takeover and not shared
+        self.shared: bool = shared
+        self.cache_size: int = cache_size
+
+    def extensions(self) -> Optional[List[ServerExtensionFactory]]:
+        if not self.enabled:
+            return None
+        return [ThresholdDeflateFactory(self)]
+
+
+class ThresholdDeflate(PerMessageDeflate):
+    def __init__(
+        self,
+        extension: PerMessageDeflate,
+        policy: CompressionPolicy,
+        cache: Dict[bytes, bytes],
+    ) -> None:
+        super().__init__(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+        )
+        self.threshold: int = policy.threshold
+        self.cache_size: int = policy.cache_size
+        # only safe to share when every message starts from a fresh compressor
+        self.cache: Optional[Dict[bytes, bytes]] = (
+            cache if policy.shared and self.local_no_context_takeover else None
+        )
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        size: int = len(frame.data)
+        if frame.fin and frame.opcode is not Opcode.CONT and size < self.threshold:
+            # an uncompressed message is allowed at any point; rsv1 stays clear
+            COMPRESSION_SKIPPED.inc()
+            return frame
+
+        cacheable: bool = (
+            self.cache is not None
+            and frame.fin
+            and frame.opcode is not Opcode.CONT
+            and type(frame.data) is bytes
+        )
+        if cacheable:
+            # bytes cache their hash, so repeat lookups of one shared frame are cheap
+            data: Optional[bytes] = self.cache.get(frame.data)
+            if data is not None:
+                COMPRESSION_CACHE_HITS.inc()
+                COMPRESSION_BYTES.inc(size, "raw")
+                COMPRESSION_BYTES.inc(len(data), "wire")
+                return Frame(frame.opcode, data, True, True, frame.rsv2, frame.rsv3)
+
+        encoded: Frame = super().encode(frame)
+        COMPRESSION_BYTES.inc(size, "raw")
+        COMPRESSION_BYTES.inc(len(encoded.data), "wire")
+        if cacheable:
+            if len(self.cache) >= self.cache_size:
+                del self.cache[next(iter(self.cache))]
+            self.cache[frame.data] = bytes(encoded.data)
+        return encoded
+
+
+class ThresholdDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, policy: CompressionPolicy) -> None:
+        super().__init__(
+            server_no_context_takeover=not policy.context_takeover,
+            server_max_window_bits=policy.window_bits,
+            compress_settings={"level": policy.level, "memLevel": policy.mem_level},
+        )
+        self.policy: CompressionPolicy = policy
+        # compressed broadcast payloads, shared by every connection of this server
+        # that negotiated the same window size
+        self.caches: Dict[int, Dict[bytes, bytes]] = {}
+
+    def process_request_params(
+        self,
+        params: Sequence[ExtensionParameter],
+        accepted_extensions: Sequence[Any],
+    ) -> Tuple[List[ExtensionParameter], PerMessageDeflate]:
+        response, extension = super().process_request_params(
+            params, accepted_extensions
+        )
+        cache: Dict[bytes, bytes] = self.caches.setdefault(
+            extension.local_max_window_bits, {}
+        )
+        return response, ThresholdDeflate(extension, self.policy, cache)
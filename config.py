@@ -0,0 +1,353 @@
+import os
+import tomllib
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from compression import CompressionPolicy
+from enums import OverflowPolicy
+from ratelimit import (
+    INBOUND_QUEUE,
+    LOBBY_LIMITS,
+    MAX_CHAT_LENGTH,
+    MAX_FRAME_SIZE,
+    PLAYER_LIMITS,
+    ROOM_LIMITS,
+)
+
+# settings a host may override per room when creating it, and the range each
+# value is clamped to
+ROOM_BOUNDS: Dict[str, Tuple[int, int]] = {
+    "night_duration": (10, 600),
+    "day_duration": (10, 900),
+    "minimum_players": (3, 30),
+    "maximum_players": (3, 30),
+    "players_per_mafia": (2, 10),
+    "doctor_from": (3, 31),
+    "detective_from": (3, 31),
+}
+
+# ServerConfig fields that are only set through their own config file tables
+TABLES: Tuple[str, ...] = ("room", "player_limits", "room_limits", "lobby_limits")
+
+
+class RoomConfig:
+    # game rules and buffer sizes for one room. durations are seconds; a role
+    # is dealt once the room has at least the given number of players
+    __slots__ = (
+        "night_duration",
+        "day_duration",
+        "minimum_players",
+        "maximum_players",
+        "players_per_mafia",
+        "doctor_from",
+        "detective_from",
+        "history_size",
+        "chat_size",
+        "event_size",
+    )
+
+    def __init__(
+        self,
+        night_duration: int = 60,
+        day_duration: int = 60,
+        minimum_players: int = 6,
+        maximum_players: int = 20,
+        players_per_mafia: int = 3,
+        doctor_from: int = 5,
+        detective_from: int = 6,
+        history_size: int = 256,
+        chat_size: int = 200,
+        event_size: int = 100,
+    ) -> None:
+        self.night_duration: int = night_duration
+        self.day_duration: int = day_duration
+        self.minimum_players: int = minimum_players
+        self.maximum_players: int = maximum_players
+        self.players_per_mafia: int = players_per_mafia
+        self.doctor_from: int = doctor_from
+        self.detective_from: int = detective_from
+        self.history_size: int = history_size
+        self.chat_size: int = chat_size
+        self.event_size: int = event_size
+
+    def key(self) -> Tuple[int, ...]:
+        # the settings a host can choose, for matching rooms with equal ones
+        return tuple(getattr(self, name) for name in ROOM_BOUNDS)
+
+    def copy(self) -> "RoomConfig":
+        return RoomConfig(**{name: getattr(self, name) for name in self.__slots__})
+
+    def override(self, settings: Mapping[str, Any]) -> "RoomConfig":
+        # a copy with a host's settings applied, each clamped to ROOM_BOUNDS and
+        # never above the server's own maximum room size
+        config: RoomConfig = self.copy()
+        for name, value in settings.items():
+            bounds: Optional[Tuple[int, int]] = ROOM_BOUNDS.get(name)
+            if bounds is None:
+                raise ValueError(f"Unknown setting: {name}.")
+            if type(value) is not int:
+                raise ValueError(f"Invalid setting: {name}.")
+            setattr(config, name, min(max(value, bounds[0]), bounds[1]))
+        config.maximum_players = min(config.maximum_players, self.maximum_players)
+        config.minimum_players = min(config.minimum_players, config.maximum_players)
+        return config
+
+
+class ServerConfig:
+    # everything tunable about one server process. built from defaults, then a
+    # TOML file, then MAFIA_* environment variables, then command line flags
+    __slots__ = (
+        "host",
+        "port",
+        "workers",
+        "metrics_port",
+        "log_level",
+        "trace_sample_rate",
+        "max_rooms",
+        "max_players",
+        "max_connections",
+        "send_queue_size",
+        "send_timeout",
+        "overflow_policy",
+        "batch_size",
+        "batch_window",
+        "resume_grace",
+        "max_frame_size",
+        "inbound_queue",
+        "max_chat_length",
+        "player_limits",
+        "room_limits",
+        "lobby_limits",
+        "compression",
+        "compression_threshold",
+        "compression_level",
+        "snapshot_path",
+        "snapshot_interval",
+        "reuse_port",
+        "drain_timeout",
+        "max_spectators",
+        "spectator_interval",
+        "spectator_queue",
+        "listing_page_size",
+        "listing_cache_ttl",
+        "match_wait",
+        "reap_interval",
+        "idle_room_ttl",
+        "finished_room_ttl",
+        "abandoned_room_ttl",
+        "max_memory_mb",
+        "shed_batch",
+        "room",
+    )
+
+    def __init__(self) -> None:
+        self.host: str = ""
+        self.port: int = 8081
+        self.workers: int = 1
+        self.metrics_port: Optional[int] = None
+        self.log_level: str = "INFO"
+        self.trace_sample_rate: float = 0.0
+        # per worker process; 0 means unlimited
+        self.max_rooms: int = 0
+        self.max_players: int = 0
+        self.max_connections: int = 0
+        self.send_queue_size: int = 256
+        self.send_timeout: float = 5.0
+        self.overflow_policy: OverflowPolicy = OverflowPolicy.DISCONNECT
+        # events sent together as one frame per event loop tick, or per
+        # batch_window seconds; 1 sends every event as its own frame
+        self.batch_size: int = 64
+        self.batch_window: float = 0.0
+        self.resume_grace: float = 60.0
+        self.max_frame_size: int = MAX_FRAME_SIZE
+        self.inbound_queue: int = INBOUND_QUEUE
+        self.max_chat_length: int = MAX_CHAT_LENGTH
+        self.player_limits: Dict[str, Tuple[float, float]] = dict(PLAYER_LIMITS)
+        self.room_limits: Dict[str, Tuple[float, float]] = dict(ROOM_LIMITS)
+        self.lobby_limits: Dict[str, Tuple[float, float]] = dict(LOBBY_LIMITS)
+        # off, deflate or shared
+        self.compression: str = "deflate"
+        self.compression_threshold: int = 64
+        self.compression_level: int = 6
+        # sqlite file for room snapshots and warm restarts; empty turns them off
+        self.snapshot_path: str = ""
+        self.snapshot_interval: float = 1.0
+        # lets a new server bind the port while the old one drains
+        self.reuse_port: bool = False
+        # longest a draining server waits for running games before it stops
+        self.drain_timeout: float = 300.0
+        # per room; spectators get the public state at most once per interval
+        # and lose frames once spectator_queue of them are waiting
+        self.max_spectators: int = 500
+        self.spectator_interval: float = 0.25
+        self.spectator_queue: int = 16
+        # public room listings are paged, and a page is reused for up to
+        # listing_cache_ttl seconds after the rooms on it change
+        self.listing_page_size: int = 20
+        self.listing_cache_ttl: float = 1.0
+        # seconds a quick-match queue with enough players waits for more
+        self.match_wait: float = 5.0
+        # rooms are evicted after this many seconds without player activity;
+        # abandoned ones have no player connected, and idle ones have no game
+        # running. 0 turns a TTL off
+        self.reap_interval: float = 30.0
+        self.idle_room_ttl: float = 1800.0
+        self.finished_room_ttl: float = 600.0
+        self.abandoned_room_ttl: float = 300.0
+        # over this much resident memory the server stops opening rooms and
+        # evicts up to shed_batch of its least recently used lobbies per reap;
+        # 0 for no limit
+        self.max_memory_mb: int = 0
+        self.shed_batch: int = 50
+        self.room: RoomConfig = RoomConfig()
+
+    def compression_policy(self) -> CompressionPolicy:
+        return CompressionPolicy(
+            enabled=self.compression != "off",
+            threshold=self.compression_threshold,
+            level=self.compression_level,
+            shared=self.compression == "shared",
+        )
+
+    def validate(self) -> None:
+        if self.compression not in ("off", "deflate", "shared"):
+            raise ValueError("compression must be off, deflate or shared")
+        if self.workers < 1:
+            raise ValueError("workers must be at least 1")
+        if self.send_queue_size < 1:
+            raise ValueError("send_queue_size must be at least 1")
+        if self.batch_size < 1 or self.batch_window < 0:
+            raise ValueError("batch_size must be at least 1 and batch_window >= 0")
+        if self.snapshot_interval <= 0:
+            raise ValueError("snapshot_interval must be positive")
+        if self.spectator_interval < 0 or self.spectator_queue < 1:
+            raise ValueError(
+                "spectator_interval must be >= 0 and spectator_queue at least 1"
+            )
+        if self.listing_page_size < 1 or self.listing_cache_ttl < 0:
+            raise ValueError(
+                "listing_page_size must be at least 1 and listing_cache_ttl >= 0"
+            )
+        if self.match_wait < 0:
+            raise ValueError("match_wait must be >= 0")
+        if self.reap_interval <= 0:
+            raise ValueError("reap_interval must be positive")
+        if (
+            min(self.idle_room_ttl, self.finished_room_ttl, self.abandoned_room_ttl)
+            < 0
+        ):
+            raise ValueError("room TTLs must be >= 0")
+        room: RoomConfig = self.room
+        if min(room.night_duration, room.day_duration) <= 0:
+            raise ValueError("phase durations must be positive")
+        if not 3 <= room.minimum_players <= room.maximum_players:
+            raise ValueError("room needs 3 <= minimum_players <= maximum_players")
+        if room.players_per_mafia < 2:
+            raise ValueError("players_per_mafia must be at least 2")
+        if min(room.history_size, room.chat_size, room.event_size) < 1:
+            raise ValueError(
+                "history_size, chat_size and event_size must be at least 1"
+            )
+
+    def apply(self, values: Mapping[str, Any], source: str) -> None:
+        # a flat mapping of setting names; nested tables for the room and rate
+        # limits as they appear in the config file
+        for name, value in values.items():
+            if name == "room" and isinstance(value, Mapping):
+                for key, item in value.items():
+                    set_field(self.room, key, item, f"{source}: room.{key}")
+            elif name == "rate_limits" and isinstance(value, Mapping):
+                self.apply_limits(value, source)
+            elif name in self.__slots__ and name not in TABLES:
+                set_field(self, name, value, f"{source}: {name}")
+            else:
+                raise ValueError(f"{source}: unknown setting {name}")
+
+    def apply_limits(self, tables: Mapping[str, Any], source: str) -> None:
+        # [rate_limits.player] chat = [2.0, 5.0] -> (tokens per second, burst)
+        for scope, limits in tables.items():
+            target: Optional[Dict[str, Tuple[float, float]]] = {
+                "player": self.player_limits,
+                "room": self.room_limits,
+                "lobby": self.lobby_limits,
+            }.get(scope)
+            if target is None or not isinstance(limits, Mapping):
+                raise ValueError(f"{source}: unknown rate limit scope {scope}")
+            for message_type, limit in limits.items():
+                try:
+                    rate, burst = limit
+                    target[message_type] = (float(rate), float(burst))
+                except (TypeError, ValueError):
+                    raise ValueError(
+                        f"{source}: rate_limits.{scope}.{message_type} "
+                        "must be [rate, burst]"
+                    )
+
+
+def set_field(target: Any, name: str, value: Any, where: str) -> None:
+    if name not in target.__slots__:
+        raise ValueError(f"{where}: unknown setting")
+    current: Any = getattr(target, name)
+    try:
+        setattr(target, name, coerce(current, value))
+    except ValueError:
+        raise ValueError(f"{where}: invalid value {value!r}")
+
+
+def coerce(current: Any, value: Any) -> Any:
+    # converts file and environment values to the type of the default
+    if isinstance(current, OverflowPolicy):
+        return OverflowPolicy(value)
+    if isinstance(current, bool):
+        if isinstance(value, str):
+            if value.lower() not in ("1", "0", "true", "false", "yes", "no"):
+                raise ValueError(value)
+            return value.lower() in ("1", "true", "yes")
+        return bool(value)
+    if current is None or value is None:
+        # optional ports
+        return None if value in (None, "") else whole(value)
+    if isinstance(current, int):
+        return whole(value)
+    return type(current)(value)
+
+
+def whole(value: Any) -> int:
+    # an int setting takes an int or its digits, never a truncated float
+    if isinstance(value, (bool, float)):
+        raise ValueError(value)
+    return int(value)
+
+
+def environment(env: Mapping[str, str]) -> Dict[str, Any]:
+    # MAFIA_PORT=9000, MAFIA_ROOM_DAY_DURATION=90; values are strings and take
+    # the type of the setting they replace
+    values: Dict[str, Any] = {}
+    room: Dict[str, Any] = {}
+    for key, value in env.items():
+        if not key.startswith("MAFIA_"):
+            continue
+        name: str = key[len("MAFIA_"):].lower()
+        if name.startswith("room_") and name[len("room_"):] in RoomConfig.__slots__:
+            room[name[len("room_"):]] = value
+        elif name in ServerConfig.__slots__:
+            values[name] = value
+    if room:
+        values["room"] = room
+    return values
+
+
+def load_config(
+    path: Optional[str] = None,
+    env: Optional[Mapping[str, str]] = None,
+    flags: Optional[Mapping[str, Any]] = None,
+) -> ServerConfig:
+    # validated once every layer is in, so a later layer can fix an earlier one
+    config: ServerConfig = ServerConfig()
+    if path is not None:
+        with open(path, "rb") as f:
+            config.apply(tomllib.load(f), path)
+    config.apply(environment(os.environ if env is None else env), "environment")
+    if flags:
+        config.apply(flags, "command line")
+    config.validate()
+    return config
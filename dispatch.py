@@ -0,0 +1,112 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+Handler = Callable[..., Awaitable[Optional[bool]]]
+Hook = Callable[[str, float], None]
+# (field, accepted types, required)
+Check = Tuple[str, Tuple[Type[Any], ...], bool]
+
+
+class MessageError(Exception):
+    # rejected inbound message; answered with an error event and the
+    # connection carries on
+    def __init__(self, code: str, message: str) -> None:
+        super().__init__(message)
+        self.code: str = code
+        self.message: str = message
+
+    def event(self) -> Dict[str, Any]:
+        return {"type": "error", "code": self.code, "message": self.message}
+
+
+def compile_schema(
+    required: Dict[str, Any], optional: Dict[str, Any]
+) -> List[Check]:
+    checks: List[Check] = []
+    for fields, is_required in ((required, True), (optional, False)):
+        for name, types in fields.items():
+            checks.append(
+                (name, types if isinstance(types, tuple) else (types,), is_required)
+            )
+    return checks
+
+
+def validate(checks: List[Check], event: Dict[str, Any]) -> None:
+    for name, types, is_required in checks:
+        value = event.get(name)
+        if value is None:
+            if is_required:
+                raise MessageError("invalid_message", f"Missing field: {name}.")
+            continue
+        # bool is an int subclass, but true is never a valid count or seq
+        if not isinstance(value, types) or (
+            isinstance(value, bool) and bool not in types
+        ):
+            raise MessageError("invalid_message", f"Invalid field: {name}.")
+
+
+class Route:
+    __slots__ = ("handler", "checks", "sync")
+
+    def __init__(self, handler: Handler, checks: List[Check], sync: bool) -> None:
+        self.handler: Handler = handler
+        self.checks: List[Check] = checks
+        # whether the sender's state is synced after the handler runs
+        self.sync: bool = sync
+
+
+class Dispatcher:
+    # message type -> handler table. handlers are called with whatever context
+    # the caller passes followed by the validated event
+    def __init__(self) -> None:
+        self.routes: Dict[str, Route] = {}
+        self.hooks: List[Hook] = []
+
+    def route(
+        self,
+        message_type: str,
+        required: Optional[Dict[str, Any]] = None,
+        optional: Optional[Dict[str, Any]] = None,
+        sync: bool = True,
+    ) -> Callable[[Handler], Handler]:
+        checks: List[Check] = compile_schema(required or {}, optional or {})
+
+        def register(handler: Handler) -> Handler:
+            self.routes[message_type] = Route(handler, checks, sync)
+            return handler
+
+        return register
+
+    def add_hook(self, hook: Hook) -> None:
+        # called with the message type and handling time after every message
+        self.hooks.append(hook)
+
+    def label(self, event: Any) -> str:
+        # metric and rate-limit key; anything unroutable shares "unknown"
+        if isinstance(event, dict):
+            message_type: Any = event.get("type")
+            if isinstance(message_type, str) and message_type in self.routes:
+                return message_type
+        return "unknown"
+
+    def lookup(self, event: Any) -> Route:
+        message_type: str = self.label(event)
+        if message_type == "unknown":
+            raise MessageError("unknown_type", "Unknown message type.")
+        route: Route = self.routes[message_type]
+        validate(route.checks, event)
+        return route
+
+    async def dispatch(
+        self, message_type: str, route: Route, *context: Any
+    ) -> Optional[bool]:
+        started: float = time.perf_counter()
+        try:
+            return await route.handler(*context)
+        except ValueError as e:
+            # game rules reject moves with ValueError
+            raise MessageError("rejected", str(e))
+        finally:
+            elapsed: float = time.perf_counter() - started
+            for hook in self.hooks:
+                hook(message_type, elapsed)
@@ -0,0 +1,292 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from enums import GamePhase
+from metrics import ENCODED_BYTES, ENCODED_EVENTS
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, without it every client speaks JSON
+    msgpack = None
+
+Encoder = Callable[[Dict[str, Any]], bytes]
+Decoder = Callable[[Union[str, bytes]], Any]
+Joiner = Callable[[List[bytes]], bytes]
+
+# short field names used by the binary protocol; fields not listed keep their name.
+# web/src/protocol.ts holds the same tables
+WIRE_KEYS: Dict[str, str] = {
+    "type": "t",
+    "message": "m",
+    "room_code": "rc",
+    "chat": "c",
+    "name": "n",
+    "version": "v",
+    "target": "tg",
+    "seq": "s",
+    "resume_token": "rt",
+    "player_id": "pi",
+    "timestamp": "ts",
+    "sender": "sd",
+    "is_host": "ih",
+    "is_alive": "ia",
+    "id": "i",
+    "votes_needed": "vn",
+    "votes": "vs",
+    "voter": "vr",
+    "token": "tk",
+    "roster_version": "rv",
+    "role_description": "rd",
+    "role": "r",
+    "removed": "rm",
+    "players": "p",
+    "player_info": "pf",
+    "phase": "ph",
+    "limit": "l",
+    "last_seq": "ls",
+    "is_server": "is",
+    "has_voted": "hv",
+    "has_more": "hm",
+    "has_acted": "ha",
+    "game_state": "g",
+    "game_result": "gr",
+    "code": "cd",
+    "changed": "ch",
+    "can_chat": "cc",
+    "can_act_at_night": "cn",
+    "before": "b",
+    "base": "bs",
+    "time_remaining": "tr",
+    "minimum_players": "mp",
+    "settings": "st",
+    "spectators": "sp",
+    "rooms": "ro",
+    "page": "pg",
+    "open_seats": "os",
+    "min_seats": "ms",
+    "position": "po",
+    "public": "pu",
+}
+LONG_KEYS: Dict[str, str] = {short: key for key, short in WIRE_KEYS.items()}
+
+# message types and phases go out as their index here; new entries only append
+WIRE_TYPES: List[str] = [
+    "new_room",
+    "join_room",
+    "resume",
+    "vote",
+    "night_action",
+    "chat",
+    "chat_history",
+    "start_game",
+    "replay_game",
+    "resync",
+    "disband_room",
+    "leave_room",
+    "room_created",
+    "room_joined",
+    "resumed",
+    "state_snapshot",
+    "state_patch",
+    "players_patch",
+    "chat_message",
+    "player_joined",
+    "player_left",
+    "vote_cast",
+    "room_disbanded",
+    "error",
+    "spectate",
+    "spectating",
+    "spectator_state",
+    "list_rooms",
+    "room_list",
+    "quick_match",
+    "queued",
+    "leave_queue",
+    "queue_left",
+]
+WIRE_ENUMS: Dict[str, List[str]] = {
+    "type": WIRE_TYPES,
+    "phase": [phase.value for phase in GamePhase],
+}
+ENUM_CODES: Dict[str, Dict[str, int]] = {
+    key: {value: code for code, value in enumerate(values)}
+    for key, values in WIRE_ENUMS.items()
+}
+
+
+def compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        out: Dict[str, Any] = {}
+        for key, item in value.items():
+            codes: Optional[Dict[str, int]] = ENUM_CODES.get(key)
+            if codes is not None and item in codes:
+                item = codes[item]
+            elif isinstance(item, (dict, list)):
+                item = compact(item)
+            out[WIRE_KEYS.get(key, key)] = item
+        return out
+    if isinstance(value, list):
+        return [compact(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+
+def expand(value: Any) -> Any:
+    if isinstance(value, dict):
+        out: Dict[str, Any] = {}
+        for short, item in value.items():
+            key: str = LONG_KEYS.get(short, short)
+            names: Optional[List[str]] = WIRE_ENUMS.get(key)
+            if names is not None and type(item) is int and 0 <= item < len(names):
+                item = names[item]
+            elif isinstance(item, (dict, list)):
+                item = expand(item)
+            out[key] = item
+        return out
+    if isinstance(value, list):
+        return [expand(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+
+def json_encoder(event: Dict[str, Any]) -> bytes:
+    return json.dumps(event, separators=(",", ":")).encode()
+
+
+def orjson_encoder(event: Dict[str, Any]) -> bytes:
+    return orjson.dumps(event)
+
+
+def msgpack_encoder(event: Dict[str, Any]) -> bytes:
+    return msgpack.packb(compact(event))
+
+
+def msgpack_decoder(data: Union[str, bytes]) -> Any:
+    if isinstance(data, str):
+        raise ValueError("expected a binary frame")
+    return expand(msgpack.unpackb(data))
+
+
+def json_joiner(frames: List[bytes]) -> bytes:
+    return b"[" + b",".join(frames) + b"]"
+
+
+def msgpack_joiner(frames: List[bytes]) -> bytes:
+    # an array header ahead of the already packed events
+    count: int = len(frames)
+    if count < 16:
+        header: bytes = bytes((0x90 | count,))
+    elif count < 0x10000:
+        header = b"\xdc" + count.to_bytes(2, "big")
+    else:
+        header = b"\xdd" + count.to_bytes(4, "big")
+    return header + b"".join(frames)
+
+
+class Codec:
+    # one wire format; text codecs go out as text frames, the rest as binary
+    __slots__ = ("name", "subprotocol", "text", "encoder", "decoder", "joiner")
+
+    def __init__(
+        self,
+        name: str,
+        subprotocol: str,
+        text: bool,
+        encoder: Encoder,
+        decoder: Decoder,
+        joiner: Joiner,
+    ) -> None:
+        self.name: str = name
+        self.subprotocol: str = subprotocol
+        self.text: bool = text
+        self.encoder: Encoder = encoder
+        self.decoder: Decoder = decoder
+        self.joiner: Joiner = joiner
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        frame: bytes = self.encoder(event)
+        ENCODED_EVENTS.inc(1, self.name)
+        ENCODED_BYTES.inc(len(frame), self.name)
+        return frame
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return self.decoder(data)
+
+    def join(self, frames: List[bytes]) -> bytes:
+        # encoded events as one frame holding an array of them, without
+        # encoding any of them again
+        return self.joiner(frames)
+
+    def from_json(self, frame: bytes) -> bytes:
+        # re-encodes a stored JSON frame, for the rare paths that replay them
+        if self is JSON:
+            return frame
+        return self.encode(json.loads(frame))
+
+
+JSON: Codec = Codec(
+    "json",
+    "mafia.json",
+    True,
+    orjson_encoder if orjson is not None else json_encoder,
+    json.loads,
+    json_joiner,
+)
+MSGPACK: Optional[Codec] = (
+    Codec(
+        "msgpack",
+        "mafia.msgpack",
+        False,
+        msgpack_encoder,
+        msgpack_decoder,
+        msgpack_joiner,
+    )
+    if msgpack is not None
+    else None
+)
+CODECS: Dict[str, Codec] = {
+    codec.subprotocol: codec for codec in (MSGPACK, JSON) if codec is not None
+}
+
+
+def select_subprotocol(connection: Any, offered: Sequence[str]) -> Optional[str]:
+    # the first codec this server supports, in preference order; clients that
+    # offer none of them (or no subprotocol at all) get JSON
+    for subprotocol in CODECS:
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+def codec_for(subprotocol: Optional[str]) -> Codec:
+    return CODECS.get(subprotocol or "", JSON)
+
+
+def use_encoder(encoder: Encoder) -> None:
+    JSON.encoder = encoder
+
+
+def encode(event: Dict[str, Any]) -> bytes:
+    # frames are utf-8 bytes sent as text frames, so one encoded event can be
+    # handed to every recipient without websockets re-encoding it per send
+    return JSON.encode(event)
+
+
+class Encoded:
+    # an event shared between recipients, encoded at most once per codec
+    __slots__ = ("event", "frames")
+
+    def __init__(self, event: Dict[str, Any]) -> None:
+        self.event: Dict[str, Any] = event
+        self.frames: Dict[str, bytes] = {}
+
+    def frame(self, codec: Codec) -> bytes:
+        frame: Optional[bytes] = self.frames.get(codec.name)
+        if frame is None:
+            frame = codec.encode(self.event)
+            self.frames[codec.name] = frame
+        return frame
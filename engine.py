@@ -0,0 +1,403 @@
+import random
+import time
+from heapq import heappop, heappush
+from typing import Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+from config import RoomConfig
+from enums import GamePhase
+from roles import DETECTIVE, DOCTOR, MAFIA, VILLAGER, Mafia, NightRole, Role
+
+# bits in a game's per-seat flag array
+ALIVE: int = 1
+VOTED: int = 2
+ACTED: int = 4
+
+# bytes.translate tables that clear one flag for every seat at once
+CLEAR_VOTED: bytes = bytes(flags & ~VOTED for flags in range(256))
+CLEAR_ACTED: bytes = bytes(flags & ~ACTED for flags in range(256))
+RESET_FLAGS: bytes = bytes(ALIVE for _ in range(256))
+
+TOWN_WINS: str = "Town wins! All mafia have been eliminated."
+MAFIA_WINS: str = "Mafia wins! They equal or outnumber the town."
+
+# games share one generator unless given their own, such as a seeded one
+SHARED_RANDOM: random.Random = random.Random()
+
+
+class Seat:
+    # a player as far as the rules are concerned
+    __slots__ = ("id", "name", "role", "seat", "flags")
+
+    def __init__(self, id: str, name: str) -> None:
+        self.id: str = id
+        self.name: str = name
+        self.role: Optional[Role] = None
+        # until GameEngine.add_player seats the player, the flags live in a
+        # private array
+        self.seat: int = 0
+        self.flags: bytearray = bytearray((ALIVE,))
+
+    @property
+    def is_alive(self) -> bool:
+        return bool(self.flags[self.seat] & ALIVE)
+
+    @is_alive.setter
+    def is_alive(self, value: bool) -> None:
+        self.set_flag(ALIVE, value)
+
+    @property
+    def has_voted(self) -> bool:
+        return bool(self.flags[self.seat] & VOTED)
+
+    @has_voted.setter
+    def has_voted(self, value: bool) -> None:
+        self.set_flag(VOTED, value)
+
+    @property
+    def has_acted(self) -> bool:
+        return bool(self.flags[self.seat] & ACTED)
+
+    @has_acted.setter
+    def has_acted(self, value: bool) -> None:
+        self.set_flag(ACTED, value)
+
+    def set_flag(self, flag: int, value: bool) -> None:
+        if value:
+            self.flags[self.seat] |= flag
+        else:
+            self.flags[self.seat] &= ~flag
+
+    def seat_at(self, flags: bytearray, seat: int) -> None:
+        flags[seat] = self.flags[self.seat]
+        self.flags = flags
+        self.seat = seat
+
+    def set_role(self, role: Role) -> None:
+        self.role = role
+
+    def is_night_role(self) -> bool:
+        return isinstance(self.role, NightRole)
+
+
+class VirtualClock:
+    # stands in for time.time in simulations; it only moves when told to
+    __slots__ = ("now",)
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now: float = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, when: float) -> None:
+        self.now = max(self.now, when)
+
+
+S = TypeVar("S", bound=Seat)
+
+
+class GameEngine(Generic[S]):
+    # the rules of one game with no I/O: seats, roles, votes, night actions and
+    # the win condition, with deadlines taken from an injectable clock. Room
+    # drives it over websockets in real time; simulate.py plays it headless on
+    # a virtual clock
+    __slots__ = (
+        "config",
+        "clock",
+        "rng",
+        "players",
+        "phase",
+        "phase_timer",
+        "votes",
+        "night_actions",
+        "game_result",
+        "killed_players",
+        "protected_players",
+        "alive_mafia",
+        "alive_town",
+        "pending_voters",
+        "pending_actors",
+        "vote_counts",
+        "vote_leader",
+        "leader_votes",
+        "runner_up_votes",
+        "flags",
+        "free_seats",
+    )
+
+    def __init__(
+        self,
+        config: Optional[RoomConfig] = None,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.config: RoomConfig = config or RoomConfig()
+        self.clock: Callable[[], float] = clock
+        self.rng: random.Random = rng or SHARED_RANDOM
+        self.players: Dict[str, S] = {}
+        self.phase: GamePhase = GamePhase.WAITING
+        self.phase_timer: float = 0
+        self.votes: Dict[str, str] = {}
+        self.night_actions: Dict[str, str] = {}
+        self.game_result: Optional[str] = None
+        # ordered sets keyed by player id
+        self.killed_players: Dict[str, S] = {}
+        self.protected_players: Dict[str, S] = {}
+        # maintained incrementally so per-message checks never rescan players
+        self.alive_mafia: int = 0
+        self.alive_town: int = 0
+        self.pending_voters: Set[str] = set()
+        self.pending_actors: Set[str] = set()
+        self.vote_counts: Dict[str, int] = {}
+        self.vote_leader: Optional[str] = None
+        self.leader_votes: int = 0
+        self.runner_up_votes: int = 0
+        # ALIVE/VOTED/ACTED bits per seat; freed seats are reused lowest first
+        self.flags: bytearray = bytearray()
+        self.free_seats: List[int] = []
+
+    def add_player(self, player: S) -> None:
+        if self.free_seats:
+            seat: int = heappop(self.free_seats)
+        else:
+            seat = len(self.flags)
+            self.flags.append(0)
+        player.seat_at(self.flags, seat)
+        self.players[player.id] = player
+
+    def remove_player(self, player_id: str) -> Optional[S]:
+        player: Optional[S] = self.players.pop(player_id, None)
+        if player is not None:
+            if player.is_alive:
+                self.count_alive(player, -1)
+            heappush(self.free_seats, player.seat)
+            self.pending_voters.discard(player_id)
+            self.pending_actors.discard(player_id)
+        return player
+
+    def kill_player(self, player: S) -> None:
+        self.killed_players[player.id] = player
+
+    def protect_player(self, player: S) -> None:
+        self.protected_players[player.id] = player
+
+    def count_alive(self, player: S, delta: int) -> None:
+        if player.role is None:
+            return
+        if isinstance(player.role, Mafia):
+            self.alive_mafia += delta
+        else:
+            self.alive_town += delta
+
+    def mark_dead(self, player: S) -> None:
+        if not player.is_alive:
+            return
+        player.is_alive = False
+        self.count_alive(player, -1)
+        self.pending_voters.discard(player.id)
+
+    def reset_votes(self) -> None:
+        self.flags[:] = self.flags.translate(CLEAR_VOTED)
+        self.votes.clear()
+        self.vote_counts.clear()
+        self.vote_leader = None
+        self.leader_votes = 0
+        self.runner_up_votes = 0
+
+    def tally_vote(self, target_id: str) -> int:
+        # counts only ever grow, so tracking the leader and the best other count
+        # is enough to tell whether exactly one target reached the threshold
+        count: int = self.vote_counts.get(target_id, 0) + 1
+        self.vote_counts[target_id] = count
+        if target_id == self.vote_leader:
+            self.leader_votes = count
+        elif count > self.leader_votes:
+            self.runner_up_votes = self.leader_votes
+            self.vote_leader = target_id
+            self.leader_votes = count
+        else:
+            self.runner_up_votes = max(self.runner_up_votes, count)
+        return count
+
+    def required_votes(self) -> int:
+        return (self.alive_mafia + self.alive_town + 1) // 2
+
+    def assign_roles(self) -> bool:
+        alive_players: List[S] = list(self.players.values())
+        num_players: int = len(alive_players)
+
+        if num_players < self.config.minimum_players:
+            return False
+
+        num_mafia: int = max(1, num_players // self.config.players_per_mafia)
+        roles: List[Role] = []
+
+        for _ in range(num_mafia):
+            roles.append(MAFIA)
+
+        if num_players >= self.config.doctor_from:
+            roles.append(DOCTOR)
+        if num_players >= self.config.detective_from:
+            roles.append(DETECTIVE)
+
+        while len(roles) < num_players:
+            roles.append(VILLAGER)
+
+        self.rng.shuffle(roles)
+        for i, player in enumerate(alive_players):
+            player.set_role(roles[i])
+
+        self.alive_mafia = num_mafia
+        self.alive_town = num_players - num_mafia
+        return True
+
+    def begin(self) -> bool:
+        # deals the roles and opens the first night
+        if not self.assign_roles():
+            return False
+        self.phase = GamePhase.NIGHT
+        return True
+
+    def reset_game(self) -> None:
+        # back to the lobby with everyone alive and no roles
+        self.phase = GamePhase.WAITING
+        self.game_result = None
+        self.phase_timer = 0
+        self.reset_votes()
+        self.night_actions = {}
+        self.killed_players = {}
+        self.protected_players = {}
+        self.pending_voters.clear()
+        self.pending_actors.clear()
+        self.alive_mafia = 0
+        self.alive_town = 0
+
+        self.flags[:] = self.flags.translate(RESET_FLAGS)
+        for player in self.players.values():
+            player.role = None
+
+    def begin_night(self) -> None:
+        self.phase_timer = self.clock() + self.config.night_duration
+        self.night_actions.clear()
+        self.flags[:] = self.flags.translate(CLEAR_ACTED)
+        self.killed_players.clear()
+        self.protected_players.clear()
+        self.pending_actors = {
+            p.id for p in self.players.values() if isinstance(p.role, NightRole)
+        }
+
+    def begin_day(self) -> None:
+        self.phase_timer = self.clock() + self.config.day_duration
+        self.reset_votes()
+        self.pending_voters = {p.id for p in self.players.values() if p.is_alive}
+
+    def phase_done(self) -> bool:
+        # whether the phase can end before its deadline
+        return (
+            (self.phase == GamePhase.NIGHT and not self.pending_actors)
+            or (self.phase == GamePhase.DAY and not self.pending_voters)
+            or self.phase == GamePhase.FINISHED
+        )
+
+    def cast_vote(self, player_id: str, target_id: str) -> Tuple[S, S, int]:
+        # the voter, their target and the target's votes so far
+        if self.phase != GamePhase.DAY:
+            raise ValueError("Can only vote during day phase")
+
+        player = self.players.get(player_id)
+        target = self.players.get(target_id)
+
+        if not player or not player.is_alive:
+            raise ValueError("you're dead")
+
+        if not target or not target.is_alive:
+            raise ValueError("invalid target")
+
+        if player.has_voted:
+            raise ValueError("cannot change vote")
+
+        self.votes[player_id] = target_id
+        player.has_voted = True
+        self.pending_voters.discard(player_id)
+        return player, target, self.tally_vote(target_id)
+
+    def submit_action(self, player_id: str, target_id: str) -> Tuple[S, S]:
+        if self.phase != GamePhase.NIGHT:
+            raise ValueError("can only perform actions during night phase")
+
+        player = self.players.get(player_id)
+        target = self.players.get(target_id)
+
+        if not player or not player.is_night_role():
+            raise ValueError("you aren't supposed to do that")
+
+        if not target or not target.is_alive:
+            raise ValueError("invalid target")
+
+        if player.has_acted:
+            raise ValueError("cannot change action")
+
+        self.night_actions[player_id] = target_id
+        player.has_acted = True
+        self.pending_actors.discard(player_id)
+        return player, target
+
+    def end_night(self) -> List[str]:
+        # resolves the night and moves on to the day, returning what happened
+        events: List[str] = []
+        for actor_id, target_id in self.night_actions.items():
+            actor = self.players.get(actor_id)
+            target = self.players.get(target_id)
+
+            if actor and target and isinstance(actor.role, NightRole):
+                actor.role.perform_night_action(self, actor_id, target_id)
+
+        if len(self.killed_players) < 1:
+            events.append("No one was killed during the night.")
+
+        for killed_player in self.killed_players.values():
+            if killed_player.id not in self.protected_players:
+                self.mark_dead(killed_player)
+                events.append(f"{killed_player.name} was killed during the night.")
+            else:
+                events.append("Someone was attacked but saved by the doctor!")
+
+        if self.phase != GamePhase.FINISHED:
+            self.phase = GamePhase.DAY
+        return events
+
+    def end_day(self) -> List[str]:
+        # counts the votes and moves on to the night, returning what happened
+        events: List[str] = []
+        required_votes: int = self.required_votes()
+
+        if not self.votes:
+            events.append("No votes were cast.")
+        elif (
+            self.vote_leader is not None
+            and self.leader_votes >= required_votes
+            and self.runner_up_votes < required_votes
+        ):
+            eliminated_player = self.players.get(self.vote_leader)
+            if eliminated_player and eliminated_player.role:
+                self.mark_dead(eliminated_player)
+                events.append(
+                    f"{eliminated_player.name} ({eliminated_player.role.name}) was voted out and eliminated."
+                )
+        else:
+            events.append("Failed to reach consensus. No one was eliminated.")
+
+        if self.phase != GamePhase.FINISHED:
+            self.phase = GamePhase.NIGHT
+        return events
+
+    def check_winner(self) -> Optional[str]:
+        # ends the game once a side has won, returning the result
+        if self.alive_mafia == 0:
+            self.game_result = TOWN_WINS
+        elif self.alive_mafia >= self.alive_town:
+            self.game_result = MAFIA_WINS
+        else:
+            return None
+        self.phase = GamePhase.FINISHED
+        return self.game_result
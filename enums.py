@@ -6,3 +6,8 @@ class GamePhase(Enum):
     NIGHT = "night"
     DAY = "day"
     FINISHED = "finished"
+
+
+class OverflowPolicy(Enum):
+    DROP = "drop"  # discard the newest frame, keep the connection
+    DISCONNECT = "disconnect"  # close the connection of a consumer that fell behind
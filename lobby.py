@@ -0,0 +1,335 @@
+import time
+from asyncio import Future, Task, TimerHandle, create_task, get_running_loop
+from collections import deque
+from itertools import chain, islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from websockets import ServerConnection
+from websockets.protocol import State
+
+from config import ROOM_BOUNDS, RoomConfig
+from encoding import Encoded
+from metrics import MATCHES, ROOM_LISTINGS
+
+if TYPE_CHECKING:
+    from player import Player
+    from room import Room
+
+# cached listing pages kept before the cache starts over
+CACHE_SIZE: int = 1024
+
+# a query as (phase, min_seats, settings, page)
+Query = Tuple[Optional[str], int, Tuple[Tuple[str, int], ...], int]
+
+
+class Listing:
+    # what the directory knows about one public room
+    __slots__ = ("room_code", "phase", "players", "maximum_players", "settings")
+
+    def __init__(self, room: "Room") -> None:
+        self.room_code: str = room.room_code
+        self.phase: str = room.phase.value
+        self.players: int = len(room.players)
+        self.maximum_players: int = room.config.maximum_players
+        self.settings: Dict[str, int] = {
+            name: getattr(room.config, name) for name in ROOM_BOUNDS
+        }
+
+    @property
+    def open_seats(self) -> int:
+        # only a room still waiting for its game takes new players
+        if self.phase != "waiting":
+            return 0
+        return max(0, self.maximum_players - self.players)
+
+    def matches(
+        self, phase: Optional[str], min_seats: int, settings: Mapping[str, int]
+    ) -> bool:
+        return (
+            (phase is None or self.phase == phase)
+            and self.open_seats >= min_seats
+            and all(self.settings.get(name) == value for name, value in settings.items())
+        )
+
+    def fields(self) -> Dict[str, Any]:
+        return {
+            "room_code": self.room_code,
+            "phase": self.phase,
+            "players": self.players,
+            "open_seats": self.open_seats,
+            "settings": self.settings,
+        }
+
+
+class RoomIndex:
+    # the public room directory of one worker. rooms are indexed by phase, by
+    # open seats while they wait and by each setting value, and the indexes
+    # are moved as rooms change rather than rebuilt per query, so a listing
+    # only walks the smallest index its filters allow. buckets are dicts used
+    # as ordered sets of room codes
+    __slots__ = (
+        "listings",
+        "by_phase",
+        "by_seats",
+        "by_setting",
+        "version",
+        "cache",
+        "cache_ttl",
+        "page_size",
+    )
+
+    def __init__(self, page_size: int = 20, cache_ttl: float = 1.0) -> None:
+        self.listings: Dict[str, Listing] = {}
+        self.by_phase: Dict[str, Dict[str, None]] = {}
+        self.by_seats: Dict[int, Dict[str, None]] = {}
+        self.by_setting: Dict[Tuple[str, int], Dict[str, None]] = {}
+        # bumped on every change; a cached page stays valid while it matches,
+        # and for cache_ttl seconds after that
+        self.version: int = 0
+        self.cache: Dict[Query, Tuple[int, float, Encoded]] = {}
+        self.cache_ttl: float = cache_ttl
+        self.page_size: int = page_size
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def add(self, room: "Room") -> None:
+        if room.room_code in self.listings:
+            return
+        listing: Listing = Listing(room)
+        self.listings[listing.room_code] = listing
+        for item in listing.settings.items():
+            self.by_setting.setdefault(item, {})[listing.room_code] = None
+        self.link(listing)
+        self.version += 1
+
+    def remove(self, room_code: str) -> None:
+        listing: Optional[Listing] = self.listings.pop(room_code, None)
+        if listing is None:
+            return
+        self.unlink(listing)
+        for item in listing.settings.items():
+            discard(self.by_setting, item, room_code)
+        self.version += 1
+
+    def update(self, room: "Room") -> None:
+        # after a player joins or leaves, or the phase moves on
+        listing: Optional[Listing] = self.listings.get(room.room_code)
+        if listing is None:
+            return
+        phase: str = room.phase.value
+        players: int = len(room.players)
+        if phase == listing.phase and players == listing.players:
+            return
+        self.unlink(listing)
+        listing.phase = phase
+        listing.players = players
+        self.link(listing)
+        self.version += 1
+
+    def link(self, listing: Listing) -> None:
+        self.by_phase.setdefault(listing.phase, {})[listing.room_code] = None
+        seats: int = listing.open_seats
+        if seats:
+            self.by_seats.setdefault(seats, {})[listing.room_code] = None
+
+    def unlink(self, listing: Listing) -> None:
+        discard(self.by_phase, listing.phase, listing.room_code)
+        seats: int = listing.open_seats
+        if seats:
+            discard(self.by_seats, seats, listing.room_code)
+
+    def candidates(
+        self, phase: Optional[str], min_seats: int, settings: Mapping[str, int]
+    ) -> Iterable[str]:
+        # the smallest index that covers the query; the rest of the filters
+        # are checked per listing
+        options: List[Tuple[int, Iterable[str]]] = [
+            (len(self.listings), self.listings)
+        ]
+        if phase is not None:
+            by_phase: Dict[str, None] = self.by_phase.get(phase, {})
+            options.append((len(by_phase), by_phase))
+        for item in settings.items():
+            by_setting: Dict[str, None] = self.by_setting.get(item, {})
+            options.append((len(by_setting), by_setting))
+        if min_seats > 0:
+            # fullest rooms first, as they are the closest to starting
+            buckets: List[Dict[str, None]] = [
+                self.by_seats[seats]
+                for seats in sorted(self.by_seats)
+                if seats >= min_seats
+            ]
+            options.append((sum(map(len, buckets)), chain.from_iterable(buckets)))
+        return min(options, key=lambda option: option[0])[1]
+
+    def page(
+        self,
+        phase: Optional[str] = None,
+        min_seats: int = 0,
+        settings: Optional[Mapping[str, int]] = None,
+        page: int = 0,
+    ) -> Encoded:
+        # one page of a listing as a room_list event, encoded once per codec
+        # and shared by everyone asking the same question
+        settings = settings or {}
+        query: Query = (phase, min_seats, tuple(sorted(settings.items())), page)
+        now: float = time.monotonic()
+        cached: Optional[Tuple[int, float, Encoded]] = self.cache.get(query)
+        if cached is not None and (
+            cached[0] == self.version or now - cached[1] < self.cache_ttl
+        ):
+            ROOM_LISTINGS.inc(1, "hit")
+            return cached[2]
+        ROOM_LISTINGS.inc(1, "miss")
+
+        matching: Iterable[Listing] = (
+            listing
+            for listing in map(
+                self.listings.__getitem__, self.candidates(phase, min_seats, settings)
+            )
+            if listing.matches(phase, min_seats, settings)
+        )
+        start: int = page * self.page_size
+        found: List[Listing] = list(
+            islice(matching, start, start + self.page_size + 1)
+        )
+        encoded: Encoded = Encoded(
+            {
+                "type": "room_list",
+                "rooms": [listing.fields() for listing in found[: self.page_size]],
+                "page": page,
+                "has_more": len(found) > self.page_size,
+            }
+        )
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache.clear()
+        self.cache[query] = (self.version, now, encoded)
+        return encoded
+
+
+def discard(index: Dict[Any, Dict[str, None]], key: Any, room_code: str) -> None:
+    bucket: Optional[Dict[str, None]] = index.get(key)
+    if bucket is not None:
+        bucket.pop(room_code, None)
+        if not bucket:
+            del index[key]
+
+
+class Ticket:
+    # one connection waiting in a quick-match queue; resolved with its seat,
+    # or with the MessageError that kept the room from forming
+    __slots__ = ("websocket", "name", "matched")
+
+    def __init__(self, websocket: ServerConnection, name: str) -> None:
+        self.websocket: ServerConnection = websocket
+        self.name: str = name
+        self.matched: Future[Tuple["Room", "Player"]] = (
+            get_running_loop().create_future()
+        )
+
+    @property
+    def waiting(self) -> bool:
+        return not self.matched.done() and self.websocket.state is State.OPEN
+
+
+Former = Callable[[RoomConfig, List[Ticket]], Awaitable[None]]
+
+
+class Matchmaker:
+    # quick-match queues, one per distinct set of room settings. once a queue
+    # holds enough players for a game it waits up to wait seconds for more,
+    # then hands the first maximum_players of them to form as one room
+    __slots__ = ("form", "wait", "queues", "configs", "timers", "forming")
+
+    def __init__(self, form: Former, wait: float = 5.0) -> None:
+        self.form: Former = form
+        self.wait: float = wait
+        self.queues: Dict[Tuple[int, ...], Deque[Ticket]] = {}
+        self.configs: Dict[Tuple[int, ...], RoomConfig] = {}
+        self.timers: Dict[Tuple[int, ...], TimerHandle] = {}
+        self.forming: Set[Task[None]] = set()
+
+    def __len__(self) -> int:
+        return sum(map(len, self.queues.values()))
+
+    def enqueue(self, ticket: Ticket, config: RoomConfig) -> int:
+        # returns how many are waiting for the same settings, this one included
+        key: Tuple[int, ...] = config.key()
+        queue: Deque[Ticket] = self.queues.setdefault(key, deque())
+        self.configs.setdefault(key, config)
+        queue.append(ticket)
+        self.check(key)
+        return len(queue)
+
+    def cancel(self, ticket: Ticket, config: RoomConfig) -> bool:
+        # False once the ticket has been taken for a room
+        key: Tuple[int, ...] = config.key()
+        queue: Optional[Deque[Ticket]] = self.queues.get(key)
+        if queue is None or ticket not in queue:
+            return False
+        queue.remove(ticket)
+        if not queue:
+            self.drop(key)
+        return True
+
+    def drop(self, key: Tuple[int, ...]) -> None:
+        self.queues.pop(key, None)
+        self.configs.pop(key, None)
+        timer: Optional[TimerHandle] = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+    def check(self, key: Tuple[int, ...]) -> None:
+        queue: Deque[Ticket] = self.queues[key]
+        config: RoomConfig = self.configs[key]
+        if len(queue) >= config.maximum_players:
+            self.release(key)
+        elif len(queue) >= config.minimum_players and key not in self.timers:
+            self.timers[key] = get_running_loop().call_later(
+                self.wait, self.release, key
+            )
+
+    def release(self, key: Tuple[int, ...]) -> None:
+        timer: Optional[TimerHandle] = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        queue: Optional[Deque[Ticket]] = self.queues.get(key)
+        if queue is None:
+            return
+        config: RoomConfig = self.configs[key]
+
+        tickets: List[Ticket] = []
+        while queue and len(tickets) < config.maximum_players:
+            ticket: Ticket = queue.popleft()
+            if ticket.waiting:
+                tickets.append(ticket)
+            elif not ticket.matched.done():
+                # gone from the queue, so whoever waits on it must hear so
+                ticket.matched.cancel()
+        if len(tickets) < config.minimum_players:
+            # some had gone; wait for more
+            queue.extendleft(reversed(tickets))
+        else:
+            MATCHES.inc()
+            task: Task[None] = create_task(self.form(config, tickets))
+            self.forming.add(task)
+            task.add_done_callback(self.forming.discard)
+
+        if not queue:
+            self.drop(key)
+        elif len(tickets) >= config.minimum_players:
+            self.check(key)
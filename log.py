@@ -0,0 +1,128 @@
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, MutableMapping, Optional, Set, TextIO, Tuple
+
+ROOT: str = "mafia"
+
+_listener: Optional[QueueListener] = None
+
+
+class StructuredFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields: Optional[Dict[str, Any]] = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, default=str)
+
+
+class ContextLogger(logging.LoggerAdapter):
+    # carries per-room/per-player fields; call sites can add more with fields=
+    def process(
+        self, msg: Any, kwargs: MutableMapping[str, Any]
+    ) -> Tuple[Any, MutableMapping[str, Any]]:
+        fields: Dict[str, Any] = dict(self.extra or {})
+        fields.update(kwargs.pop("fields", None) or {})
+        kwargs["extra"] = {"fields": fields}
+        return msg, kwargs
+
+    def bind(self, **fields: Any) -> "ContextLogger":
+        return ContextLogger(self.logger, {**(self.extra or {}), **fields})
+
+
+def get_logger(name: str, **fields: Any) -> ContextLogger:
+    return ContextLogger(logging.getLogger(f"{ROOT}.{name}"), fields)
+
+
+def setup_logging(
+    level: str = "INFO", stream: TextIO = sys.stdout, structured: bool = True
+) -> None:
+    # records are only queued on the event loop; a background thread does the
+    # formatting and the (possibly blocking) write
+    global _listener
+    shutdown_logging()
+
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(
+        StructuredFormatter()
+        if structured
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    )
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    root = logging.getLogger(ROOT)
+    root.setLevel(level.upper())
+    root.handlers = [QueueHandler(records)]
+    root.propagate = False
+
+    _listener = QueueListener(records, handler)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class MessageTracer:
+    # raw inbound message tracing, off by default. rooms can be switched on
+    # individually at runtime; otherwise a sample_rate fraction of messages is
+    # traced, and either way output is capped at max_per_second
+    def __init__(
+        self, sample_rate: float = 0.0, max_per_second: float = 50.0
+    ) -> None:
+        self.log: ContextLogger = get_logger("trace")
+        self.rooms: Set[str] = set()
+        self.sample_rate: float = sample_rate
+        self.max_per_second: float = max_per_second
+        self.tokens: float = max_per_second
+        self.refilled: float = time.monotonic()
+        self.suppressed: int = 0
+        self.active: bool = sample_rate > 0
+
+    def trace_room(self, room_code: str, enabled: bool = True) -> None:
+        if enabled:
+            self.rooms.add(room_code)
+        else:
+            self.rooms.discard(room_code)
+        self.active = bool(self.rooms) or self.sample_rate > 0
+
+    def set_sample_rate(self, sample_rate: float) -> None:
+        self.sample_rate = sample_rate
+        self.active = bool(self.rooms) or sample_rate > 0
+
+    def trace(self, room_code: str, player: str, message: Any) -> None:
+        # callers check self.active first so the disabled path is one attribute read
+        if room_code not in self.rooms and (
+            self.sample_rate <= 0 or random.random() >= self.sample_rate
+        ):
+            return
+
+        now: float = time.monotonic()
+        self.tokens = min(
+            self.max_per_second,
+            self.tokens + (now - self.refilled) * self.max_per_second,
+        )
+        self.refilled = now
+        if self.tokens < 1:
+            self.suppressed += 1
+            return
+        self.tokens -= 1
+
+        fields: Dict[str, Any] = {"room": room_code, "player": player, "raw": message}
+        if self.suppressed:
+            fields["suppressed"] = self.suppressed
+            self.suppressed = 0
+        self.log.info("message", fields=fields)
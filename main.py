@@ -1,10 +1,170 @@
+import argparse
 import asyncio
+from typing import Any, Dict
+from config import ServerConfig, load_config
+from log import setup_logging, shutdown_logging
 from server import MafiaServer
+from shard import run_sharded
 
 
 def main() -> None:
-    server = MafiaServer()
-    asyncio.run(server.start())
+    parser = argparse.ArgumentParser(
+        description="Mafia game server",
+        epilog="settings come from --config, then MAFIA_* environment variables "
+        "(MAFIA_PORT, MAFIA_ROOM_DAY_DURATION, ...), then these flags",
+    )
+    parser.add_argument("--config", help="TOML settings file")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of worker processes, each owning a shard of the rooms",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics on this port (one port per worker)",
+    )
+    parser.add_argument("--log-level")
+    parser.add_argument(
+        "--trace-sample-rate",
+        type=float,
+        help="fraction of inbound messages to log raw (rate limited)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["off", "deflate", "shared"],
+        help="permessage-deflate; shared compresses each broadcast once",
+    )
+    parser.add_argument(
+        "--compression-threshold",
+        type=int,
+        help="frames smaller than this many bytes are sent uncompressed",
+    )
+    parser.add_argument("--compression-level", type=int)
+    parser.add_argument("--max-rooms", type=int, help="per worker, 0 for no cap")
+    parser.add_argument("--max-players", type=int, help="per worker, 0 for no cap")
+    parser.add_argument(
+        "--max-connections", type=int, help="per worker, 0 for no cap"
+    )
+    parser.add_argument("--send-queue-size", type=int)
+    parser.add_argument("--send-timeout", type=float)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="most events sent together in one frame, 1 to send each on its own",
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        help="seconds to gather events for one frame, 0 for one event loop tick",
+    )
+    parser.add_argument("--resume-grace", type=float)
+    parser.add_argument(
+        "--snapshot-path",
+        help="sqlite file to snapshot rooms to and restore them from at startup",
+    )
+    parser.add_argument("--snapshot-interval", type=float, help="seconds")
+    parser.add_argument(
+        "--reuse-port",
+        action="store_true",
+        default=None,
+        help="share the port with a server that is draining, for restarts",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        help="seconds a draining server (SIGTERM) waits for running games",
+    )
+    parser.add_argument(
+        "--max-spectators", type=int, help="per room, 0 to turn spectating off"
+    )
+    parser.add_argument(
+        "--spectator-interval",
+        type=float,
+        help="seconds between frames to a room's spectators",
+    )
+    parser.add_argument(
+        "--spectator-queue",
+        type=int,
+        help="frames queued per spectator before newer ones are dropped",
+    )
+    parser.add_argument("--listing-page-size", type=int, help="rooms per listing page")
+    parser.add_argument(
+        "--listing-cache-ttl",
+        type=float,
+        help="seconds a listing page may lag behind the rooms on it",
+    )
+    parser.add_argument(
+        "--match-wait",
+        type=float,
+        help="seconds a quick match with enough players waits for more",
+    )
+    parser.add_argument(
+        "--reap-interval", type=float, help="seconds between idle room sweeps"
+    )
+    parser.add_argument(
+        "--idle-room-ttl",
+        type=float,
+        help="seconds without player activity before a room is evicted, 0 for never",
+    )
+    parser.add_argument(
+        "--finished-room-ttl",
+        type=float,
+        help="the same for rooms whose game has finished",
+    )
+    parser.add_argument(
+        "--abandoned-room-ttl",
+        type=float,
+        help="the same for rooms with no player connected",
+    )
+    parser.add_argument(
+        "--max-memory-mb",
+        type=int,
+        help="resident memory above which idle lobbies are shed, 0 for no limit",
+    )
+    parser.add_argument(
+        "--shed-batch", type=int, help="most lobbies shed per sweep under pressure"
+    )
+
+    room = parser.add_argument_group("room defaults")
+    room.add_argument("--night-duration", type=int, help="seconds")
+    room.add_argument("--day-duration", type=int, help="seconds")
+    room.add_argument("--minimum-players", type=int)
+    room.add_argument("--maximum-players", type=int)
+    room.add_argument("--players-per-mafia", type=int)
+    args = parser.parse_args()
+
+    values: Dict[str, Any] = {}
+    room_values: Dict[str, Any] = {}
+    for name, value in vars(args).items():
+        if value is None or name == "config":
+            continue
+        if name in ServerConfig.__slots__:
+            values[name] = value
+        else:
+            room_values[name] = value
+    if room_values:
+        values["room"] = room_values
+
+    try:
+        config: ServerConfig = load_config(args.config, flags=values)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    setup_logging(config.log_level)
+    try:
+        if config.workers > 1:
+            run_sharded(config)
+        else:
+            server = MafiaServer(config)
+            server.tracer.set_sample_rate(config.trace_sample_rate)
+            asyncio.run(server.start(metrics_port=config.metrics_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_logging()
 
 
 if __name__ == "__main__":
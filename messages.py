@@ -0,0 +1,223 @@
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+from websockets import ServerConnection
+
+from config import ROOM_BOUNDS, RoomConfig
+from dispatch import Dispatcher, MessageError
+from enums import GamePhase
+from metrics import MESSAGES, MESSAGE_SECONDS
+from player import Player
+from room import Room
+
+if TYPE_CHECKING:
+    from server import MafiaServer
+
+# messages from a seated player: handler(server, room, player, event), returning
+# True when the player has left the room for good
+ROOM_MESSAGES: Dispatcher = Dispatcher()
+
+# messages before a player has a seat: handler(server, websocket, message, event),
+# returning True once the connection has been handed to a room or another shard
+LOBBY_MESSAGES: Dispatcher = Dispatcher()
+
+
+def record_message(message_type: str, seconds: float) -> None:
+    MESSAGES.inc(1, message_type)
+    MESSAGE_SECONDS.observe(seconds, message_type)
+
+
+ROOM_MESSAGES.add_hook(record_message)
+
+
+@ROOM_MESSAGES.route("vote", {"target": str})
+async def vote(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    await room.vote(player.id, event["target"])
+
+
+@ROOM_MESSAGES.route("night_action", {"target": str})
+async def night_action(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    await room.night_action(player.id, event["target"])
+
+
+@ROOM_MESSAGES.route("chat", {"message": str}, sync=False)
+async def chat(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    if len(event["message"]) > server.config.max_chat_length:
+        raise MessageError("too_long", "Message too long.")
+    await room.send_chat(player.id, event["message"])
+
+
+@ROOM_MESSAGES.route("chat_history", optional={"before": int, "limit": int}, sync=False)
+async def chat_history(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    await room.chat_history(player.id, event.get("before"), event.get("limit", 50))
+
+
+@ROOM_MESSAGES.route("start_game")
+async def start_game(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    if server.draining:
+        # the room carries over to the next server, which can start the game
+        raise MessageError("draining", "Server is restarting, try again shortly.")
+    await room.start_game(player.id)
+
+
+@ROOM_MESSAGES.route("replay_game")
+async def replay_game(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    await room.play_again(player.id)
+
+
+@ROOM_MESSAGES.route("resync")
+async def resync(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> None:
+    player.sync.reset()
+
+
+@ROOM_MESSAGES.route("disband_room")
+async def disband_room(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> bool:
+    room_disbanded: bool = await room.disband_room(player.id)
+    if room_disbanded:
+        server.close_room(room.room_code)
+        # the host's own session ends when this returns True
+        await server.dismiss(room, keep=player)
+    return room_disbanded
+
+
+@ROOM_MESSAGES.route("leave_room")
+async def leave_room(
+    server: "MafiaServer", room: Room, player: Player, event: Dict[str, Any]
+) -> bool:
+    return True
+
+
+def room_config(server: "MafiaServer", event: Dict[str, Any]) -> RoomConfig:
+    try:
+        # host overrides for this room only, clamped to the server's bounds
+        return server.config.room.override(event.get("settings", {}))
+    except ValueError as e:
+        raise MessageError("invalid_settings", str(e))
+
+
+@LOBBY_MESSAGES.route(
+    "new_room", {"name": str}, optional={"settings": dict, "public": bool}
+)
+async def new_room(
+    server: "MafiaServer",
+    websocket: ServerConnection,
+    message: Union[str, bytes],
+    event: Dict[str, Any],
+) -> bool:
+    if not event["name"]:
+        raise MessageError("invalid_message", "Name is required.")
+    config: RoomConfig = room_config(server, event)
+    return await server.new_room(
+        websocket, event["name"], config, event.get("public", False)
+    )
+
+
+@LOBBY_MESSAGES.route(
+    "list_rooms",
+    optional={"phase": str, "min_seats": int, "settings": dict, "page": int},
+)
+async def list_rooms(
+    server: "MafiaServer",
+    websocket: ServerConnection,
+    message: Union[str, bytes],
+    event: Dict[str, Any],
+) -> bool:
+    phase: Optional[str] = event.get("phase")
+    if phase is not None and phase not in {p.value for p in GamePhase}:
+        raise MessageError("invalid_message", "Invalid field: phase.")
+    settings: Dict[str, Any] = event.get("settings", {})
+    for name, value in settings.items():
+        if name not in ROOM_BOUNDS or type(value) is not int:
+            raise MessageError("invalid_settings", f"Invalid setting: {name}.")
+    await server.list_rooms(
+        websocket,
+        phase,
+        max(0, event.get("min_seats", 0)),
+        settings,
+        max(0, event.get("page", 0)),
+    )
+    return False
+
+
+@LOBBY_MESSAGES.route("quick_match", {"name": str}, optional={"settings": dict})
+async def quick_match(
+    server: "MafiaServer",
+    websocket: ServerConnection,
+    message: Union[str, bytes],
+    event: Dict[str, Any],
+) -> bool:
+    # queues on whichever worker the client reached; the room it gets is
+    # public, so it also shows up in that worker's listings
+    if not event["name"]:
+        raise MessageError("invalid_message", "Name is required.")
+    config: RoomConfig = room_config(server, event)
+    return await server.quick_match(websocket, event["name"], config)
+
+
+@LOBBY_MESSAGES.route("join_room", {"room_code": str, "name": str})
+async def join_room(
+    server: "MafiaServer",
+    websocket: ServerConnection,
+    message: Union[str, bytes],
+    event: Dict[str, Any],
+) -> bool:
+    room_code: str = event["room_code"]
+    name: str = event["name"]
+    if not name:
+        raise MessageError("invalid_message", "Name is required.")
+
+    owner: Optional[int] = server.owner_of(room_code)
+    if owner is not None:
+        server.log.debug("forwarding join", fields={"room": room_code, "to": owner})
+        await server.forward(websocket, message, owner)
+        return True
+
+    server.log.info("player joining", fields={"room": room_code, "player": name})
+    return await server.join_room(websocket, room_code, name)
+
+
+@LOBBY_MESSAGES.route(
+    "resume", {"token": str, "room_code": str}, optional={"last_seq": int}
+)
+async def resume(
+    server: "MafiaServer",
+    websocket: ServerConnection,
+    message: Union[str, bytes],
+    event: Dict[str, Any],
+) -> bool:
+    owner: Optional[int] = server.owner_of(event["room_code"])
+    if owner is not None:
+        await server.forward(websocket, message, owner)
+        return True
+    return await server.resume(
+        websocket, event["room_code"], event["token"], event.get("last_seq", 0)
+    )
+
+
+@LOBBY_MESSAGES.route("spectate", {"room_code": str})
+async def spectate(
+    server: "MafiaServer",
+    websocket: ServerConnection,
+    message: Union[str, bytes],
+    event: Dict[str, Any],
+) -> bool:
+    owner: Optional[int] = server.owner_of(event["room_code"])
+    if owner is not None:
+        await server.forward(websocket, message, owner)
+        return True
+    return await server.spectate(websocket, event["room_code"])
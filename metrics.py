@@ -0,0 +1,342 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from log import get_logger
+
+log = get_logger("metrics")
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+PHASE_BUCKETS: Tuple[float, ...] = (0.1, 1, 5, 10, 20, 30, 45, 60, 90, 120, 300)
+BATCH_BUCKETS: Tuple[float, ...] = (1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind: str = "untyped"
+
+    def __init__(
+        self, name: str, description: str, labels: Sequence[str] = ()
+    ) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.label_names: Tuple[str, ...] = tuple(labels)
+        REGISTRY.register(self)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(
+        self, name: str, description: str, labels: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        return dict(self.values)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.function: Optional[Callable[[], float]] = function
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        # sampled at scrape time instead of being kept up to date on the hot path
+        self.function = function
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        if self.function is not None:
+            return {(): self.function()}
+        return dict(self.values)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, labels)} {value}"
+            for labels, value in self.snapshot().items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # per label set: [bucket counts..., +Inf count], sum
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def time(self, *labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for labels, counts in self.counts.items():
+            names = self.label_names + ("le",)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{self.name}_bucket{format_labels(names, labels + (le,))} {cumulative}"
+                )
+            suffix = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{suffix} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        return {
+            labels: {"count": sum(counts), "sum": self.sums[labels]}
+            for labels, counts in self.counts.items()
+        }
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]) -> None:
+        self.histogram: Histogram = histogram
+        self.labels: Tuple[str, ...] = labels
+        self.start: float = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY: Registry = Registry()
+
+ROOMS = Gauge("mafia_rooms", "Rooms currently held by this process")
+PLAYERS = Gauge(
+    "mafia_players", "Seated players, including ones within the reconnect grace"
+)
+MESSAGES = Counter("mafia_messages_total", "Inbound messages handled", ["type"])
+MESSAGE_SECONDS = Histogram(
+    "mafia_message_seconds", "Time to handle one inbound message", ["type"]
+)
+BROADCASTS = Counter("mafia_broadcasts_total", "Room broadcasts")
+BROADCAST_RECIPIENTS = Counter(
+    "mafia_broadcast_recipients_total", "Frames enqueued by room broadcasts"
+)
+BROADCAST_SECONDS = Histogram(
+    "mafia_broadcast_seconds", "Time to encode and fan out one broadcast"
+)
+GAME_STATE_SECONDS = Histogram(
+    "mafia_broadcast_game_state_seconds", "Time to sync a room's state to its players"
+)
+NIGHT_ACTIONS_SECONDS = Histogram(
+    "mafia_process_night_actions_seconds", "Time for one process_night_actions"
+)
+ENCODED_BYTES = Counter(
+    "mafia_encoded_bytes_total", "Bytes produced by the encoder", ["codec"]
+)
+ENCODED_EVENTS = Counter("mafia_encoded_events_total", "Events encoded", ["codec"])
+SEND_SECONDS = Histogram("mafia_send_seconds", "Time for one websocket send")
+BATCH_EVENTS = Histogram(
+    "mafia_batch_events",
+    "Events carried by one outbound frame",
+    buckets=BATCH_BUCKETS,
+)
+SUPERSEDED_FRAMES = Counter(
+    "mafia_superseded_frames_total",
+    "Queued state frames dropped for a newer state snapshot",
+)
+SEND_FAILURES = Counter(
+    "mafia_send_failures_total", "Frames that could not be delivered", ["reason"]
+)
+RATE_LIMITED = Counter(
+    "mafia_rate_limited_total", "Inbound messages dropped by rate limits", ["type"]
+)
+REJECTED_MESSAGES = Counter(
+    "mafia_rejected_messages_total", "Inbound messages answered with an error", ["code"]
+)
+BACKPRESSURE_PAUSES = Counter(
+    "mafia_backpressure_pauses_total", "Times a reader paused for a full outbox"
+)
+COMPRESSION_BYTES = Counter(
+    "mafia_compression_bytes_total",
+    "Payload bytes before (raw) and after (wire) permessage-deflate",
+    ["stage"],
+)
+COMPRESSION_SKIPPED = Counter(
+    "mafia_compression_skipped_total", "Frames sent uncompressed for being small"
+)
+COMPRESSION_CACHE_HITS = Counter(
+    "mafia_compression_cache_hits_total", "Frames reusing a shared compressed payload"
+)
+PHASE_SECONDS = Histogram(
+    "mafia_phase_seconds", "Wall time of game phases", ["phase"], PHASE_BUCKETS
+)
+SNAPSHOT_ROOMS = Counter(
+    "mafia_snapshot_rooms_total", "Room snapshots written to the snapshot store"
+)
+SNAPSHOT_SECONDS = Histogram(
+    "mafia_snapshot_seconds", "Time to write one batch of room snapshots"
+)
+DRAINING = Gauge("mafia_draining", "1 while the server drains for a restart")
+RESTORED_ROOMS = Counter(
+    "mafia_restored_rooms_total", "Rooms restored from snapshots at startup"
+)
+SPECTATORS = Gauge("mafia_spectators", "Connections watching a room")
+PUBLIC_ROOMS = Gauge("mafia_public_rooms", "Rooms listed in the room directory")
+ROOM_LISTINGS = Counter(
+    "mafia_room_listings_total", "Room directory pages served", ["cache"]
+)
+MATCH_QUEUE = Gauge("mafia_match_queue", "Connections waiting for a quick match")
+MATCHES = Counter("mafia_matches_total", "Rooms formed from the quick-match queue")
+EVICTED_ROOMS = Counter(
+    "mafia_evicted_rooms_total", "Rooms closed by the reaper", ["reason"]
+)
+REFUSED_CONNECTIONS = Counter(
+    "mafia_refused_connections_total", "Connections turned away at the handshake"
+)
+MEMORY_PRESSURE = Gauge(
+    "mafia_memory_pressure", "1 while over the memory limit and shedding lobbies"
+)
+RESIDENT_BYTES = Gauge("mafia_resident_bytes", "Resident memory of this process")
+SPECTATOR_FRAMES = Counter(
+    "mafia_spectator_frames_total", "Frames enqueued by room spectator feeds"
+)
+SPECTATOR_SECONDS = Histogram(
+    "mafia_spectator_seconds", "Time for a spectator feed to fan out one frame"
+)
+
+Route = Callable[[Dict[str, str]], str]
+
+
+async def serve_metrics(
+    host: str = "127.0.0.1", port: int = 9091, routes: Optional[Dict[str, Route]] = None
+) -> asyncio.Server:
+    # tiny HTTP/1.0 responder, enough for a Prometheus scrape and admin toggles
+    handlers: Dict[str, Route] = {"/metrics": lambda _: REGISTRY.render()}
+    handlers.update(routes or {})
+
+    async def respond(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            status, body = "404 Not Found", "not found\n"
+            if len(request_line) >= 2:
+                url = urlsplit(request_line[1])
+                handler = handlers.get(url.path)
+                if handler is not None:
+                    status, body = "200 OK", handler(dict(parse_qsl(url.query)))
+
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            log.warning("metrics request failed", fields={"error": str(e)})
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(respond, host, port)
+    log.info("metrics listening", fields={"port": port})
+    return server
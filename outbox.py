@@ -0,0 +1,218 @@
+import time
+from asyncio import (
+    Future,
+    Task,
+    TimeoutError,
+    create_task,
+    get_running_loop,
+    sleep,
+    wait_for,
+)
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from websockets import ConnectionClosed, ServerConnection
+
+from encoding import JSON, Codec
+from enums import OverflowPolicy
+from log import get_logger
+from metrics import BATCH_EVENTS, SEND_FAILURES, SEND_SECONDS, SUPERSEDED_FRAMES
+
+log = get_logger("outbox")
+
+# what a queued frame carries. a state snapshot makes the state frames queued
+# ahead of it redundant, so those are dropped rather than sent
+EVENT: int = 0
+STATE: int = 1
+SNAPSHOT: int = 2
+
+
+class Outbox:
+    # per-connection bounded send queue drained by its own writer task, so a
+    # slow client only ever delays itself and never the sender of a broadcast.
+    # a bare deque plus one wakeup future rather than an asyncio.Queue, which
+    # carries three deques and an Event per connection.
+    #
+    # the writer sends whatever was queued during one event loop tick (or
+    # batch_window seconds) as a single frame holding an array of events, up to
+    # batch_size of them; a lone event still goes out on its own
+    __slots__ = (
+        "websocket",
+        "name",
+        "send_timeout",
+        "policy",
+        "frames",
+        "max_size",
+        "waiter",
+        "space",
+        "writer",
+        "closer",
+        "closed",
+        "dropped",
+        "codec",
+        "batch_size",
+        "batch_window",
+    )
+
+    def __init__(
+        self,
+        websocket: Optional[ServerConnection],
+        name: str,
+        max_size: int = 256,
+        send_timeout: float = 5.0,
+        policy: OverflowPolicy = OverflowPolicy.DISCONNECT,
+        codec: Codec = JSON,
+        batch_size: int = 64,
+        batch_window: float = 0.0,
+    ) -> None:
+        self.websocket: Optional[ServerConnection] = websocket
+        self.name: str = name
+        self.send_timeout: float = send_timeout
+        self.policy: OverflowPolicy = policy
+        self.frames: Deque[Tuple[bytes, int]] = deque()
+        self.max_size: int = max_size
+        self.waiter: Optional[Future[None]] = None
+        self.space: Optional[Future[None]] = None
+        self.writer: Optional[Task[None]] = None
+        self.closer: Optional[Task[None]] = None
+        self.closed: bool = False
+        self.dropped: int = 0
+        # frames are always bytes; the codec picks text or binary websocket
+        # frames and joins batches
+        self.codec: Codec = codec
+        self.batch_size: int = batch_size
+        self.batch_window: float = batch_window
+
+    def put(self, frame: bytes, kind: int = EVENT) -> bool:
+        if self.closed:
+            return False
+
+        if kind == SNAPSHOT and self.frames:
+            kept: Deque[Tuple[bytes, int]] = deque(
+                item for item in self.frames if item[1] == EVENT
+            )
+            SUPERSEDED_FRAMES.inc(len(self.frames) - len(kept))
+            self.frames = kept
+
+        if len(self.frames) >= self.max_size:
+            self.dropped += 1
+            SEND_FAILURES.inc(1, "overflow")
+            if self.policy == OverflowPolicy.DISCONNECT:
+                self.abort("outbound queue full")
+            return False
+
+        self.frames.append((frame, kind))
+        if self.writer is None:
+            self.writer = create_task(self.run())
+        else:
+            self.wake()
+        return True
+
+    def wake(self) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    @property
+    def congested(self) -> bool:
+        return len(self.frames) >= self.max_size // 2
+
+    async def wait_for_space(self) -> None:
+        # inbound backpressure: the reader parks here while the client is not
+        # keeping up, until the writer has drained back to a quarter full
+        if not self.congested or self.closed:
+            return
+        if self.space is None:
+            self.space = get_running_loop().create_future()
+        await self.space
+
+    def release(self) -> None:
+        if self.space is not None:
+            if not self.space.done():
+                self.space.set_result(None)
+            self.space = None
+
+    async def run(self) -> None:
+        try:
+            await self.drain()
+        finally:
+            self.release()
+
+    async def drain(self) -> None:
+        while True:
+            while not self.frames:
+                if self.closed:
+                    return
+                self.waiter = get_running_loop().create_future()
+                await self.waiter
+                self.waiter = None
+
+            if self.batch_size > 1:
+                # let the rest of this tick's events queue up behind the first
+                await sleep(self.batch_window)
+                if not self.frames:
+                    continue
+            frame: bytes = self.take()
+            if self.space is not None and len(self.frames) <= self.max_size // 4:
+                self.release()
+
+            started: float = time.perf_counter()
+            try:
+                await wait_for(
+                    self.websocket.send(frame, text=self.codec.text),
+                    self.send_timeout,
+                )
+                SEND_SECONDS.observe(time.perf_counter() - started)
+            except TimeoutError:
+                SEND_FAILURES.inc(1, "timeout")
+                # the frame is still buffered by the transport, but the client has
+                # stopped reading for longer than the deadline allows
+                self.abort("send deadline exceeded")
+                return
+            except ConnectionClosed:
+                SEND_FAILURES.inc(1, "closed")
+                self.closed = True
+                return
+            except Exception as e:
+                SEND_FAILURES.inc(1, "error")
+                log.warning(
+                    "send failed", fields={"player": self.name, "error": str(e)}
+                )
+                self.closed = True
+                return
+
+    def take(self) -> bytes:
+        # the next frame to send, joining as many queued events as allowed
+        count: int = min(len(self.frames), self.batch_size)
+        BATCH_EVENTS.observe(count)
+        if count == 1:
+            return self.frames.popleft()[0]
+        popleft = self.frames.popleft
+        batch: List[bytes] = [popleft()[0] for _ in range(count)]
+        return self.codec.join(batch)
+
+    def abort(self, reason: str) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.frames.clear()
+        self.wake()
+        self.release()
+        log.warning(
+            "disconnecting slow consumer",
+            fields={"player": self.name, "reason": reason, "dropped": self.dropped},
+        )
+        self.closer = create_task(self.websocket.close(1013, reason))
+
+    async def close(self, timeout: float = 1.0) -> None:
+        # flush whatever is queued (bounded by timeout), then stop the writer
+        if self.writer is None or self.writer.done():
+            self.closed = True
+            return
+
+        self.closed = True
+        self.wake()
+
+        try:
+            await wait_for(self.writer, timeout)
+        except TimeoutError:
+            pass  # wait_for already cancelled the writer
@@ -1,26 +1,96 @@
-import json
-import uuid
-from typing import Optional, Dict, Any
+import secrets
+from asyncio import Task
+from typing import Optional, Dict, Any, Tuple
 from websockets import ServerConnection
-from roles import Role, NightRole
+from encoding import Codec, Encoded, codec_for
+from engine import Seat
+from enums import OverflowPolicy
+from outbox import EVENT, SNAPSHOT, STATE, Outbox
+from ratelimit import PLAYER_LIMITS, RateLimiter
+from sync import SyncState
 
 
-class Player:
-    def __init__(self, websocket: ServerConnection, name: str) -> None:
-        self.id: str = str(uuid.uuid4())
-        self.name: str = name
-        self.websocket: ServerConnection = websocket
-        self.role: Optional[Role] = None
-        self.is_alive: bool = True
+class Player(Seat):
+    __slots__ = (
+        "websocket",
+        "outbox",
+        "sync",
+        "token",
+        "expiry",
+        "limiter",
+        "throttled",
+        "codec",
+    )
+
+    def __init__(
+        self,
+        websocket: Optional[ServerConnection],
+        name: str,
+        queue_size: int = 256,
+        send_timeout: float = 5.0,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DISCONNECT,
+        limits: Dict[str, Tuple[float, float]] = PLAYER_LIMITS,
+        batch_size: int = 64,
+        batch_window: float = 0.0,
+    ) -> None:
+        # 48 random bits; ids only need to be unique within a room
+        super().__init__(secrets.token_urlsafe(6), name)
+        # None for a seat restored from a snapshot until its client resumes
+        self.websocket: Optional[ServerConnection] = websocket
+        # negotiated per connection through the websocket subprotocol
+        self.codec: Codec = codec_for(websocket.subprotocol if websocket else None)
+        self.outbox: Outbox = Outbox(
+            websocket,
+            name,
+            queue_size,
+            send_timeout,
+            overflow_policy,
+            self.codec,
+            batch_size,
+            batch_window,
+        )
+        if websocket is None:
+            self.outbox.closed = True
+        self.sync: SyncState = SyncState()
+        # lets a dropped client take its seat back within the grace period
+        self.token: str = secrets.token_urlsafe(16)
+        self.expiry: Optional[Task[None]] = None
+        # kept across resumes so reconnecting does not refill the buckets
+        self.limiter: RateLimiter = RateLimiter(limits)
+        self.throttled: bool = False
 
     async def send(self, event: Dict[str, Any]) -> None:
-        try:
-            await self.websocket.send(json.dumps(event))
-        except Exception as e:
-            print(f"Failed to send to player {self.name}: {e}")
+        # only enqueues; the outbox writer task does the actual socket write
+        self.outbox.put(self.codec.encode(event))
+
+    def send_encoded(self, encoded: Encoded, kind: int = EVENT) -> None:
+        # for events shared between recipients, encoded once per codec
+        self.outbox.put(encoded.frame(self.codec), kind)
+
+    def send_state(self, event: Dict[str, Any], snapshot: bool = False) -> None:
+        # a state snapshot or patch; a snapshot replaces any still queued
+        self.outbox.put(self.codec.encode(event), SNAPSHOT if snapshot else STATE)
+
+    def send_json(self, frame: bytes) -> None:
+        # for stored JSON frames, such as room history
+        self.outbox.put(self.codec.from_json(frame))
 
-    def set_role(self, role: Role) -> None:
-        self.role = role
+    async def close(self) -> None:
+        await self.outbox.close()
 
-    def is_night_role(self) -> bool:
-        return isinstance(self.role, NightRole)
+    def rebind(self, websocket: ServerConnection) -> None:
+        # a resumed session gets a fresh outbox; the old one was closed on disconnect
+        old: Outbox = self.outbox
+        self.websocket = websocket
+        self.codec = codec_for(websocket.subprotocol)
+        self.outbox = Outbox(
+            websocket,
+            self.name,
+            old.max_size,
+            old.send_timeout,
+            old.policy,
+            self.codec,
+            old.batch_size,
+            old.batch_window,
+        )
+        self.sync.reset()
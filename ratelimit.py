@@ -0,0 +1,76 @@
+import time
+from typing import Callable, Dict, Tuple
+
+# (tokens per second, burst) for each inbound message type
+PLAYER_LIMITS: Dict[str, Tuple[float, float]] = {
+    "chat": (2.0, 5.0),
+    "chat_history": (2.0, 5.0),
+    "vote": (2.0, 5.0),
+    "night_action": (2.0, 5.0),
+    "resync": (1.0, 3.0),
+    "*": (5.0, 10.0),
+}
+
+# shared by everyone in a room, so a room full of spammers is capped as a whole
+ROOM_LIMITS: Dict[str, Tuple[float, float]] = {
+    "chat": (10.0, 20.0),
+}
+
+# per connection before it has a seat; listings with new filters miss the
+# page cache, and every quick_match puts a new ticket in a queue
+LOBBY_LIMITS: Dict[str, Tuple[float, float]] = {
+    "list_rooms": (2.0, 5.0),
+    "quick_match": (0.5, 3.0),
+    "*": (5.0, 10.0),
+}
+
+MAX_CHAT_LENGTH: int = 500
+
+# inbound frames above this size close the connection, and the websocket stops
+# reading from the socket once this many frames are waiting to be handled
+MAX_FRAME_SIZE: int = 16 * 1024
+INBOUND_QUEUE: int = 16
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class RateLimiter:
+    # one bucket per message type, created on first use; types without their
+    # own limit share the "*" bucket if there is one
+    __slots__ = ("limits", "buckets", "clock")
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, float]],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.limits: Dict[str, Tuple[float, float]] = limits
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.clock: Callable[[], float] = clock
+
+    def allow(self, message_type: str) -> bool:
+        key: str = message_type if message_type in self.limits else "*"
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            limit = self.limits.get(key)
+            if limit is None:
+                return True
+            bucket = TokenBucket(limit[0], limit[1], self.clock())
+            self.buckets[key] = bucket
+        return bucket.take(self.clock())
@@ -0,0 +1,119 @@
+import mmap
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from enums import GamePhase
+
+if TYPE_CHECKING:
+    from room import Room
+
+# fraction of the memory limit resident memory has to fall back under before
+# a server under pressure takes new rooms again
+PRESSURE_RECOVERY: float = 0.9
+
+
+def rss_bytes() -> int:
+    # current resident set size, or 0 where /proc is not available
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class RoomReaper:
+    # finds rooms to evict. rooms are kept in least recently used order of
+    # player activity (messages, joins and resumes), so a pass only walks the
+    # rooms that have been quiet for at least the shortest TTL. a TTL of 0
+    # turns that kind of eviction off
+    __slots__ = (
+        "idle_ttl",
+        "finished_ttl",
+        "abandoned_ttl",
+        "memory_limit",
+        "pressure",
+        "recent",
+    )
+
+    def __init__(
+        self,
+        idle_ttl: float = 1800.0,
+        finished_ttl: float = 600.0,
+        abandoned_ttl: float = 300.0,
+        memory_limit: int = 0,
+    ) -> None:
+        self.idle_ttl: float = idle_ttl
+        self.finished_ttl: float = finished_ttl
+        self.abandoned_ttl: float = abandoned_ttl
+        # bytes of resident memory; 0 for no limit
+        self.memory_limit: int = memory_limit
+        self.pressure: bool = False
+        # room code -> time.monotonic() of its last activity, oldest first
+        self.recent: "OrderedDict[str, float]" = OrderedDict()
+
+    def touch(self, room_code: str) -> None:
+        self.recent[room_code] = time.monotonic()
+        self.recent.move_to_end(room_code)
+
+    def forget(self, room_code: str) -> None:
+        self.recent.pop(room_code, None)
+
+    def reason(self, room: "Room", idle: float) -> Optional[str]:
+        # why a room that has been quiet for idle seconds should go, if it should
+        if self.finished_ttl and room.phase == GamePhase.FINISHED:
+            if idle >= self.finished_ttl:
+                return "finished"
+        if self.abandoned_ttl and idle >= self.abandoned_ttl:
+            if not any(not p.outbox.closed for p in room.players.values()):
+                return "abandoned"
+        # a running game is kept going by its phase timers however quiet its
+        # players are, so only lobbies and finished games go for being idle
+        if self.idle_ttl and idle >= self.idle_ttl:
+            if room.phase in (GamePhase.WAITING, GamePhase.FINISHED):
+                return "idle"
+        return None
+
+    def expired(self, rooms: Dict[str, "Room"]) -> List[Tuple["Room", str]]:
+        ttls: List[float] = [
+            ttl for ttl in (self.idle_ttl, self.finished_ttl, self.abandoned_ttl) if ttl
+        ]
+        if not ttls:
+            return []
+        shortest: float = min(ttls)
+        now: float = time.monotonic()
+        found: List[Tuple["Room", str]] = []
+        for room_code, active in self.recent.items():
+            idle: float = now - active
+            if idle < shortest:
+                break  # everything after this is more recent still
+            room: Optional["Room"] = rooms.get(room_code)
+            if room is None:
+                continue
+            reason: Optional[str] = self.reason(room, idle)
+            if reason is not None:
+                found.append((room, reason))
+        return found
+
+    def idle_lobbies(self, rooms: Dict[str, "Room"], quiet: float) -> Iterator["Room"]:
+        # rooms still waiting for a game, least recently used first, skipping
+        # any with activity in the last quiet seconds
+        now: float = time.monotonic()
+        for room_code, active in self.recent.items():
+            if now - active < quiet:
+                return
+            room: Optional["Room"] = rooms.get(room_code)
+            if room is not None and room.phase == GamePhase.WAITING:
+                yield room
+
+    def check_memory(self) -> bool:
+        # whether the process is over its memory limit, with some hysteresis
+        # so the mode does not flap around the limit
+        if not self.memory_limit:
+            return False
+        rss: int = rss_bytes()
+        if self.pressure:
+            self.pressure = rss >= self.memory_limit * PRESSURE_RECOVERY
+        else:
+            self.pressure = rss >= self.memory_limit
+        return self.pressure
@@ -0,0 +1,69 @@
+from typing import Any, Callable, List, Optional, Tuple
+
+# (seq, audience, timestamp, sender, message); audience None is everyone and
+# sender None is the server
+Entry = Tuple[int, Optional[str], float, Optional[str], str]
+
+
+class RingLog:
+    # fixed-capacity log that overwrites its oldest entry once full. sequence
+    # numbers are contiguous, so an entry's slot is computed rather than searched
+    __slots__ = ("entries", "capacity", "base", "last_seq")
+
+    def __init__(self, capacity: int) -> None:
+        # grows up to capacity instead of preallocating, since most rooms stay small
+        self.entries: List[Entry] = []
+        self.capacity: int = capacity
+        self.base: int = 1
+        self.last_seq: int = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def first_seq(self) -> int:
+        return max(self.base, self.last_seq - self.capacity + 1)
+
+    def append(
+        self,
+        audience: Optional[str],
+        sender: Optional[str],
+        message: str,
+        timestamp: float,
+    ) -> Entry:
+        self.last_seq += 1
+        entry: Entry = (self.last_seq, audience, timestamp, sender, message)
+        if len(self.entries) < self.capacity:
+            self.entries.append(entry)
+        else:
+            self.entries[(self.last_seq - self.base) % self.capacity] = entry
+        return entry
+
+    def dump(self) -> List[Any]:
+        # entries in slot order, so load() puts each one back where it was
+        return [self.base, self.last_seq, [list(entry) for entry in self.entries]]
+
+    def load(self, data: List[Any]) -> None:
+        self.base, self.last_seq = data[0], data[1]
+        self.entries = [tuple(entry) for entry in data[2]]
+
+    def clear(self) -> None:
+        # sequence numbers keep counting so clients never see one reused
+        self.entries = []
+        self.base = self.last_seq + 1
+
+    def page(
+        self, before: Optional[int], limit: int, visible: Callable[[Entry], bool]
+    ) -> Tuple[List[Entry], bool]:
+        # up to limit visible entries older than before, oldest first, and
+        # whether anything older is still held
+        seq: int = self.last_seq if before is None else min(before - 1, self.last_seq)
+        first: int = self.first_seq
+        found: List[Entry] = []
+        while seq >= first and len(found) < limit:
+            entry: Entry = self.entries[(seq - self.base) % self.capacity]
+            if visible(entry):
+                found.append(entry)
+            seq -= 1
+        found.reverse()
+        return found, seq >= first
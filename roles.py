@@ -1,8 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict
 
 if TYPE_CHECKING:  # avoid circular import
-    from room import Room
+    from engine import GameEngine
 
 
 class Role(ABC):
@@ -19,7 +19,7 @@ class Role(ABC):
 
 class NightRole(Role):
     @abstractmethod
-    def perform_night_action(self, room: "Room", actor_id: str, target_id: str) -> None:
+    def perform_night_action(self, room: "GameEngine", actor_id: str, target_id: str) -> None:
         pass
 
 
@@ -45,7 +45,7 @@ class Mafia(NightRole):
     def description(self) -> str:
         return "Your goal is to eliminate all non-mafia. You can kill someone each night and communicate with other mafia. (The chat during the night is only shown to other mafia.)"
 
-    def perform_night_action(self, room: "Room", actor_id: str, target_id: str) -> None:
+    def perform_night_action(self, room: "GameEngine", actor_id: str, target_id: str) -> None:
         if target_id in room.players:
             target_player = room.players[target_id]
             room.kill_player(target_player)
@@ -60,7 +60,7 @@ class Doctor(NightRole):
     def description(self) -> str:
         return "You can protect one person each night from being killed."
 
-    def perform_night_action(self, room: "Room", actor_id: str, target_id: str) -> None:
+    def perform_night_action(self, room: "GameEngine", actor_id: str, target_id: str) -> None:
         if target_id in room.players:
             target_player = room.players[target_id]
             room.protect_player(target_player)
@@ -75,6 +75,18 @@ class Detective(NightRole):
     def description(self) -> str:
         return "You can investigate one person each night to learn if they are mafia or not."
 
-    def perform_night_action(self, room: "Room", actor_id: str, target_id: str) -> None:
+    def perform_night_action(self, room: "GameEngine", actor_id: str, target_id: str) -> None:
         # for detective, result is immediately sent to player
         pass
+
+
+# roles hold no per-player state, so every seat shares one instance
+VILLAGER: Villager = Villager()
+MAFIA: Mafia = Mafia()
+DOCTOR: Doctor = Doctor()
+DETECTIVE: Detective = Detective()
+
+# by name, for restoring snapshots
+ROLES: Dict[str, Role] = {
+    role.name: role for role in (VILLAGER, MAFIA, DOCTOR, DETECTIVE)
+}
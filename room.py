@@ -1,108 +1,327 @@
-from asyncio import Task, create_task, sleep
+from asyncio import (
+    Event,
+    Handle,
+    Task,
+    TimeoutError,
+    create_task,
+    get_running_loop,
+    wait_for,
+)
+from collections import deque
+from itertools import islice
 import time
-import random
-from typing import Dict, List, Optional, Any
+from typing import Callable, Deque, Dict, List, Optional, Any, Tuple
 
+from encoding import JSON, Encoded
+from config import RoomConfig
+from engine import GameEngine
 from enums import GamePhase
+from lobby import RoomIndex
+from log import get_logger
+from metrics import (
+    BROADCASTS,
+    BROADCAST_RECIPIENTS,
+    BROADCAST_SECONDS,
+    GAME_STATE_SECONDS,
+    NIGHT_ACTIONS_SECONDS,
+    PHASE_SECONDS,
+)
+from outbox import STATE
 from player import Player
-from roles import Mafia, Doctor, Detective, Villager, NightRole
+from ratelimit import ROOM_LIMITS, RateLimiter
+from ringlog import Entry, RingLog
+from roles import ROLES, Detective, Mafia
+from spectate import SpectatorFeed
+from sync import diff
 
+log = get_logger("room")
 
-class Room:
-    def __init__(self, room_code: str) -> None:
+# history audience for events only mafia received; anything else is a player id
+MAFIA_ONLY: str = "*mafia"
+
+# bumped when the snapshot layout changes; older snapshots are not restored
+SNAPSHOT_VERSION: int = 1
+
+
+def chat_fields(entry: Entry) -> Dict[str, Any]:
+    seq, _, timestamp, sender, message = entry
+    if sender is None:
+        return {
+            "seq": seq,
+            "sender": "[Server]",
+            "message": message,
+            "timestamp": timestamp,
+            "is_server": True,
+        }
+    return {"seq": seq, "sender": sender, "message": message, "timestamp": timestamp}
+
+
+class Room(GameEngine[Player]):
+    # a game played over websockets: the engine keeps the rules, the room adds
+    # the clients, chat, history and real time phases around them
+    __slots__ = (
+        "room_code",
+        "event_log",
+        "chat_log",
+        "host",
+        "game_task",
+        "phase_complete",
+        "roster",
+        "roster_version",
+        "roster_patches",
+        "roster_dirty",
+        "sync_all",
+        "sync_players",
+        "sync_handle",
+        "seq",
+        "history",
+        "limiter",
+        "dirty",
+        "feed",
+        "public",
+        "index",
+    )
+
+    def __init__(
+        self,
+        room_code: str,
+        config: Optional[RoomConfig] = None,
+        limits: Dict[str, Tuple[float, float]] = ROOM_LIMITS,
+    ) -> None:
+        super().__init__(config)
         self.room_code: str = room_code
-        self.players: Dict[str, Player] = {}
-        self.phase: GamePhase = GamePhase.WAITING
-        self.phase_timer: float = 0
-        self.phase_duration: int = 60  # seconds
-        self.minimum_players: int = 6
-        self.votes: Dict[str, str] = {}
-        self.night_actions: Dict[str, str] = {}
-        self.event_log: List[Dict[str, Any]] = []
-        self.chat_log: List[Dict[str, Any]] = []
+        self.event_log: RingLog = RingLog(self.config.event_size)
+        self.chat_log: RingLog = RingLog(self.config.chat_size)
         self.host: Optional[str] = None
         self.game_task: Optional[Task[None]] = None
-        self.game_result: Optional[str] = None
-        self.killed_players: List[Player] = []
-        self.protected_players: List[Player] = []
+        self.phase_complete: Event = Event()
+        self.roster: Dict[str, Dict[str, Any]] = {}
+        self.roster_version: int = 0
+        self.roster_patches: Deque[Encoded] = deque(maxlen=16)
+        self.roster_dirty: bool = False
+        # state syncs wait for the end of the tick, so everything that changed
+        # in it reaches each player as one snapshot or patch
+        self.sync_all: bool = False
+        self.sync_players: Dict[str, Player] = {}
+        self.sync_handle: Optional[Handle] = None
+        # recent room events as (seq, audience, frame), replayed on resume
+        self.seq: int = 0
+        self.history: Deque[Tuple[int, Optional[str], bytes]] = deque(
+            maxlen=self.config.history_size
+        )
+        self.limiter: RateLimiter = RateLimiter(limits)
+        # changed since the snapshot store last saved the room
+        self.dirty: bool = True
+        # created once the first spectator attaches
+        self.feed: Optional[SpectatorFeed] = None
+        # public rooms are listed in the server's room directory, which the
+        # room keeps up to date as players come and go and phases change
+        self.public: bool = False
+        self.index: Optional[RoomIndex] = None
 
     def add_player(self, player: Player) -> None:
-        self.players[player.id] = player
+        super().add_player(player)
+        self.roster_dirty = True
+        self.dirty = True
         if self.host is None:
             self.host = player.id
-
-    def remove_player(self, player_id: str) -> None:
-        if player_id in self.players:
-            del self.players[player_id]
+        if self.index is not None:
+            self.index.update(self)
+
+    def remove_player(self, player_id: str) -> Optional[Player]:
+        player: Optional[Player] = super().remove_player(player_id)
+        if player is not None:
+            self.roster_dirty = True
+            self.dirty = True
             if self.host == player_id and self.players:
                 self.host = next(iter(self.players.keys()))
+            self.check_phase_complete()
+            if self.index is not None:
+                self.index.update(self)
+        return player
+
+    def record(self, event: Dict[str, Any], audience: Optional[str]) -> Encoded:
+        # history keeps the compact JSON frame; other codecs re-encode on replay
+        self.seq += 1
+        self.dirty = True
+        encoded: Encoded = Encoded({**event, "seq": self.seq})
+        self.history.append((self.seq, audience, encoded.frame(JSON)))
+        return encoded
+
+    def replay(self, player: Player, last_seq: int) -> int:
+        # resend what a reconnecting player missed, as far back as history goes
+        if not self.history:
+            return 0
+        first: int = self.history[0][0]
+        replayed: int = 0
+        for _, audience, frame in islice(
+            self.history, max(0, last_seq + 1 - first), None
+        ):
+            if self.can_see(player, audience):
+                player.send_json(frame)
+                replayed += 1
+        return replayed
+
+    def can_see(self, player: Player, audience: Optional[str]) -> bool:
+        # the same rule as the live sends: the mafia channel is for living mafia
+        return (
+            audience is None
+            or audience == player.id
+            or (
+                audience == MAFIA_ONLY
+                and isinstance(player.role, Mafia)
+                and player.is_alive
+            )
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        # plain data for the snapshot store, in fresh containers so it can be
+        # encoded off the event loop. the game loop only yields while it waits
+        # out a phase, so a room is never captured halfway through resolving one
+        in_phase: bool = self.phase in (GamePhase.NIGHT, GamePhase.DAY)
+        return {
+            "version": SNAPSHOT_VERSION,
+            "room_code": self.room_code,
+            "config": {
+                name: getattr(self.config, name) for name in RoomConfig.__slots__
+            },
+            "phase": self.phase.value,
+            # time left rather than the deadline, so the clock stops while down
+            "remaining": max(0.0, self.phase_timer - self.clock()) if in_phase else 0,
+            "host": self.host,
+            "public": self.public,
+            "game_result": self.game_result,
+            "players": [
+                [p.id, p.name, p.token, p.seat, p.role.name if p.role else None]
+                for p in self.players.values()
+            ],
+            "flags": list(self.flags),
+            "free_seats": list(self.free_seats),
+            "votes": dict(self.votes),
+            "night_actions": dict(self.night_actions),
+            "pending_voters": list(self.pending_voters),
+            "pending_actors": list(self.pending_actors),
+            "seq": self.seq,
+            "history": [
+                [seq, audience, frame.decode()] for seq, audience, frame in self.history
+            ],
+            "chat_log": self.chat_log.dump(),
+            "event_log": self.event_log.dump(),
+            "roster_version": self.roster_version,
+        }
+
+    @classmethod
+    def restore(
+        cls,
+        data: Dict[str, Any],
+        limits: Dict[str, Tuple[float, float]],
+        new_player: Callable[[str], Player],
+    ) -> "Room":
+        # players come back without a connection, waiting to resume
+        config: RoomConfig = RoomConfig(
+            **{k: v for k, v in data["config"].items() if k in RoomConfig.__slots__}
+        )
+        room: Room = cls(data["room_code"], config, limits)
+        room.phase = GamePhase(data["phase"])
+        if room.phase in (GamePhase.NIGHT, GamePhase.DAY):
+            room.phase_timer = room.clock() + data["remaining"]
+        room.host = data["host"]
+        room.public = data.get("public", False)
+        room.game_result = data["game_result"]
+        room.flags = bytearray(data["flags"])
+        room.free_seats = data["free_seats"]
+
+        for player_id, name, token, seat, role in data["players"]:
+            player: Player = new_player(name)
+            player.id = player_id
+            player.token = token
+            player.flags = room.flags
+            player.seat = seat
+            player.role = ROLES[role] if role is not None else None
+            room.players[player_id] = player
+            if player.is_alive:
+                room.count_alive(player, 1)
+
+        room.pending_voters = set(data["pending_voters"])
+        room.pending_actors = set(data["pending_actors"])
+        for voter_id, target_id in data["votes"].items():
+            room.votes[voter_id] = target_id
+            room.tally_vote(target_id)
+        room.night_actions = dict(data["night_actions"])
+
+        room.seq = data["seq"]
+        room.history.extend(
+            (seq, audience, frame.encode()) for seq, audience, frame in data["history"]
+        )
+        room.chat_log.load(data["chat_log"])
+        room.event_log.load(data["event_log"])
+        room.roster_version = data["roster_version"]
+        room.roster_dirty = True
+        room.dirty = False
+        return room
+
+    def resume_game(self) -> None:
+        # a restored room picks its game up part way through the phase
+        if self.phase in (GamePhase.NIGHT, GamePhase.DAY):
+            self.game_task = create_task(self.game_loop(resumed=True))
 
     async def broadcast(self, event: Dict[str, Any]) -> None:
+        started: float = time.perf_counter()
+        encoded: Encoded = self.record(event, None)
         for player in self.players.values():
-            await player.send(event)
+            player.send_encoded(encoded)
+        if self.feed is not None:
+            self.feed.publish(encoded)
+        BROADCASTS.inc()
+        BROADCAST_RECIPIENTS.inc(len(self.players))
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
 
     async def broadcast_to_mafia(self, event: Dict[str, Any]) -> None:
+        started: float = time.perf_counter()
+        encoded: Encoded = self.record(event, MAFIA_ONLY)
+        recipients: int = 0
         for player in self.players.values():
             if isinstance(player.role, Mafia) and player.is_alive:
-                await player.send(event)
+                player.send_encoded(encoded)
+                recipients += 1
+        BROADCASTS.inc()
+        BROADCAST_RECIPIENTS.inc(recipients)
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
 
     async def send_to(self, player_id: str, event: Dict[str, Any]) -> None:
-        if player_id in self.players:
+        if player_id not in self.players:
+            return
+        if event["type"] == "error":
+            # errors answer a request and are not worth replaying later
             await self.players[player_id].send(event)
+        else:
+            self.players[player_id].send_encoded(self.record(event, player_id))
 
-    def kill_player(self, player: Player) -> None:
-        if player not in self.killed_players:
-            self.killed_players.append(player)
-
-    def protect_player(self, player: Player) -> None:
-        if player not in self.protected_players:
-            self.protected_players.append(player)
-
-    def assign_roles(self) -> bool:
-        alive_players: List[Player] = list(self.players.values())
-        num_players: int = len(alive_players)
-
-        if num_players < self.minimum_players:
-            return False
-
-        num_mafia: int = max(1, num_players // 3)
-        roles: List[Any] = []
-
-        for _ in range(num_mafia):
-            roles.append(Mafia())
-
-        if num_players > 4:
-            roles.append(Doctor())
-        if num_players > 5:
-            roles.append(Detective())
-
-        while len(roles) < num_players:
-            roles.append(Villager())
-
-        random.shuffle(roles)
-        for i, player in enumerate(alive_players):
-            player.set_role(roles[i])
-
-        return True
+    def mark_dead(self, player: Player) -> None:
+        super().mark_dead(player)
+        self.roster_dirty = True
 
     async def start_game(self, starter_id: str) -> None:
         if starter_id != self.host:
             raise ValueError("only host can start the game")
 
-        if len(self.players) < self.minimum_players:
-            await self.broadcast(
+        minimum_players: int = self.config.minimum_players
+        if len(self.players) < minimum_players:
+            await self.send_to(
+                starter_id,
                 {
                     "type": "error",
-                    "message": f"Need at least {self.minimum_players} players to start",
-                }
+                    "message": f"Need at least {minimum_players} players to start",
+                },
             )
             return
 
-        if not self.assign_roles():
-            await self.broadcast({"type": "error", "message": "Failed to assign roles"})
+        if not self.begin():
+            await self.send_to(
+                starter_id, {"type": "error", "message": "Failed to assign roles"}
+            )
             return
 
-        self.phase = GamePhase.NIGHT
         await self.add_event("Game started! Night phase begins.")
         await self.broadcast_game_state()
 
@@ -125,19 +344,10 @@ class Room:
             )
             return
 
-        self.phase = GamePhase.WAITING
-        self.game_result = None
-        self.phase_timer = 0
-        self.votes = {}
-        self.night_actions = {}
-        self.killed_players = []
-        self.protected_players = []
-        self.chat_log = []
-        self.event_log = []
-
-        for player in self.players.values():
-            player.is_alive = True
-            player.role = None
+        self.reset_game()
+        self.chat_log.clear()
+        self.event_log.clear()
+        self.roster_dirty = True
 
         if self.game_task and not self.game_task.done():
             self.game_task.cancel()
@@ -167,203 +377,125 @@ class Room:
         )
 
         self.phase = GamePhase.FINISHED
+        self.phase_complete.set()
         return True
 
-    async def game_loop(self) -> None:
-        while self.phase != GamePhase.FINISHED:
-            if self.phase == GamePhase.NIGHT:
-                await self.run_night_phase()
-            elif self.phase == GamePhase.DAY:
-                await self.run_day_phase()
+    async def game_loop(self, resumed: bool = False) -> None:
+        # a resumed loop finishes the restored phase before starting new ones
+        try:
+            while self.phase != GamePhase.FINISHED:
+                if self.phase == GamePhase.NIGHT:
+                    await self.run_night_phase(resumed)
+                elif self.phase == GamePhase.DAY:
+                    await self.run_day_phase(resumed)
+                resumed = False
+
+                if await self.check_win_condition():
+                    break
+        except Exception as e:
+            # rather than leave the room stuck mid game, end it; the host can
+            # start another and the reaper clears it out if nobody does
+            log.error(
+                "game loop failed", fields={"room": self.room_code, "error": repr(e)}
+            )
+            self.phase = GamePhase.FINISHED
+            self.game_result = None
+            await self.add_event("The game was stopped by a server error.")
+            await self.broadcast_game_state()
 
-            if await self.check_win_condition():
-                break
+    async def run_night_phase(self, resumed: bool = False) -> None:
+        started: float = time.monotonic()
+        if not resumed:
+            self.begin_night()
 
-    async def run_night_phase(self) -> None:
-        self.phase_timer = time.time() + self.phase_duration
-        self.night_actions.clear()
-        self.chat_log.clear()
-        self.killed_players.clear()
-        self.protected_players.clear()
+        self.phase_complete.clear()
 
         await self.broadcast_game_state()
-
-        while time.time() < self.phase_timer and self.phase != GamePhase.FINISHED:
-            await sleep(1)
-            if self.all_night_actions_submitted():
-                break
+        await self.wait_for_phase_end()
 
         await self.process_night_actions()
-        if self.phase != GamePhase.FINISHED:
-            self.phase = GamePhase.DAY
 
         await self.broadcast_game_state()
+        PHASE_SECONDS.observe(time.monotonic() - started, "night")
 
-    async def run_day_phase(self) -> None:
-        self.phase_timer = time.time() + self.phase_duration
-        self.votes.clear()
-        self.chat_log.clear()
+    async def run_day_phase(self, resumed: bool = False) -> None:
+        started: float = time.monotonic()
+        if not resumed:
+            self.begin_day()
 
-        await self.broadcast_game_state()
+        self.phase_complete.clear()
 
-        while time.time() < self.phase_timer and self.phase != GamePhase.FINISHED:
-            await sleep(1)
-            if self.all_votes_submitted():
-                break
+        await self.broadcast_game_state()
+        await self.wait_for_phase_end()
 
         await self.process_votes()
-        if self.phase != GamePhase.FINISHED:
-            self.phase = GamePhase.NIGHT
 
         await self.broadcast_game_state()
+        PHASE_SECONDS.observe(time.monotonic() - started, "day")
+
+    async def wait_for_phase_end(self) -> None:
+        # wakes once, either when the last vote/action arrives or at the deadline
+        self.check_phase_complete()
+        try:
+            await wait_for(
+                self.phase_complete.wait(), max(0, self.phase_timer - self.clock())
+            )
+        except TimeoutError:
+            pass
 
-    def all_night_actions_submitted(self) -> bool:
-        for player in self.players.values():
-            if (
-                isinstance(player.role, NightRole)
-                and player.id not in self.night_actions
-            ):
-                return False
-        return True
-
-    def all_votes_submitted(self) -> bool:
-        for player in self.players.values():
-            if player.is_alive and player.id not in self.votes:
-                return False
-        return True
+    def check_phase_complete(self) -> None:
+        if self.phase_done():
+            self.phase_complete.set()
 
     async def process_night_actions(self) -> None:
-        for actor_id, target_id in self.night_actions.items():
-            actor = self.players.get(actor_id)
-            target = self.players.get(target_id)
-
-            if actor and target and isinstance(actor.role, NightRole):
-                actor.role.perform_night_action(self, actor_id, target_id)
-
-        if len(self.killed_players) < 1:
-            await self.add_event("No one was killed during the night.")
-            return
-
-        for killed_player in self.killed_players:
-            if killed_player not in self.protected_players:
-                killed_player.is_alive = False
-                await self.add_event(
-                    f"{killed_player.name} was killed during the night."
-                )
-            else:
-                await self.add_event("Someone was attacked but saved by the doctor!")
+        with NIGHT_ACTIONS_SECONDS.time():
+            for message in self.end_night():
+                await self.add_event(message)
 
     async def process_votes(self) -> None:
-        if not self.votes:
-            await self.add_event("No votes were cast.")
-            return
-
-        vote_counts = {}
-        for target_id in self.votes.values():
-            vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
-
-        total_voters = sum(1 for p in self.players.values() if p.is_alive)
-        required_votes = (total_voters + 1) // 2
-
-        eliminated = [
-            id for id, count in vote_counts.items() if count >= required_votes
-        ]
-
-        if len(eliminated) == 1:
-            eliminated_player = self.players.get(eliminated[0])
-            if eliminated_player and eliminated_player.role:
-                eliminated_player.is_alive = False
-                await self.add_event(
-                    f"{eliminated_player.name} ({eliminated_player.role.name}) was voted out and eliminated."
-                )
-        else:
-            await self.add_event("Failed to reach consensus. No one was eliminated.")
+        for message in self.end_day():
+            await self.add_event(message)
 
     async def check_win_condition(self) -> bool:
-        alive_players = [p for p in self.players.values() if p.is_alive]
-        mafia_count = sum(1 for p in alive_players if isinstance(p.role, Mafia))
-        town_count = len(alive_players) - mafia_count
-
-        if mafia_count == 0:
-            await self.add_event("Town wins! All mafia have been eliminated.")
-            self.phase = GamePhase.FINISHED
-            self.game_result = "Town wins! All mafia have been eliminated."
-            await self.broadcast_game_state()
-            return True
-        elif mafia_count >= town_count:
-            await self.add_event("Mafia wins! They equal or outnumber the town.")
-            self.phase = GamePhase.FINISHED
-            self.game_result = "Mafia wins! They equal or outnumber the town."
-            await self.broadcast_game_state()
-            return True
-
-        return False
+        game_result: Optional[str] = self.check_winner()
+        if game_result is None:
+            return False
+        await self.add_event(game_result)
+        await self.broadcast_game_state()
+        return True
 
     async def add_event(self, message: str) -> None:
-        event = {"message": message, "timestamp": time.time()}
-        self.event_log.append(event)
-
-        server_message = {
-            "sender": "[Server]",
-            "message": message,
-            "timestamp": event["timestamp"],
-            "is_server": True,
-        }
-        await self.broadcast({"type": "chat_message", "chat": server_message})
+        timestamp: float = time.time()
+        self.event_log.append(None, None, message, timestamp)
+        entry: Entry = self.chat_log.append(None, None, message, timestamp)
+        await self.broadcast({"type": "chat_message", "chat": chat_fields(entry)})
 
     async def vote(self, player_id: str, target_id: str) -> None:
-        if self.phase != GamePhase.DAY:
-            raise ValueError("Can only vote during day phase")
-
-        player = self.players.get(player_id)
-        target = self.players.get(target_id)
-
-        if not player or not player.is_alive:
-            raise ValueError("you're dead")
-
-        if not target or not target.is_alive:
-            raise ValueError("invalid target")
-
-        if player_id in self.votes:
-            raise ValueError("cannot change vote")
-
-        self.votes[player_id] = target_id
+        player, target, votes = self.cast_vote(player_id, target_id)
+        self.check_phase_complete()
         await self.broadcast(
-            {"type": "vote_cast", "voter": player.name, "target": target.name}
+            {
+                "type": "vote_cast",
+                "voter": player.name,
+                "target": target.name,
+                "votes": votes,
+                "votes_needed": self.required_votes(),
+            }
         )
 
     async def night_action(self, player_id: str, target_id: str) -> None:
-        if self.phase != GamePhase.NIGHT:
-            raise ValueError("can only perform actions during night phase")
-
-        player = self.players.get(player_id)
-        target = self.players.get(target_id)
-
-        if not player or not player.is_night_role():
-            raise ValueError("you aren't supposed to do that")
-
-        if not target or not target.is_alive:
-            raise ValueError("invalid target")
-
-        if player_id in self.night_actions:
-            raise ValueError("cannot change action")
-
-        self.night_actions[player_id] = target_id
+        player, target = self.submit_action(player_id, target_id)
+        self.dirty = True
+        self.check_phase_complete()
 
         if isinstance(player.role, Detective):
             result = "mafia" if isinstance(target.role, Mafia) else "not mafia"
 
+            entry: Entry = self.chat_log.append(
+                player_id, None, f"{target.name} is {result}.", time.time()
+            )
             await self.send_to(
-                player_id,
-                {
-                    "type": "chat_message",
-                    "chat": {
-                        "sender": "[Server]",
-                        "message": f"{target.name} is {result}.",
-                        "timestamp": time.time(),
-                        "is_server": True,
-                    },
-                },
+                player_id, {"type": "chat_message", "chat": chat_fields(entry)}
             )
 
     async def send_chat(self, player_id: str, message: str) -> None:
@@ -371,48 +503,190 @@ class Room:
         if not player or not player.is_alive:
             return
 
-        chat_message = {
-            "sender": player.name,
-            "message": message,
-            "timestamp": time.time(),
-        }
-
+        entry: Entry
         if self.phase == GamePhase.NIGHT:
             if isinstance(player.role, Mafia):
-                self.chat_log.append(chat_message)
+                entry = self.chat_log.append(
+                    MAFIA_ONLY, player.name, message, time.time()
+                )
                 await self.broadcast_to_mafia(
-                    {"type": "chat_message", "chat": chat_message}
+                    {"type": "chat_message", "chat": chat_fields(entry)}
                 )
         else:
-            self.chat_log.append(chat_message)
-            await self.broadcast({"type": "chat_message", "chat": chat_message})
+            entry = self.chat_log.append(None, player.name, message, time.time())
+            await self.broadcast({"type": "chat_message", "chat": chat_fields(entry)})
+
+    async def chat_history(
+        self, player_id: str, before: Optional[int], limit: int
+    ) -> None:
+        player = self.players.get(player_id)
+        if not player:
+            return
+        entries, has_more = self.chat_log.page(
+            before,
+            max(1, min(limit, 100)),
+            lambda entry: self.can_see(player, entry[1]),
+        )
+        await player.send(
+            {
+                "type": "chat_history",
+                "chat": [chat_fields(entry) for entry in entries],
+                "has_more": has_more,
+            }
+        )
 
     async def broadcast_game_state(self) -> None:
-        for player in self.players.values():
-            await self.send_player_state(player)
+        self.sync_all = True
+        self.schedule_sync()
+        # every phase change is followed by a state broadcast
+        if self.index is not None:
+            self.index.update(self)
+        if self.feed is not None:
+            self.feed.touch()
 
     async def send_player_state(self, player: Player) -> None:
-        time_remaining = 0
-        if self.phase in [GamePhase.NIGHT, GamePhase.DAY]:
-            time_remaining = (
-                max(0, int(self.phase_timer - time.time()))
-                if self.phase_timer > 0
-                else 0
-            )
+        self.sync_players[player.id] = player
+        self.schedule_sync()
+
+    def schedule_sync(self) -> None:
+        if self.sync_handle is None:
+            self.sync_handle = get_running_loop().call_soon(self.flush_state)
+
+    def flush_state(self) -> None:
+        self.sync_handle = None
+        players: List[Player] = (
+            list(self.players.values())
+            if self.sync_all
+            else [p for p in self.sync_players.values() if self.players.get(p.id) is p]
+        )
+        self.sync_all = False
+        self.sync_players.clear()
+        with GAME_STATE_SECONDS.time():
+            self.publish_roster()
+            for player in players:
+                self.sync_player(player)
+
+    def publish_roster(self) -> None:
+        # the roster is shared, so its diff is computed and encoded once per change
+        # and kept for a few versions for players that fell slightly behind
+        if not self.roster_dirty:
+            return
+        self.roster_dirty = False
+
+        roster: Dict[str, Dict[str, Any]] = {
+            p.id: {"id": p.id, "name": p.name, "is_alive": p.is_alive}
+            for p in self.players.values()
+        }
+        changed = [entry for id, entry in roster.items() if self.roster.get(id) != entry]
+        removed = [id for id in self.roster if id not in roster]
+        self.roster = roster
+
+        if not changed and not removed:
+            return
 
-        state = {
-            "type": "game_state",
+        self.roster_patches.append(
+            Encoded(
+                {
+                    "type": "players_patch",
+                    "base": self.roster_version,
+                    "version": self.roster_version + 1,
+                    "changed": changed,
+                    "removed": removed,
+                }
+            )
+        )
+        self.roster_version += 1
+
+    def sync_player(self, player: Player) -> None:
+        sync = player.sync
+        if player.outbox.dropped != sync.drops:
+            # a dropped frame may have been a patch, so start over from a snapshot
+            sync.drops = player.outbox.dropped
+            sync.reset()
+
+        game_state = self.game_state_fields(player)
+        player_info = self.player_info_fields(player)
+        behind: int = self.roster_version - sync.roster_version
+
+        if (
+            sync.game_state is None
+            or sync.player_info is None
+            or behind > len(self.roster_patches)
+        ):
+            sync.version += 1
+            player.send_state(
+                {
+                    "type": "state_snapshot",
+                    "version": sync.version,
+                    "game_state": self.game_state_out(game_state),
+                    "player_info": player_info,
+                    "players": list(self.roster.values()),
+                    "roster_version": self.roster_version,
+                },
+                snapshot=True,
+            )
+        else:
+            for encoded in islice(
+                self.roster_patches, len(self.roster_patches) - behind, None
+            ):
+                player.send_encoded(encoded, STATE)
+
+            state_changes = diff(sync.game_state, game_state)
+            info_changes = diff(sync.player_info, player_info)
+            if state_changes or info_changes:
+                sync.version += 1
+                patch: Dict[str, Any] = {"type": "state_patch", "version": sync.version}
+                if state_changes:
+                    patch["game_state"] = self.game_state_out(state_changes)
+                if info_changes:
+                    patch["player_info"] = info_changes
+                player.send_state(patch)
+
+        sync.game_state = game_state
+        sync.player_info = player_info
+        sync.roster_version = self.roster_version
+
+    def game_state_fields(self, player: Player) -> Dict[str, Any]:
+        # the deadline rather than time_remaining is diffed, so the countdown alone
+        # never produces a patch
+        fields: Dict[str, Any] = self.public_fields()
+        fields["is_host"] = player.id == self.host
+        return fields
+
+    def public_fields(self) -> Dict[str, Any]:
+        return {
             "phase": self.phase.value,
-            "time_remaining": time_remaining,
+            "deadline": self.phase_timer
+            if self.phase in [GamePhase.NIGHT, GamePhase.DAY]
+            else 0,
             "game_result": self.game_result
             if self.phase == GamePhase.FINISHED
             else None,
-            "is_host": player.id == self.host,
+            "minimum_players": self.config.minimum_players,
+        }
+
+    def public_state(self, spectators: int) -> Dict[str, Any]:
+        # what a spectator sees: the state every player shares, without any
+        # player_info
+        self.publish_roster()
+        return {
+            "type": "spectator_state",
+            "game_state": self.game_state_out(self.public_fields()),
+            "players": list(self.roster.values()),
+            "spectators": spectators,
         }
-        await player.send(state)
 
-        player_info = {
-            "type": "player_info",
+    def game_state_out(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(fields)
+        if "deadline" in out:
+            deadline: float = out.pop("deadline")
+            out["time_remaining"] = (
+                max(0, int(deadline - self.clock())) if deadline > 0 else 0
+            )
+        return out
+
+    def player_info_fields(self, player: Player) -> Dict[str, Any]:
+        return {
             "id": player.id,
             "name": player.name,
             "role": player.role.name if player.role else None,
@@ -423,14 +697,6 @@ class Room:
             if self.phase == GamePhase.NIGHT
             else True,
             "is_host": player.id == self.host,
-            "has_voted": player.id in self.votes,
-            "has_acted": player.id in self.night_actions,
+            "has_voted": player.has_voted,
+            "has_acted": player.has_acted,
         }
-        await player.send(player_info)
-
-        alive_players = [
-            {"id": p.id, "name": p.name, "is_alive": p.is_alive}
-            for p in self.players.values()
-        ]
-        players_update = {"type": "players_update", "players": alive_players}
-        await player.send(players_update)
@@ -1,99 +1,581 @@
-import json
-import secrets
-import string
-from websockets import ServerConnection
-from websockets.asyncio.server import serve
-from typing import Dict, Any, Optional
+import asyncio
+import gc
+import signal
+import sqlite3
+import time
+from contextlib import AsyncExitStack
+from http import HTTPStatus
+from itertools import islice
+from websockets import CloseCode, ConnectionClosed, ServerConnection, Subprotocol
+from websockets.protocol import State
+from websockets.asyncio.client import ClientConnection, unix_connect
+from websockets.asyncio.server import Server, serve, unix_serve
+from websockets.exceptions import InvalidHandshake
+from websockets.http11 import Request, Response
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
 
+from codes import RoomCodeAllocator
+from compression import CompressionPolicy
+from config import RoomConfig, ServerConfig
+from dispatch import MessageError, Route
+from encoding import Codec, Encoded, codec_for, select_subprotocol
 from enums import GamePhase
+from lobby import Matchmaker, RoomIndex, Ticket
+from log import ContextLogger, MessageTracer, get_logger
+from messages import LOBBY_MESSAGES, ROOM_MESSAGES
+from metrics import (
+    BACKPRESSURE_PAUSES,
+    DRAINING,
+    EVICTED_ROOMS,
+    MATCH_QUEUE,
+    MEMORY_PRESSURE,
+    MESSAGES,
+    PLAYERS,
+    PUBLIC_ROOMS,
+    RATE_LIMITED,
+    REFUSED_CONNECTIONS,
+    REJECTED_MESSAGES,
+    RESIDENT_BYTES,
+    RESTORED_ROOMS,
+    ROOMS,
+    SPECTATORS,
+    serve_metrics,
+)
 
 from room import Room
 from player import Player
+from ratelimit import RateLimiter
+from reaper import RoomReaper, rss_bytes
+from shard import LocalRoomDirectory, RoomDirectory, shard_for
+from snapshot import SnapshotStore
+from spectate import Spectator, SpectatorFeed
 
 
 class MafiaServer:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        config: Optional[ServerConfig] = None,
+        shard: int = 0,
+        num_shards: int = 1,
+        directory: Optional[RoomDirectory] = None,
+        peers: Optional[List[str]] = None,
+    ) -> None:
+        self.config: ServerConfig = config or ServerConfig()
         self.rooms: Dict[str, Room] = {}
+        self.shard: int = shard
+        self.num_shards: int = num_shards
+        self.directory: RoomDirectory = directory or LocalRoomDirectory()
+        self.peers: List[str] = peers or []
+        self.room_codes: RoomCodeAllocator = RoomCodeAllocator(shard, num_shards)
+        # codes of this shard that sit in the snapshot store for another process,
+        # reserved so they are never issued here
+        self.stored_codes: Set[str] = set()
+        # resume token -> (room, player) for every seated player
+        self.sessions: Dict[str, Tuple[Room, Player]] = {}
+        self.compression: CompressionPolicy = self.config.compression_policy()
+        self.snapshots: Optional[SnapshotStore] = (
+            SnapshotStore(self.config.snapshot_path, self.config.snapshot_interval)
+            if self.config.snapshot_path
+            else None
+        )
+        # public rooms by phase, open seats and settings, and the quick-match
+        # queues that fill new public rooms
+        self.index: RoomIndex = RoomIndex(
+            self.config.listing_page_size, self.config.listing_cache_ttl
+        )
+        self.matchmaker: Matchmaker = Matchmaker(self.form_match, self.config.match_wait)
+        # least recently used order of rooms, for evicting idle ones
+        self.reaper: RoomReaper = RoomReaper(
+            self.config.idle_room_ttl,
+            self.config.finished_room_ttl,
+            self.config.abandoned_room_ttl,
+            self.config.max_memory_mb * 1024 * 1024,
+        )
+        self.draining: bool = False
+        self.drainer: Optional[asyncio.Task[None]] = None
+        self.stopping: asyncio.Event = asyncio.Event()
+        self.log: ContextLogger = get_logger("server", shard=shard)
+        self.tracer: MessageTracer = MessageTracer()
+        ROOMS.set_function(lambda: len(self.rooms))
+        PUBLIC_ROOMS.set_function(lambda: len(self.index))
+        MATCH_QUEUE.set_function(lambda: len(self.matchmaker))
+        RESIDENT_BYTES.set_function(rss_bytes)
+
+    def trace_room(self, room_code: str, enabled: bool = True) -> None:
+        self.tracer.trace_room(room_code.upper(), enabled)
 
-    async def error(self, websocket: ServerConnection, message: str) -> None:
+    def create_player(self, websocket: ServerConnection, name: str) -> Player:
+        PLAYERS.inc()
+        return self.new_player(websocket, name)
+
+    def new_player(self, websocket: Optional[ServerConnection], name: str) -> Player:
+        return Player(
+            websocket,
+            name[:20],
+            self.config.send_queue_size,
+            self.config.send_timeout,
+            self.config.overflow_policy,
+            self.config.player_limits,
+            self.config.batch_size,
+            self.config.batch_window,
+        )
+
+    async def error(
+        self, websocket: ServerConnection, message: str, code: str = "error"
+    ) -> None:
         event: Dict[str, Any] = {
             "type": "error",
+            "code": code,
             "message": message,
         }
-        await websocket.send(json.dumps(event))
+        await self.send_direct(websocket, event)
+
+    async def send_direct(
+        self, websocket: ServerConnection, event: Dict[str, Any]
+    ) -> None:
+        # for connections without a seat, and so without an outbox
+        codec: Codec = codec_for(websocket.subprotocol)
+        await websocket.send(codec.encode(event), text=codec.text)
+
+    async def send_shared(self, websocket: ServerConnection, encoded: Encoded) -> None:
+        codec: Codec = codec_for(websocket.subprotocol)
+        await websocket.send(encoded.frame(codec), text=codec.text)
+
+    def parse(self, websocket: ServerConnection, message: Union[str, bytes]) -> Any:
+        try:
+            return codec_for(websocket.subprotocol).decode(message)
+        except ValueError:
+            raise MessageError("invalid_message", "Malformed message.")
 
     async def play(
         self, websocket: ServerConnection, room: Room, player: Player
-    ) -> None:
+    ) -> bool:
+        # returns True when the player left for good rather than dropping
+        log: ContextLogger = self.log.bind(room=room.room_code, player=player.name)
         try:
             async for message in websocket:
-                print(f"Player {player.name} sent: {message}")
-                event: Dict[str, Any] = json.loads(message)
-
-                if event["type"] == "vote":
-                    target_id: str = event["target"]
-                    await room.vote(player.id, target_id)
-                elif event["type"] == "night_action":
-                    target_id: str = event["target"]
-                    await room.night_action(player.id, target_id)
-                elif event["type"] == "chat":
-                    message_text: str = event["message"]
-                    await room.send_chat(player.id, message_text)
-                elif event["type"] == "start_game":
-                    await room.start_game(player.id)
-                elif event["type"] == "replay_game":
-                    await room.play_again(player.id)
-                elif event["type"] == "disband_room":
-                    room_disbanded: bool = await room.disband_room(player.id)
-                    if room_disbanded:
-                        if room.room_code and room.room_code in self.rooms:
-                            del self.rooms[room.room_code]
-                        break
+                if self.tracer.active:
+                    self.tracer.trace(room.room_code, player.name, message)
+                try:
+                    event: Any = self.parse(websocket, message)
+                    message_type: str = ROOM_MESSAGES.label(event)
+                    if not await self.admit(room, player, message_type):
+                        continue
+                    self.reaper.touch(room.room_code)
+                    route: Route = ROOM_MESSAGES.lookup(event)
+                    if await ROOM_MESSAGES.dispatch(
+                        message_type, route, self, room, player, event
+                    ):
+                        return True
+                    if route.sync:
+                        await room.send_player_state(player)
+                except MessageError as e:
+                    REJECTED_MESSAGES.inc(1, e.code)
+                    if e.code == "unknown_type":
+                        MESSAGES.inc(1, "unknown")
+                    await player.send(e.event())
 
-                await room.send_player_state(player)
+                if player.outbox.congested:
+                    # stop reading until the client catches up; the websocket's own
+                    # inbound queue then fills and TCP pushes back on the sender
+                    BACKPRESSURE_PAUSES.inc()
+                    await player.outbox.wait_for_space()
+        except ConnectionClosed:
+            # a dropped client or our own 1012 on shutdown; not worth a warning
+            pass
         except Exception as e:
-            print(f"Error: {e}")
+            log.warning("error handling message", fields={"error": str(e)})
+        return False
 
-    async def new_room(self, websocket: ServerConnection, name: str) -> None:
-        room_code: str = "".join(
-            secrets.choice(string.ascii_uppercase + string.digits) for _ in range(4)
+    async def admit(self, room: Room, player: Player, message_type: str) -> bool:
+        if player.limiter.allow(message_type) and room.limiter.allow(message_type):
+            player.throttled = False
+            return True
+        RATE_LIMITED.inc(1, message_type)
+        if not player.throttled:
+            # one notice per burst rather than an error for every dropped message
+            player.throttled = True
+            await player.send(MessageError("rate_limited", "Slow down.").event())
+        return False
+
+    async def session(
+        self, websocket: ServerConnection, room: Room, player: Player
+    ) -> None:
+        left: bool = False
+        try:
+            left = await self.play(websocket, room, player)
+        finally:
+            await self.disconnected(websocket, room, player, left)
+
+    async def disconnected(
+        self, websocket: ServerConnection, room: Room, player: Player, left: bool
+    ) -> None:
+        if player.websocket is not websocket:
+            return  # the seat was already taken over by a resumed connection
+        await player.close()
+
+        if (
+            left
+            or self.rooms.get(room.room_code) is not room
+            or self.config.resume_grace <= 0
+        ):
+            await self.leave(room, player)
+        else:
+            # keep the seat for a while in case the client comes back
+            player.expiry = asyncio.create_task(self.expire(room, player))
+
+    async def expire(self, room: Room, player: Player) -> None:
+        await asyncio.sleep(self.config.resume_grace)
+        player.expiry = None
+        await self.leave(room, player)
+
+    async def leave(self, room: Room, player: Player) -> None:
+        if self.sessions.pop(player.token, None) is None:
+            return
+        room.remove_player(player.id)
+        PLAYERS.dec()
+        if self.rooms.get(room.room_code) is not room:
+            return  # disbanded while the player was away
+        if len(room.players) == 0:
+            self.close_room(room.room_code)
+            return
+        await room.broadcast(
+            {
+                "type": "player_left",
+                "message": f"{player.name} left the room.",
+            }
         )
-        room: Room = Room(room_code)
-        self.rooms[room_code] = room
-        print(f"Created room {room_code}")
+        await room.broadcast_game_state()
 
-        player: Player = Player(websocket, name[:20])
-        room.add_player(player)
+    async def resume(
+        self, websocket: ServerConnection, room_code: str, token: str, last_seq: int
+    ) -> bool:
+        found: Optional[Tuple[Room, Player]] = self.sessions.get(token)
+        if found is None and await self.adopt_room(room_code.upper()) is not None:
+            found = self.sessions.get(token)
+        if found is None or self.rooms.get(found[0].room_code) is not found[0]:
+            await self.error(websocket, "Session expired.", "session_expired")
+            return False
+        room, player = found
+        self.reaper.touch(room.room_code)
 
-        try:
-            event: Dict[str, Any] = {
-                "type": "room_created",
-                "room_code": room_code,
+        if player.expiry is not None:
+            player.expiry.cancel()
+            player.expiry = None
+        old: ServerConnection = player.websocket
+        player.rebind(websocket)
+        if old is not None and old is not websocket:
+            # a half-open old connection the server had not noticed yet
+            await old.close(1000, "resumed elsewhere")
+
+        await player.send(
+            {
+                "type": "resumed",
+                "room_code": room.room_code,
                 "player_id": player.id,
+                "resume_token": player.token,
             }
-            await websocket.send(json.dumps(event))
-            await room.send_player_state(player)
-            await self.play(websocket, room, player)
-        finally:
-            room.remove_player(player.id)
-            if len(room.players) == 0:
-                del self.rooms[room_code]
+        )
+        replayed: int = room.replay(player, last_seq)
+        self.log.info(
+            "session resumed",
+            fields={"room": room.room_code, "player": player.name, "replayed": replayed},
+        )
+        await room.send_player_state(player)
+        await self.session(websocket, room, player)
+        return True
+
+    def allocate_room_code(self) -> str:
+        room_code: str = self.room_codes.allocate()
+        # the keyspace is partitioned per shard, so a failed claim only happens when
+        # the directory holds a stale entry from a previous worker
+        while not self.directory.claim(room_code, self.shard):
+            room_code = self.room_codes.allocate()
+        return room_code
+
+    def close_room(self, room_code: str) -> None:
+        room: Optional[Room] = self.rooms.pop(room_code, None)
+        if room is not None:
+            self.directory.release(room_code)
+            self.room_codes.release(room_code)
+            self.index.remove(room_code)
+            self.reaper.forget(room_code)
+            if self.snapshots is not None:
+                self.snapshots.discard(room_code)
+            if room.feed is not None:
+                room.feed.closer = asyncio.create_task(room.feed.close())
+
+    async def adopt(self, snapshots: SnapshotStore, room_codes: List[str]) -> int:
+        # warm start and restart hand-off: rooms saved by a process that is gone
+        # come back with every player disconnected and holding their seat for
+        # the resume grace
+        mine: List[str] = [
+            room_code
+            for room_code in room_codes
+            if room_code not in self.rooms
+            and shard_for(room_code, self.num_shards) == self.shard
+        ]
+        if not mine:
+            return 0
+        restored: int = 0
+        for room_code, data in await snapshots.claim(mine):
+            if data is None:
+                snapshots.discard(room_code)
+                continue
+            try:
+                room: Room = Room.restore(
+                    data,
+                    self.config.room_limits,
+                    lambda name: self.new_player(None, name),
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                self.log.warning(
+                    "snapshot not restored", fields={"room": room_code, "error": str(e)}
+                )
+                snapshots.discard(room_code)
+                continue
+            if not self.directory.claim(room_code, self.shard):
+                # served elsewhere after all; leave the row for its owner
+                try:
+                    await snapshots.unclaim(room_code)
+                except sqlite3.Error as e:
+                    self.log.warning(
+                        "snapshot not released",
+                        fields={"room": room_code, "error": str(e)},
+                    )
+                continue
+
+            self.room_codes.reserve(room_code)
+            self.rooms[room_code] = room
+            self.reaper.touch(room_code)
+            if room.public:
+                room.index = self.index
+                self.index.add(room)
+            for player in room.players.values():
+                PLAYERS.inc()
+                self.sessions[player.token] = (room, player)
+                player.expiry = asyncio.create_task(self.expire(room, player))
+            room.resume_game()
+            restored += 1
+        RESTORED_ROOMS.inc(restored)
+        self.log.info("rooms restored", fields={"rooms": restored})
+        return restored
+
+    async def reserve_stored(self, snapshots: SnapshotStore) -> None:
+        # during a restart the old server still holds its rooms, and any code in
+        # the store may yet be adopted, so neither may be handed out here
+        stored: Set[str] = {
+            room_code
+            for room_code in await snapshots.stored()
+            if room_code not in self.rooms
+            and shard_for(room_code, self.num_shards) == self.shard
+        }
+        for room_code in stored - self.stored_codes:
+            self.room_codes.reserve(room_code)
+        for room_code in self.stored_codes - stored:
+            if room_code not in self.rooms:
+                self.room_codes.release(room_code)
+        self.stored_codes = stored
+
+    async def adopt_room(self, room_code: str) -> Optional[Room]:
+        # a room this process does not hold may still be waiting in the
+        # snapshot store, or be on its way there from a draining server
+        if self.snapshots is None:
+            return None
+        await self.adopt(self.snapshots, [room_code])
+        room: Optional[Room] = self.rooms.get(room_code)
+        if room is None and await self.snapshots.held(room_code):
+            raise MessageError("room_moving", "Room is moving to a new server.")
+        return room
+
+    async def evict(self, room: Room, reason: str) -> None:
+        if room.game_task is not None and not room.game_task.done():
+            room.game_task.cancel()
+        await room.broadcast(
+            {
+                "type": "room_disbanded",
+                "message": "The room was closed after a period of inactivity",
+            }
+        )
+        self.close_room(room.room_code)
+        EVICTED_ROOMS.inc(1, reason)
+        self.log.info("room evicted", fields={"room": room.room_code, "reason": reason})
+        await self.dismiss(room)
+
+    async def dismiss(self, room: Room, keep: Optional[Player] = None) -> None:
+        # after a room has closed: frees the seats still in it and ends their
+        # connections, which otherwise stay bound to the closed room; clients
+        # reconnect to the lobby
+        async def release(player: Player) -> None:
+            if player.expiry is not None:
+                player.expiry.cancel()
+                player.expiry = None
+            websocket: Optional[ServerConnection] = player.websocket
+            await self.leave(room, player)
+            if websocket is not None:
+                await player.close()
+                await websocket.close(1000, "room closed")
+
+        await asyncio.gather(
+            *(release(p) for p in list(room.players.values()) if p is not keep)
+        )
+
+    async def reap(self) -> None:
+        for room, reason in self.reaper.expired(self.rooms):
+            await self.evict(room, reason)
+
+        MEMORY_PRESSURE.set(int(self.reaper.check_memory()))
+        if self.reaper.pressure:
+            # no new rooms until memory is back under the limit (server_full),
+            # and the lobbies unused the longest make room for running games
+            shed = list(
+                islice(
+                    self.reaper.idle_lobbies(self.rooms, self.config.reap_interval),
+                    self.config.shed_batch,
+                )
+            )
+            for room in shed:
+                await self.evict(room, "memory")
+            self.log.warning(
+                "memory pressure", fields={"rss": rss_bytes(), "shed": len(shed)}
+            )
+            if shed:
+                gc.collect()
+
+    async def keep_reaping(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                self.log.warning("reaping failed", fields={"error": str(e)})
+
+    async def keep_snapshots(self, snapshots: SnapshotStore) -> None:
+        while True:
+            await asyncio.sleep(snapshots.interval)
+            try:
+                await snapshots.save(self.rooms)
+                await self.adopt(snapshots, await snapshots.orphans())
+                await self.reserve_stored(snapshots)
+            except Exception as e:
+                # the next pass tries again, and saves the heartbeat with it
+                self.log.warning("snapshot pass failed", fields={"error": str(e)})
+
+    def games_in_progress(self) -> int:
+        return sum(
+            room.phase in (GamePhase.NIGHT, GamePhase.DAY)
+            for room in self.rooms.values()
+        )
+
+    def drain(self, server: Server, reuse_port: bool) -> None:
+        # the first SIGTERM stops new rooms and games and lets the running ones
+        # finish; a second one stops straight away
+        if self.draining:
+            self.stopping.set()
+            return
+        self.draining = True
+        DRAINING.set(1)
+        self.log.info(
+            "draining",
+            fields={"rooms": len(self.rooms), "games": self.games_in_progress()},
+        )
+        if reuse_port:
+            # a successor on the same port takes every new connection from here
+            server.server.close()
+        self.drainer = asyncio.create_task(self.finish_games())
+
+    async def finish_games(self) -> None:
+        deadline: float = time.monotonic() + self.config.drain_timeout
+        while self.games_in_progress() and time.monotonic() < deadline:
+            await asyncio.sleep(1.0)
+        self.log.info(
+            "drained",
+            fields={"rooms": len(self.rooms), "games": self.games_in_progress()},
+        )
+        self.stopping.set()
+
+    def server_full(self, rooms: int = 0) -> bool:
+        # per worker caps from the config; 0 leaves a cap off. no new rooms
+        # open while the process is over its memory limit
+        config: ServerConfig = self.config
+        if rooms and self.reaper.pressure:
+            return True
+        if config.max_rooms and len(self.rooms) + rooms > config.max_rooms:
+            return True
+        return bool(config.max_players) and len(self.sessions) >= config.max_players
+
+    def open_room(self, config: RoomConfig, public: bool) -> Room:
+        room_code: str = self.allocate_room_code()
+        room: Room = Room(room_code, config, self.config.room_limits)
+        self.rooms[room_code] = room
+        self.reaper.touch(room_code)
+        if public:
+            room.public = True
+            room.index = self.index
+            self.index.add(room)
+        self.log.info("room created", fields={"room": room_code, "public": public})
+        return room
+
+    async def new_room(
+        self,
+        websocket: ServerConnection,
+        name: str,
+        config: RoomConfig,
+        public: bool = False,
+    ) -> bool:
+        if self.draining:
+            await self.error(websocket, "Server is restarting.", "draining")
+            return False
+
+        if self.server_full(rooms=1):
+            await self.error(websocket, "Server is full.", "server_full")
+            return False
+
+        room: Room = self.open_room(config, public)
+        room_code: str = room.room_code
+
+        player: Player = self.create_player(websocket, name)
+        room.add_player(player)
+        self.sessions[player.token] = (room, player)
+
+        event: Dict[str, Any] = {
+            "type": "room_created",
+            "room_code": room_code,
+            "player_id": player.id,
+            "resume_token": player.token,
+        }
+        await player.send(event)
+        await room.send_player_state(player)
+        await self.session(websocket, room, player)
+        return True
 
     async def join_room(
         self, websocket: ServerConnection, room_code: str, name: str
     ) -> bool:
-        try:
-            room: Room = self.rooms[room_code.upper()]
-        except KeyError:
-            await self.error(websocket, "Game not found.")
+        room_code = room_code.upper()
+        room: Optional[Room] = self.rooms.get(room_code) or await self.adopt_room(
+            room_code
+        )
+        if room is None:
+            await self.error(websocket, "Game not found.", "not_found")
             return False
 
         if room.phase != GamePhase.WAITING:
-            await self.error(websocket, "Game in progress.")
+            await self.error(websocket, "Game in progress.", "in_progress")
+            return False
+
+        if len(room.players) >= room.config.maximum_players:
+            await self.error(websocket, "Room is full.", "room_full")
+            return False
+
+        if self.server_full():
+            await self.error(websocket, "Server is full.", "server_full")
             return False
 
-        player: Player = Player(websocket, name[:20])
+        player: Player = self.create_player(websocket, name)
         room.add_player(player)
+        self.sessions[player.token] = (room, player)
+        self.reaper.touch(room_code)
 
         await room.broadcast(
             {
@@ -102,51 +584,323 @@ class MafiaServer:
             }
         )
 
+        event: Dict[str, Any] = {
+            "type": "room_joined",
+            "room_code": room_code,
+            "player_id": player.id,
+            "resume_token": player.token,
+        }
+        await player.send(event)
+        await room.broadcast_game_state()
+        await self.session(websocket, room, player)
+        return True
+
+    async def list_rooms(
+        self,
+        websocket: ServerConnection,
+        phase: Optional[str],
+        min_seats: int,
+        settings: Dict[str, int],
+        page: int,
+    ) -> None:
+        # public rooms on this worker; joining one by its code works from any
+        await self.send_shared(
+            websocket, self.index.page(phase, min_seats, settings, page)
+        )
+
+    async def quick_match(
+        self, websocket: ServerConnection, name: str, config: RoomConfig
+    ) -> bool:
+        # waits in the queue for rooms with these settings until a room forms,
+        # the client sends anything (such as leave_queue) or it disconnects
+        if self.draining:
+            await self.error(websocket, "Server is restarting.", "draining")
+            return False
+
+        ticket: Ticket = Ticket(websocket, name)
+        waiting: int = self.matchmaker.enqueue(ticket, config)
+        await self.send_direct(
+            websocket,
+            {
+                "type": "queued",
+                "position": waiting,
+                "minimum_players": config.minimum_players,
+            },
+        )
+
+        reader: asyncio.Task[None] = asyncio.create_task(self.next_message(websocket))
         try:
-            event: Dict[str, Any] = {
-                "type": "room_joined",
-                "room_code": room_code,
-                "player_id": player.id,
-            }
-            await websocket.send(json.dumps(event))
-            await room.broadcast_game_state()
-            await self.play(websocket, room, player)
+            await asyncio.wait(
+                [ticket.matched, reader], return_when=asyncio.FIRST_COMPLETED
+            )
         finally:
-            room.remove_player(player.id)
-            if len(room.players) > 0:
-                await room.broadcast(
-                    {
-                        "type": "player_left",
-                        "message": f"{player.name} left the room.",
-                    }
-                )
-                await room.broadcast_game_state()
+            # websockets allows one reader at a time, so the session can only
+            # start reading once this one is gone
+            reader.cancel()
+            await asyncio.wait([reader])
+        # dropped from the queue by a release that found the connection closing
+        dropped: bool = ticket.matched.cancelled()
+        if dropped or (
+            not ticket.matched.done() and self.matchmaker.cancel(ticket, config)
+        ):
+            if websocket.state is not State.OPEN:
+                return True
+            await self.send_direct(websocket, {"type": "queue_left"})
+            return False
+
+        # matched, possibly just as the client left; the session notices that
+        room, player = await ticket.matched
+        await self.session(websocket, room, player)
         return True
 
+    async def next_message(self, websocket: ServerConnection) -> None:
+        try:
+            await websocket.recv()
+        except ConnectionClosed:
+            pass
+
+    async def form_match(self, config: RoomConfig, tickets: List[Ticket]) -> None:
+        # a public room for a batch from the quick-match queue, started at once
+        error: Optional[MessageError] = None
+        if self.draining:
+            error = MessageError("draining", "Server is restarting.")
+        elif self.server_full(rooms=1):
+            error = MessageError("server_full", "Server is full.")
+        if error is not None:
+            for ticket in tickets:
+                ticket.matched.set_exception(error)
+            return
+
+        room: Room = self.open_room(config, public=True)
+        seated: List[Tuple[Ticket, Player]] = []
+        for ticket in tickets:
+            player: Player = self.create_player(ticket.websocket, ticket.name)
+            room.add_player(player)
+            self.sessions[player.token] = (room, player)
+            seated.append((ticket, player))
+            await player.send(
+                {
+                    "type": "room_joined",
+                    "room_code": room.room_code,
+                    "player_id": player.id,
+                    "resume_token": player.token,
+                }
+            )
+        for ticket, player in seated:
+            ticket.matched.set_result((room, player))
+        self.log.info(
+            "match formed", fields={"room": room.room_code, "players": len(seated)}
+        )
+        await room.start_game(room.host)
+
+    async def spectate(self, websocket: ServerConnection, room_code: str) -> bool:
+        # spectators may watch any room in any phase; they never take a seat
+        room_code = room_code.upper()
+        room: Optional[Room] = self.rooms.get(room_code) or await self.adopt_room(
+            room_code
+        )
+        if room is None:
+            await self.error(websocket, "Game not found.", "not_found")
+            return False
+
+        watching: int = len(room.feed.spectators) if room.feed is not None else 0
+        if watching >= self.config.max_spectators:
+            await self.error(websocket, "Too many spectators.", "spectators_full")
+            return False
+
+        if room.feed is None:
+            room.feed = SpectatorFeed(room, self.config.spectator_interval)
+        feed: SpectatorFeed = room.feed
+        spectator: Spectator = Spectator(
+            websocket, self.config.spectator_queue, self.config.send_timeout
+        )
+        feed.add(spectator)
+        SPECTATORS.inc()
+        try:
+            async for _ in websocket:
+                pass  # read only; anything a spectator sends is ignored
+        except ConnectionClosed:
+            pass
+        finally:
+            feed.remove(spectator)
+            SPECTATORS.dec()
+            if not feed.spectators and room.feed is feed:
+                # the last one out takes the feed with it
+                feed.stop()
+                room.feed = None
+            await spectator.outbox.close()
+        return True
+
+    def refuse(
+        self, connection: ServerConnection, request: Request
+    ) -> Optional[Response]:
+        # turns a handshake away once this worker holds max_connections; the
+        # connection being handshaked already has its handler task
+        limit: int = self.config.max_connections
+        if limit and len(connection.server.handler_tasks) > limit:
+            REFUSED_CONNECTIONS.inc()
+            return connection.respond(
+                HTTPStatus.SERVICE_UNAVAILABLE, "Server is full.\n"
+            )
+        return None
+
     async def handler(self, websocket: ServerConnection) -> None:
+        # lobby messages are limited per connection, as seated ones are per player
+        limiter: RateLimiter = RateLimiter(self.config.lobby_limits)
+        throttled: bool = False
         try:
             async for message in websocket:
-                print(f"Received message: {message}")
-                event: Dict[str, Any] = json.loads(message)
-
-                if event["type"] == "new_room":
-                    name: Optional[str] = event.get("name")
-                    if name:
-                        print(f"Creating new room for {name}")
-                        await self.new_room(websocket, name)
+                if self.tracer.active:
+                    self.tracer.trace("", "", message)
+                try:
+                    event: Any = self.parse(websocket, message)
+                    message_type: str = LOBBY_MESSAGES.label(event)
+                    if not limiter.allow(message_type):
+                        RATE_LIMITED.inc(1, message_type)
+                        if not throttled:
+                            # one notice per burst, as for seated players
+                            throttled = True
+                            await self.send_direct(
+                                websocket,
+                                MessageError("rate_limited", "Slow down.").event(),
+                            )
+                        continue
+                    throttled = False
+                    route: Route = LOBBY_MESSAGES.lookup(event)
+                    if await LOBBY_MESSAGES.dispatch(
+                        event["type"], route, self, websocket, message, event
+                    ):
                         break
-                elif event["type"] == "join_room":
-                    room_code: str = event["room_code"]
-                    name: Optional[str] = event.get("name")
-                    if name:
-                        print(f"Joining room {room_code} for {name}")
-                        success: bool = await self.join_room(websocket, room_code, name)
-                        if success:
-                            break
+                except MessageError as e:
+                    await self.send_direct(websocket, e.event())
+        except ConnectionClosed:
+            pass
         except Exception as e:
-            print(f"Error: {e}")
+            self.log.warning("error handling message", fields={"error": str(e)})
+
+    def trace_route(self, query: Dict[str, str]) -> str:
+        # GET /trace?room=ABCD&enabled=0 on the metrics port
+        room_code: str = query.get("room", "")
+        enabled: bool = query.get("enabled", "1") not in ("0", "false")
+        self.trace_room(room_code, enabled)
+        return f"tracing {'on' if enabled else 'off'} for {room_code.upper()}\n"
+
+    def owner_of(self, room_code: str) -> Optional[int]:
+        # the shard holding a room that is not on this one, if any
+        room_code = room_code.upper()
+        if self.num_shards == 1 or room_code in self.rooms:
+            return None
+        owner: Optional[int] = self.directory.lookup(room_code)
+        if owner is None and self.snapshots is not None:
+            # a room still in the snapshot store is adopted by the shard its
+            # code maps to
+            try:
+                owner = shard_for(room_code, self.num_shards)
+            except ValueError:
+                return None
+        if owner is None or owner == self.shard:
+            return None
+        return owner
+
+    async def forward(
+        self, websocket: ServerConnection, message: Union[str, bytes], shard: int
+    ) -> None:
+        # hand the connection off by relaying it to the owning worker's unix socket
+        async def pump(
+            source: Union[ServerConnection, ClientConnection],
+            target: Union[ServerConnection, ClientConnection],
+        ) -> None:
+            async for frame in source:
+                await target.send(frame)
+
+        # the peer decodes with whatever codec the client negotiated here
+        subprotocols: Optional[List[Subprotocol]] = (
+            [websocket.subprotocol] if websocket.subprotocol else None
+        )
+        try:
+            upstream: ClientConnection = await unix_connect(
+                self.peers[shard], subprotocols=subprotocols, compression=None
+            )
+        except (OSError, InvalidHandshake) as e:
+            # the owner is restarting or gone; the client stays in the lobby
+            # and can retry once the room is adopted elsewhere
+            self.log.warning(
+                "forwarding failed", fields={"shard": shard, "error": str(e)}
+            )
+            raise MessageError("room_moving", "Room is moving to a new server.")
+        async with upstream:
+            await upstream.send(message)
+            tasks = [
+                asyncio.create_task(pump(websocket, upstream)),
+                asyncio.create_task(pump(upstream, websocket)),
+            ]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
 
-    async def start(self) -> None:
-        async with serve(self.handler, "", 8081) as server:
-            print("Running on port 8081")
-            await server.serve_forever()
+    async def start(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        reuse_port: bool = False,
+        unix_path: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+    ) -> None:
+        host = self.config.host if host is None else host
+        port = self.config.port if port is None else port
+        reuse_port = reuse_port or self.config.reuse_port
+        async with AsyncExitStack() as stack:
+            if self.snapshots is not None:
+                await self.adopt(self.snapshots, await self.snapshots.orphans())
+                await self.reserve_stored(self.snapshots)
+                # closed after the saver is cancelled, for one last save
+                stack.push_async_callback(self.snapshots.close, self.rooms)
+                saver = asyncio.create_task(self.keep_snapshots(self.snapshots))
+                stack.callback(saver.cancel)
+            reaper = asyncio.create_task(self.keep_reaping())
+            stack.callback(reaper.cancel)
+            server = await stack.enter_async_context(
+                serve(
+                    self.handler,
+                    host,
+                    port,
+                    reuse_port=reuse_port,
+                    select_subprotocol=select_subprotocol,
+                    process_request=self.refuse,
+                    compression=None,
+                    extensions=self.compression.extensions(),
+                    max_size=self.config.max_frame_size,
+                    max_queue=self.config.inbound_queue,
+                )
+            )
+            if unix_path is not None:
+                # peer workers relay joins for rooms owned by this shard here
+                await stack.enter_async_context(
+                    unix_serve(
+                        self.handler,
+                        unix_path,
+                        select_subprotocol=select_subprotocol,
+                        # relayed frames are already compressed, or not, by the
+                        # worker the client is connected to
+                        compression=None,
+                        max_size=self.config.max_frame_size,
+                        max_queue=self.config.inbound_queue,
+                    )
+                )
+            if metrics_port is not None:
+                metrics = await serve_metrics(
+                    port=metrics_port, routes={"/trace": self.trace_route}
+                )
+                stack.push_async_callback(metrics.wait_closed)
+                stack.callback(metrics.close)
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(signal.SIGTERM, self.drain, server, reuse_port)
+            stack.callback(loop.remove_signal_handler, signal.SIGTERM)
+            self.log.info("listening", fields={"port": port})
+            await self.stopping.wait()
+            # clients reconnect and resume, here after a warm restart or on
+            # whichever server took the rooms over
+            server.close(code=CloseCode.SERVICE_RESTART, reason="server restarting")
+            await server.wait_closed()
@@ -0,0 +1,133 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, List, MutableMapping, Optional
+
+from codes import decode_code
+from config import ServerConfig
+from log import get_logger, setup_logging
+
+log = get_logger("shard")
+
+
+def shard_for(room_code: str, num_shards: int) -> int:
+    # matches the keyspace partitioning in RoomCodeAllocator
+    return decode_code(room_code) % num_shards
+
+
+class RoomDirectory(ABC):
+    # which shard owns which live room; the seam for an external shared store
+    @abstractmethod
+    def claim(self, room_code: str, shard: int) -> bool:
+        pass
+
+    @abstractmethod
+    def release(self, room_code: str) -> None:
+        pass
+
+    @abstractmethod
+    def lookup(self, room_code: str) -> Optional[int]:
+        pass
+
+
+class LocalRoomDirectory(RoomDirectory):
+    # a plain dict for a single process, or a multiprocessing.Manager dict to
+    # share one directory between the workers on a single box
+    def __init__(self, rooms: Optional[MutableMapping[str, int]] = None) -> None:
+        self.rooms: MutableMapping[str, int] = rooms if rooms is not None else {}
+
+    def claim(self, room_code: str, shard: int) -> bool:
+        if room_code in self.rooms:
+            return False
+        # setdefault is a single call on a manager proxy, so two workers racing
+        # for the same code cannot both win
+        return self.rooms.setdefault(room_code, shard) == shard
+
+    def release(self, room_code: str) -> None:
+        self.rooms.pop(room_code, None)
+
+    def lookup(self, room_code: str) -> Optional[int]:
+        return self.rooms.get(room_code)
+
+
+def socket_path(socket_dir: str, shard: int) -> str:
+    return os.path.join(socket_dir, f"shard-{shard}.sock")
+
+
+def run_worker(
+    shard: int,
+    num_shards: int,
+    socket_dir: str,
+    rooms: MutableMapping[str, int],
+    config: ServerConfig,
+) -> None:
+    from server import MafiaServer
+
+    setup_logging(config.log_level)
+    peers: List[str] = [socket_path(socket_dir, i) for i in range(num_shards)]
+    server = MafiaServer(
+        config,
+        shard=shard,
+        num_shards=num_shards,
+        directory=LocalRoomDirectory(rooms),
+        peers=peers,
+    )
+    server.tracer.set_sample_rate(config.trace_sample_rate)
+    metrics_port: Optional[int] = config.metrics_port
+    try:
+        asyncio.run(
+            server.start(
+                reuse_port=True,
+                unix_path=peers[shard],
+                metrics_port=metrics_port + shard if metrics_port else None,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def run_sharded(config: ServerConfig) -> None:
+    # every worker listens on the same port with SO_REUSEPORT and on its own unix
+    # socket; a join that lands on the wrong worker is proxied to the owner.
+    # workers allocate codes from disjoint slices of the keyspace
+    num_shards: int = config.workers
+    context = multiprocessing.get_context("spawn")
+    socket_dir: str = tempfile.mkdtemp(prefix="mafia-")
+
+    with context.Manager() as manager:
+        rooms = manager.dict()
+        workers = [
+            context.Process(
+                target=run_worker,
+                args=(shard, num_shards, socket_dir, rooms, config),
+                name=f"mafia-shard-{shard}",
+            )
+            for shard in range(num_shards)
+        ]
+        for worker in workers:
+            worker.start()
+
+        def drain(signum: int, frame: Any) -> None:
+            # passed on, so every worker drains while the supervisor waits
+            for worker in workers:
+                if worker.pid is not None:
+                    os.kill(worker.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, drain)
+
+        log.info(
+            "workers started", fields={"workers": num_shards, "port": config.port}
+        )
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.join()
+        finally:
+            shutil.rmtree(socket_dir, ignore_errors=True)
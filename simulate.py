@@ -0,0 +1,303 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from config import RoomConfig
+from engine import MAFIA_WINS, TOWN_WINS, GameEngine, Seat, VirtualClock
+from enums import GamePhase
+from roles import Detective, Doctor, Mafia
+
+# plays seeded games headless on a virtual clock, with bots in place of
+# clients, and reports how often each side wins:
+#   python simulate.py --games 100000 --players 6-12 --policy scripted
+
+# games, town wins, mafia wins, unfinished, days, virtual seconds
+Tally = List[float]
+Results = Dict[Tuple[int, str], Tally]
+
+
+class RandomPolicy:
+    # every bot picks uniformly among the living; mafia never target their own
+    __slots__ = ("engine", "rng")
+
+    def __init__(self, engine: GameEngine[Seat], rng: random.Random) -> None:
+        self.engine: GameEngine[Seat] = engine
+        self.rng: random.Random = rng
+
+    def living(self, seat: Seat, town_only: bool = False) -> List[Seat]:
+        return [
+            other
+            for other in self.engine.players.values()
+            if other.is_alive
+            and other is not seat
+            and not (town_only and isinstance(other.role, Mafia))
+        ]
+
+    def new_phase(self) -> None:
+        pass
+
+    def night_target(self, seat: Seat) -> Optional[Seat]:
+        targets: List[Seat] = self.living(seat, isinstance(seat.role, Mafia))
+        return self.rng.choice(targets) if targets else None
+
+    def vote_target(self, seat: Seat) -> Optional[Seat]:
+        return self.night_target(seat)
+
+    def learn(self, seat: Seat, target: Seat) -> None:
+        # what the detective found out about target
+        pass
+
+
+class ScriptedPolicy(RandomPolicy):
+    # plays the game the way people tend to: the mafia agree on one victim,
+    # the detective reveals the first mafia it finds and the town votes it out,
+    # after which the mafia go after the detective and the doctor guards it
+    __slots__ = ("kill", "suspects", "revealed")
+
+    def __init__(self, engine: GameEngine[Seat], rng: random.Random) -> None:
+        super().__init__(engine, rng)
+        self.kill: Optional[Seat] = None
+        self.suspects: List[Seat] = []
+        self.revealed: Optional[Seat] = None
+
+    def new_phase(self) -> None:
+        self.kill = None
+        self.suspects = [seat for seat in self.suspects if seat.is_alive]
+        if self.revealed is not None and not self.revealed.is_alive:
+            self.revealed = None
+
+    def night_target(self, seat: Seat) -> Optional[Seat]:
+        if isinstance(seat.role, Mafia):
+            if self.kill is None or not self.kill.is_alive:
+                self.kill = self.revealed or super().night_target(seat)
+            return self.kill
+        if isinstance(seat.role, Doctor) and self.revealed is not None:
+            return self.revealed
+        return super().night_target(seat)
+
+    def vote_target(self, seat: Seat) -> Optional[Seat]:
+        if isinstance(seat.role, Mafia):
+            if self.revealed is not None:
+                return self.revealed
+            return super().night_target(seat)
+        if self.suspects and self.suspects[0] is not seat:
+            return self.suspects[0]
+        return super().vote_target(seat)
+
+    def learn(self, seat: Seat, target: Seat) -> None:
+        if isinstance(target.role, Mafia):
+            self.suspects.append(target)
+            self.revealed = seat
+
+
+POLICIES: Dict[str, Type[RandomPolicy]] = {
+    "random": RandomPolicy,
+    "scripted": ScriptedPolicy,
+}
+
+
+def role_mix(engine: GameEngine[Seat]) -> str:
+    mafia: int = sum(isinstance(seat.role, Mafia) for seat in engine.players.values())
+    mix: List[str] = [f"{mafia} mafia"]
+    for role, name in ((Doctor, "doctor"), (Detective, "detective")):
+        if any(isinstance(seat.role, role) for seat in engine.players.values()):
+            mix.append(name)
+    return ", ".join(mix)
+
+
+def play(
+    engine: GameEngine[Seat],
+    policy: RandomPolicy,
+    clock: VirtualClock,
+    abstain: float,
+    max_days: int,
+) -> int:
+    # one game from the first night to a result; returns the days it took
+    rng: random.Random = engine.rng
+    days: int = 0
+    while days < max_days:
+        policy.new_phase()
+        if engine.phase == GamePhase.NIGHT:
+            engine.begin_night()
+            for seat in list(engine.players.values()):
+                # like the web client, dead night roles are left to time out
+                if not seat.is_alive or seat.id not in engine.pending_actors:
+                    continue
+                if rng.random() < abstain:
+                    continue
+                target: Optional[Seat] = policy.night_target(seat)
+                if target is not None:
+                    engine.submit_action(seat.id, target.id)
+                    if isinstance(seat.role, Detective):
+                        policy.learn(seat, target)
+        else:
+            engine.begin_day()
+            days += 1
+            for seat in list(engine.players.values()):
+                if not seat.is_alive or rng.random() < abstain:
+                    continue
+                target = policy.vote_target(seat)
+                if target is not None:
+                    engine.cast_vote(seat.id, target.id)
+
+        # a phase everyone acted in ends at once, otherwise at its deadline
+        if not engine.phase_done():
+            clock.advance_to(engine.phase_timer)
+        if engine.phase == GamePhase.NIGHT:
+            engine.end_night()
+        else:
+            engine.end_day()
+        if engine.check_winner() is not None:
+            break
+    return days
+
+
+def run_batch(
+    players: int,
+    first_seed: int,
+    games: int,
+    policy_name: str,
+    abstain: float,
+    max_days: int,
+    settings: Dict[str, int],
+) -> Results:
+    # one engine per batch, reset between games as a room is for play_again;
+    # each game reseeds from its own number, so results do not depend on how
+    # games are split between workers
+    clock: VirtualClock = VirtualClock()
+    rng: random.Random = random.Random()
+    engine: GameEngine[Seat] = GameEngine(RoomConfig(**settings), clock, rng)
+    for number in range(players):
+        engine.add_player(Seat(f"p{number}", f"bot{number}"))
+    policy_class: Type[RandomPolicy] = POLICIES[policy_name]
+
+    results: Results = {}
+    mix: Optional[str] = None
+    for game in range(first_seed, first_seed + games):
+        rng.seed(game)
+        clock.now = 0.0
+        engine.reset_game()
+        if not engine.begin():
+            break
+        days: int = play(engine, policy_class(engine, rng), clock, abstain, max_days)
+
+        # the same for every game of a size; only who gets which role changes
+        mix = mix or role_mix(engine)
+        tally: Tally = results.setdefault((players, mix), [0, 0, 0, 0, 0, 0.0])
+        tally[0] += 1
+        if engine.game_result == TOWN_WINS:
+            tally[1] += 1
+        elif engine.game_result == MAFIA_WINS:
+            tally[2] += 1
+        else:
+            tally[3] += 1
+        tally[4] += days
+        tally[5] += clock.now
+    return results
+
+
+def player_counts(spec: str) -> List[int]:
+    # "8", "6-12" or "6,8,10"
+    counts: List[int] = []
+    for part in spec.split(","):
+        low, _, high = part.partition("-")
+        counts.extend(range(int(low), int(high or low) + 1))
+    return counts
+
+
+def report(results: Results, elapsed: float, workers: int) -> None:
+    total: float = sum(tally[0] for tally in results.values())
+    print(
+        f"{'players':>7}  {'roles':<26} {'games':>9} {'town':>7} {'mafia':>7} "
+        f"{'unfinished':>10} {'days':>5} {'minutes':>7}"
+    )
+    for (players, mix), tally in sorted(results.items()):
+        games, town, mafia, unfinished, days, seconds = tally
+        print(
+            f"{players:>7}  {mix:<26} {int(games):>9} {town / games:>7.1%} "
+            f"{mafia / games:>7.1%} {unfinished / games:>10.1%} "
+            f"{days / games:>5.2f} {seconds / games / 60:>7.1f}"
+        )
+    print(
+        f"{int(total)} games in {elapsed:.2f}s: {total / elapsed:.0f} games/s, "
+        f"{total / elapsed / workers:.0f} per worker"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless Mafia game simulator")
+    parser.add_argument("--games", type=int, default=10000, help="per player count")
+    parser.add_argument(
+        "--players", default="6-12", help="player counts, such as 8, 6-12 or 6,8,10"
+    )
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument(
+        "--abstain",
+        type=float,
+        default=0.0,
+        help="chance a bot sits a phase out, which runs the phase to its deadline",
+    )
+    parser.add_argument(
+        "--max-days", type=int, default=50, help="games still going are unfinished"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch", type=int, default=5000, help="games per task")
+
+    room = parser.add_argument_group("rules")
+    room.add_argument("--night-duration", type=int, help="seconds")
+    room.add_argument("--day-duration", type=int, help="seconds")
+    room.add_argument("--players-per-mafia", type=int)
+    room.add_argument("--doctor-from", type=int)
+    room.add_argument("--detective-from", type=int)
+    args = parser.parse_args()
+
+    try:
+        counts: List[int] = player_counts(args.players)
+    except ValueError:
+        parser.error(f"invalid player counts: {args.players}")
+    if not counts or min(counts) < 3:
+        parser.error("games need at least 3 players")
+
+    settings: Dict[str, Any] = {
+        name: getattr(args, name)
+        for name in RoomConfig.__slots__
+        if getattr(args, name, None) is not None
+    }
+    # every requested size can start, whatever the server's room limits are
+    settings["minimum_players"] = 3
+    settings["maximum_players"] = max(counts)
+
+    results: Results = {}
+    started: float = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = []
+        for players in counts:
+            # seeds are spaced so player counts never share games
+            base: int = (args.seed << 40) | (players << 32)
+            for first in range(0, args.games, args.batch):
+                futures.append(
+                    pool.submit(
+                        run_batch,
+                        players,
+                        base + first,
+                        min(args.batch, args.games - first),
+                        args.policy,
+                        args.abstain,
+                        args.max_days,
+                        settings,
+                    )
+                )
+        for future in as_completed(futures):
+            for key, tally in future.result().items():
+                total: Tally = results.setdefault(key, [0, 0, 0, 0, 0, 0.0])
+                for i, value in enumerate(tally):
+                    total[i] += value
+    report(results, time.perf_counter() - started, args.workers)
+
+
+if __name__ == "__main__":
+    main()
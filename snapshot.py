@@ -0,0 +1,234 @@
+import asyncio
+import json
+import secrets
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from log import get_logger
+from metrics import SNAPSHOT_ROOMS, SNAPSHOT_SECONDS
+from room import SNAPSHOT_VERSION, Room
+
+log = get_logger("snapshot")
+
+T = TypeVar("T")
+
+# (room code, snapshot) for claimed rooms; None when it cannot be restored
+Claimed = List[Tuple[str, Optional[Dict[str, Any]]]]
+
+# rooms whose owner has not saved for this long may be claimed by anyone
+OWNER_LEASE: float = 5.0
+
+
+def parse(data: str) -> Optional[Dict[str, Any]]:
+    try:
+        snapshot: Any = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+class SnapshotStore:
+    # room snapshots in a sqlite file, one row per room. every interval the rooms
+    # changed since the last save are captured on the event loop, then encoded
+    # and written in a single transaction on the store's own thread, so the loop
+    # never waits on the disk.
+    #
+    # several processes can share one file: shard workers, and the old and new
+    # server during a restart. a room belongs to the process that saved it for
+    # as long as that process keeps its heartbeat in the owners table; a clean
+    # exit drops the heartbeat and a crashed process's goes stale, after which
+    # any process may claim the room
+    def __init__(self, path: str, interval: float = 1.0) -> None:
+        self.path: str = path
+        self.interval: float = interval
+        self.owner: str = secrets.token_hex(8)
+        self.lease: float = max(OWNER_LEASE, interval * 5)
+        # one thread, so writes land in order and the connection stays on it
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="snapshot"
+        )
+        self.connection: Optional[sqlite3.Connection] = None
+        self.closed_rooms: Set[str] = set()
+
+    async def call(self, function: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            connection: sqlite3.Connection = sqlite3.connect(self.path, timeout=10.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rooms (room_code TEXT PRIMARY KEY, "
+                "owner TEXT NOT NULL, saved REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS owners "
+                "(owner TEXT PRIMARY KEY, heartbeat REAL NOT NULL)"
+            )
+            self.connection = connection
+        return self.connection
+
+    def heartbeat(self, connection: sqlite3.Connection) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO owners VALUES (?, ?)", (self.owner, time.time())
+        )
+
+    async def orphans(self) -> List[str]:
+        # rooms nobody live owns, left by a crash or a finished drain
+        return await self.call(self.read_orphans)
+
+    def read_orphans(self) -> List[str]:
+        return [
+            room_code
+            for (room_code,) in self.connect().execute(
+                "SELECT room_code FROM rooms WHERE owner NOT IN "
+                "(SELECT owner FROM owners WHERE heartbeat > ?)",
+                (time.time() - self.lease,),
+            )
+        ]
+
+    async def stored(self) -> Set[str]:
+        # every room in the store, live or orphaned, whoever owns it
+        return await self.call(self.read_stored)
+
+    def read_stored(self) -> Set[str]:
+        return {
+            room_code
+            for (room_code,) in self.connect().execute("SELECT room_code FROM rooms")
+        }
+
+    async def claim(self, room_codes: List[str]) -> Claimed:
+        # takes over whichever of the rooms are still orphaned
+        return await self.call(self.take, room_codes)
+
+    def take(self, room_codes: List[str]) -> Claimed:
+        claimed: Claimed = []
+        connection: sqlite3.Connection = self.connect()
+        with connection:
+            # first, so nobody sees the claimed rooms as orphans again
+            self.heartbeat(connection)
+            stale: float = time.time() - self.lease
+            for room_code in room_codes:
+                cursor = connection.execute(
+                    "UPDATE rooms SET owner = ? WHERE room_code = ? AND owner NOT IN "
+                    "(SELECT owner FROM owners WHERE heartbeat > ?)",
+                    (self.owner, room_code, stale),
+                )
+                if cursor.rowcount:
+                    (data,) = connection.execute(
+                        "SELECT data FROM rooms WHERE room_code = ?", (room_code,)
+                    ).fetchone()
+                    claimed.append((room_code, parse(data)))
+        return claimed
+
+    async def unclaim(self, room_code: str) -> None:
+        # hands a claimed room straight back, for one this process cannot serve
+        await self.call(self.give_up, room_code)
+
+    def give_up(self, room_code: str) -> None:
+        connection: sqlite3.Connection = self.connect()
+        with connection:
+            # an owner that never heartbeats, so the room is an orphan again
+            connection.execute(
+                "UPDATE rooms SET owner = '' WHERE room_code = ? AND owner = ?",
+                (room_code, self.owner),
+            )
+
+    async def held(self, room_code: str) -> bool:
+        # whether another live process owns the room
+        return await self.call(self.read_held, room_code)
+
+    def read_held(self, room_code: str) -> bool:
+        row = self.connect().execute(
+            "SELECT 1 FROM rooms JOIN owners ON rooms.owner = owners.owner "
+            "WHERE room_code = ? AND rooms.owner != ? AND heartbeat > ?",
+            (room_code, self.owner, time.time() - self.lease),
+        ).fetchone()
+        return row is not None
+
+    def discard(self, room_code: str) -> None:
+        # deleted with the next save
+        self.closed_rooms.add(room_code)
+
+    async def save(self, rooms: Dict[str, Room]) -> int:
+        # runs every interval even when nothing changed, as the heartbeat
+        batch: List[Tuple[Room, Dict[str, Any]]] = []
+        for room in rooms.values():
+            if room.dirty:
+                room.dirty = False
+                batch.append((room, room.snapshot()))
+        closed: Set[str] = self.closed_rooms
+        self.closed_rooms = set()
+
+        started: float = time.perf_counter()
+        try:
+            await self.call(
+                self.write,
+                [(room.room_code, snapshot) for room, snapshot in batch],
+                closed,
+            )
+        except sqlite3.Error as e:
+            # keep everything pending for the next attempt
+            for room, _ in batch:
+                room.dirty = True
+            self.closed_rooms |= closed
+            log.warning("snapshot failed", fields={"error": str(e)})
+            return 0
+        if batch:
+            SNAPSHOT_SECONDS.observe(time.perf_counter() - started)
+            SNAPSHOT_ROOMS.inc(len(batch))
+        return len(batch)
+
+    def write(self, batch: List[Tuple[str, Dict[str, Any]]], closed: Set[str]) -> None:
+        saved: float = time.time()
+        stale: float = saved - self.lease
+        rows: List[Tuple[str, str, float, str, float]] = [
+            (
+                room_code,
+                self.owner,
+                saved,
+                json.dumps(snapshot, separators=(",", ":")),
+                stale,
+            )
+            for room_code, snapshot in batch
+        ]
+        connection: sqlite3.Connection = self.connect()
+        with connection:
+            self.heartbeat(connection)
+            # never over a room another live process owns, should two processes
+            # ever hold the same code
+            connection.executemany(
+                "INSERT INTO rooms VALUES (?, ?, ?, ?) ON CONFLICT(room_code) DO "
+                "UPDATE SET owner = excluded.owner, saved = excluded.saved, "
+                "data = excluded.data WHERE rooms.owner = excluded.owner OR "
+                "rooms.owner NOT IN (SELECT owner FROM owners WHERE heartbeat > ?)",
+                rows,
+            )
+            connection.executemany(
+                "DELETE FROM rooms WHERE room_code = ? AND owner = ?",
+                [(room_code, self.owner) for room_code in closed],
+            )
+
+    async def close(self, rooms: Dict[str, Room]) -> None:
+        # a last save, then the rooms are released for whichever process
+        # starts next, or is already running alongside, to claim
+        await self.save(rooms)
+        try:
+            await self.call(self.release)
+        except sqlite3.Error as e:
+            # the heartbeat goes stale instead, so the rooms are freed a bit later
+            log.warning("snapshot release failed", fields={"error": str(e)})
+        self.executor.shutdown()
+
+    def release(self) -> None:
+        connection: sqlite3.Connection = self.connect()
+        with connection:
+            connection.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+        connection.close()
+        self.connection = None
@@ -0,0 +1,143 @@
+from asyncio import Task, create_task, gather, sleep
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from websockets import ServerConnection
+
+from encoding import Codec, Encoded, codec_for
+from enums import OverflowPolicy
+from metrics import SPECTATOR_FRAMES, SPECTATOR_SECONDS
+from outbox import Outbox
+
+if TYPE_CHECKING:
+    from room import Room
+
+# spectators a feed queues a frame for before it yields to the event loop
+FAN_OUT_SLICE: int = 64
+
+
+class Spectator:
+    # a read-only connection attached to a room. it has no seat, no player_info
+    # and no sync state: every frame it gets carries the full public state, so a
+    # dropped frame is made good by the next one
+    __slots__ = ("websocket", "codec", "outbox")
+
+    def __init__(
+        self, websocket: ServerConnection, queue_size: int = 16, send_timeout: float = 5.0
+    ) -> None:
+        self.websocket: ServerConnection = websocket
+        self.codec: Codec = codec_for(websocket.subprotocol)
+        # feed frames are already batched, and a spectator that falls behind
+        # loses frames rather than holding anything up
+        self.outbox: Outbox = Outbox(
+            websocket,
+            "spectator",
+            queue_size,
+            send_timeout,
+            OverflowPolicy.DROP,
+            self.codec,
+            batch_size=1,
+        )
+
+    async def close(self) -> None:
+        await self.outbox.close()
+        await self.websocket.close(1000, "room closed")
+
+
+class SpectatorFeed:
+    # the spectator tier of one room. the game only hands over events it has
+    # already encoded for its players and flags state changes; the feed's own
+    # task turns them into one frame per codec at most once per interval and
+    # queues that same frame for every spectator
+    __slots__ = ("room", "interval", "spectators", "events", "stale", "task", "closer")
+
+    def __init__(self, room: "Room", interval: float = 0.25) -> None:
+        self.room: "Room" = room
+        self.interval: float = interval
+        self.spectators: Set[Spectator] = set()
+        self.events: List[Encoded] = []
+        self.stale: bool = False
+        self.task: Optional[Task[None]] = None
+        self.closer: Optional[Task[None]] = None
+
+    def publish(self, encoded: Encoded) -> None:
+        # a public room event, from the game's hot path
+        if self.spectators:
+            self.events.append(encoded)
+            self.wake()
+
+    def touch(self) -> None:
+        # the public state changed, from the game's hot path
+        if self.spectators:
+            self.stale = True
+            self.wake()
+
+    def wake(self) -> None:
+        if self.task is None:
+            self.task = create_task(self.run())
+
+    async def run(self) -> None:
+        try:
+            while self.events or self.stale:
+                await sleep(self.interval)
+                await self.flush()
+        finally:
+            self.task = None
+
+    async def flush(self) -> None:
+        with SPECTATOR_SECONDS.time():
+            events: List[Encoded] = self.events
+            self.events = []
+            self.stale = False
+            state: Encoded = Encoded(self.room.public_state(len(self.spectators)))
+            frames: Dict[str, bytes] = {}
+            for count, spectator in enumerate(list(self.spectators), 1):
+                codec: Codec = spectator.codec
+                frame: Optional[bytes] = frames.get(codec.name)
+                if frame is None:
+                    frame = codec.join(
+                        [encoded.frame(codec) for encoded in events]
+                        + [state.frame(codec)]
+                    )
+                    frames[codec.name] = frame
+                spectator.outbox.put(frame)
+                if count % FAN_OUT_SLICE == 0:
+                    await sleep(0)
+            SPECTATOR_FRAMES.inc(len(self.spectators))
+
+    def add(self, spectator: Spectator) -> None:
+        # one frame with the acknowledgement, the public history so far and the
+        # current state; the spectator then follows the feed
+        codec: Codec = spectator.codec
+        frames: List[bytes] = [
+            codec.encode({"type": "spectating", "room_code": self.room.room_code})
+        ]
+        frames.extend(
+            codec.from_json(frame)
+            for _, audience, frame in self.room.history
+            if audience is None
+        )
+        self.spectators.add(spectator)
+        state: Dict[str, Any] = self.room.public_state(len(self.spectators))
+        frames.append(codec.encode(state))
+        spectator.outbox.put(codec.join(frames))
+
+    def remove(self, spectator: Spectator) -> None:
+        self.spectators.discard(spectator)
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.events = []
+        self.stale = False
+
+    async def close(self) -> None:
+        # a closed room sends what it still had, then lets its spectators go
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.events and self.spectators:
+            await self.flush()
+        spectators: List[Spectator] = list(self.spectators)
+        self.spectators.clear()
+        await gather(*(spectator.close() for spectator in spectators))
@@ -0,0 +1,23 @@
+from typing import Any, Dict, Optional
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in new.items() if old.get(key) != value}
+
+
+class SyncState:
+    # what the server last sent a player, so later syncs only carry changes
+    __slots__ = ("version", "game_state", "player_info", "roster_version", "drops")
+
+    def __init__(self) -> None:
+        self.version: int = 0
+        self.game_state: Optional[Dict[str, Any]] = None
+        self.player_info: Optional[Dict[str, Any]] = None
+        self.roster_version: int = -1
+        self.drops: int = 0
+
+    def reset(self) -> None:
+        # forces a full snapshot on the next sync
+        self.game_state = None
+        self.player_info = None
+        self.roster_version = -1
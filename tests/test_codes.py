@@ -0,0 +1,78 @@
+from codes import RoomCodeAllocator, decode_code
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_codes_are_unique_until_the_keyspace_grows():
+    allocator = RoomCodeAllocator(min_length=2, max_occupancy=1.0)
+    codes = [allocator.allocate() for _ in range(36**2)]
+    assert len(set(codes)) == 36**2
+    assert all(len(code) == 2 for code in codes)
+    assert len(allocator.allocate()) == 3
+
+
+def test_keyspace_grows_at_half_occupancy():
+    allocator = RoomCodeAllocator(min_length=2)
+    codes = [allocator.allocate() for _ in range(36**2 // 2)]
+    assert all(len(code) == 2 for code in codes)
+    assert len(allocator.allocate()) == 3
+
+
+def test_released_codes_keep_the_keyspace_from_filling():
+    allocator = RoomCodeAllocator(min_length=2, cooldown=0.0)
+    for _ in range(36**2 * 2):
+        allocator.release(allocator.allocate())
+    assert allocator.length == 2
+
+
+def test_shards_partition_the_keyspace():
+    seen = set()
+    for shard in range(3):
+        allocator = RoomCodeAllocator(shard=shard, num_shards=3, min_length=2)
+        while allocator.length == 2:
+            code = allocator.allocate()
+            if len(code) == 2:
+                assert decode_code(code) % 3 == shard
+                assert code not in seen
+                seen.add(code)
+    assert len(seen) == 3 * (36**2 // 3 // 2)
+
+
+def test_a_shard_with_a_single_code_drains_and_grows():
+    # 36 shards over one character leaves each shard exactly one code
+    allocator = RoomCodeAllocator(shard=5, num_shards=36, min_length=1)
+    assert allocator.size == 1
+    assert allocator.allocate() == "F"
+    code = allocator.allocate()
+    assert len(code) == 2 and decode_code(code) % 36 == 5
+
+
+def test_more_shards_than_codes_skips_to_a_longer_keyspace():
+    allocator = RoomCodeAllocator(shard=40, num_shards=50, min_length=1)
+    code = allocator.allocate()
+    assert len(code) == 2 and decode_code(code) % 50 == 40
+
+
+def test_released_codes_wait_out_the_cooldown():
+    clock = Clock()
+    allocator = RoomCodeAllocator(min_length=3, cooldown=10.0, clock=clock)
+    code = allocator.allocate()
+    allocator.release(code)
+    clock.now = 5.0
+    assert allocator.allocate() != code
+    clock.now = 10.0
+    assert allocator.allocate() == code
+
+
+def test_reserved_codes_are_never_issued():
+    allocator = RoomCodeAllocator(min_length=2, max_occupancy=1.0)
+    allocator.reserve("AB")
+    codes = [allocator.allocate() for _ in range(36**2 - 1)]
+    assert "AB" not in codes
+    assert len(set(codes)) == 36**2 - 1
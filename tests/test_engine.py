@@ -0,0 +1,108 @@
+import random
+from typing import Dict, List, Optional
+
+from config import RoomConfig
+from engine import GameEngine, Seat, VirtualClock
+from enums import GamePhase
+
+
+def day_game(players: int, seed: int = 0) -> GameEngine[Seat]:
+    engine: GameEngine[Seat] = GameEngine(
+        RoomConfig(), VirtualClock(), random.Random(seed)
+    )
+    for number in range(players):
+        engine.add_player(Seat(f"p{number}", f"bot{number}"))
+    assert engine.begin()
+    engine.phase = GamePhase.DAY
+    engine.begin_day()
+    return engine
+
+
+def baseline_eliminated(engine: GameEngine[Seat]) -> Optional[str]:
+    # the original rule: recount every vote, and exactly one target may reach
+    # half of the living players
+    counts: Dict[str, int] = {}
+    for target_id in engine.votes.values():
+        counts[target_id] = counts.get(target_id, 0) + 1
+    alive: int = sum(seat.is_alive for seat in engine.players.values())
+    required: int = (alive + 1) // 2
+    reached: List[str] = [
+        target_id for target_id, count in counts.items() if count >= required
+    ]
+    if len(reached) == 1 and reached[0] in engine.players:
+        return reached[0]
+    return None
+
+
+def end_day(engine: GameEngine[Seat]) -> Optional[str]:
+    alive = {seat.id for seat in engine.players.values() if seat.is_alive}
+    engine.end_day()
+    dead = [
+        seat.id
+        for seat in engine.players.values()
+        if seat.id in alive and not seat.is_alive
+    ]
+    assert len(dead) <= 1
+    return dead[0] if dead else None
+
+
+def vote(engine: GameEngine[Seat], voters: range, target: str) -> None:
+    for number in voters:
+        engine.cast_vote(f"p{number}", target)
+
+
+def test_single_target_at_the_threshold_is_eliminated():
+    engine = day_game(6)
+    vote(engine, range(1, 4), "p0")
+    vote(engine, range(4, 6), "p1")
+    assert baseline_eliminated(engine) == "p0"
+    assert end_day(engine) == "p0"
+
+
+def test_tie_at_the_threshold_eliminates_no_one():
+    engine = day_game(6)
+    vote(engine, range(2, 5), "p0")
+    vote(engine, (0, 1, 5), "p1")
+    assert baseline_eliminated(engine) is None
+    assert end_day(engine) is None
+
+
+def test_runner_up_reaching_a_lowered_threshold_blocks_the_leader():
+    # 4 for p0 and 3 for p1 out of 10 needs 5; once four players leave,
+    # 3 of the 6 left is enough for both
+    engine = day_game(10)
+    vote(engine, range(2, 6), "p0")
+    vote(engine, range(6, 9), "p1")
+    for number in (6, 7, 8, 9):
+        engine.remove_player(f"p{number}")
+    assert engine.required_votes() == 3
+    assert baseline_eliminated(engine) is None
+    assert end_day(engine) is None
+
+
+def test_removed_leader_is_not_replaced_by_the_runner_up():
+    engine = day_game(6)
+    vote(engine, range(2, 5), "p0")
+    vote(engine, (5,), "p1")
+    engine.remove_player("p0")
+    assert baseline_eliminated(engine) is None
+    assert end_day(engine) is None
+
+
+def test_matches_the_baseline_rule_over_seeded_days():
+    for seed in range(2000):
+        rng = random.Random(seed)
+        engine = day_game(rng.randint(6, 14), seed)
+        # few candidates, so ties and near misses are common
+        candidates: List[str] = rng.sample(list(engine.players), rng.randint(2, 3))
+        for seat in list(engine.players.values()):
+            if seat.id not in engine.players:
+                continue
+            if rng.random() < 0.15:
+                engine.remove_player(rng.choice(list(engine.players)))
+                continue
+            targets = [c for c in candidates if c in engine.players]
+            if targets and rng.random() < 0.8:
+                engine.cast_vote(seat.id, rng.choice(targets))
+        expected: Optional[str] = baseline_eliminated(engine)
+        assert end_day(engine) == expected, seed
@@ -0,0 +1,56 @@
+import asyncio
+from typing import List
+
+from websockets.protocol import State
+
+from config import RoomConfig
+from lobby import Matchmaker, Ticket
+
+
+class Connection:
+    # what a ticket looks at of its websocket
+    def __init__(self) -> None:
+        self.state: State = State.OPEN
+
+
+def test_a_ticket_closed_in_the_queue_is_resolved_when_released():
+    async def run() -> None:
+        formed: List[List[Ticket]] = []
+
+        async def form(config: RoomConfig, tickets: List[Ticket]) -> None:
+            formed.append(tickets)
+
+        config = RoomConfig(minimum_players=3, maximum_players=3)
+        matchmaker = Matchmaker(form, wait=0.0)
+        tickets = [Ticket(Connection(), f"p{i}") for i in range(4)]
+        matchmaker.enqueue(tickets[0], config)
+        matchmaker.enqueue(tickets[1], config)
+        # the first one hangs up before a third arrives and releases the queue
+        tickets[0].websocket.state = State.CLOSED
+        matchmaker.enqueue(tickets[2], config)
+
+        assert tickets[0].matched.cancelled()
+        assert not matchmaker.cancel(tickets[0], config)
+        # the others are still queued, and form a room with the next one
+        assert len(matchmaker) == 2
+        matchmaker.enqueue(tickets[3], config)
+        await asyncio.sleep(0)
+        assert formed == [tickets[1:]]
+
+    asyncio.run(run())
+
+
+def test_a_cancelled_ticket_leaves_the_queue():
+    async def run() -> None:
+        async def form(config: RoomConfig, tickets: List[Ticket]) -> None:
+            pass
+
+        config = RoomConfig(minimum_players=3, maximum_players=3)
+        matchmaker = Matchmaker(form, wait=0.0)
+        ticket = Ticket(Connection(), "p0")
+        assert matchmaker.enqueue(ticket, config) == 1
+        assert matchmaker.cancel(ticket, config)
+        assert len(matchmaker) == 0
+        assert not matchmaker.cancel(ticket, config)
+
+    asyncio.run(run())
@@ -0,0 +1,174 @@
+import asyncio
+import json
+from typing import Any, Callable, Coroutine, List, Optional, Tuple
+
+from enums import OverflowPolicy
+from outbox import EVENT, SNAPSHOT, STATE, Outbox
+
+
+class Connection:
+    # records what an outbox writes
+    def __init__(self) -> None:
+        self.sent: List[Any] = []
+        self.closed: Optional[Tuple[int, str]] = None
+
+    async def send(self, frame: bytes, text: bool = False) -> None:
+        self.sent.append(json.loads(frame))
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.closed = (code, reason)
+
+
+def event(number: int) -> bytes:
+    return json.dumps({"n": number}).encode()
+
+
+def run(test: Callable[[], Coroutine[Any, Any, None]]) -> None:
+    asyncio.run(test())
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_events_queued_in_one_tick_go_out_as_one_frame():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p")
+        for number in range(3):
+            outbox.put(event(number))
+        await settle()
+        assert connection.sent == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+
+        # a lone event in a later tick is sent on its own
+        outbox.put(event(3))
+        await settle()
+        assert connection.sent[1:] == [{"n": 3}]
+
+    run(test)
+
+
+def test_batches_hold_at_most_batch_size_events():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p", batch_size=2)
+        for number in range(5):
+            outbox.put(event(number))
+        await settle()
+        assert connection.sent == [
+            [{"n": 0}, {"n": 1}],
+            [{"n": 2}, {"n": 3}],
+            {"n": 4},
+        ]
+
+    run(test)
+
+
+def test_batch_size_one_sends_every_event_alone():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p", batch_size=1)
+        for number in range(3):
+            outbox.put(event(number))
+        await settle()
+        assert connection.sent == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+    run(test)
+
+
+def test_a_snapshot_replaces_the_state_queued_ahead_of_it():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p")
+        outbox.put(event(0))
+        outbox.put(event(1), STATE)
+        outbox.put(event(2), SNAPSHOT)
+        outbox.put(event(3))
+        outbox.put(event(4), STATE)
+        outbox.put(event(5), SNAPSHOT)
+        await settle()
+        # events all stay, in order; only the newest state survives
+        assert connection.sent == [[{"n": 0}, {"n": 3}, {"n": 5}]]
+
+    run(test)
+
+
+def test_patches_are_not_superseded_by_each_other():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p")
+        outbox.put(event(0), SNAPSHOT)
+        outbox.put(event(1), STATE)
+        outbox.put(event(2), STATE)
+        await settle()
+        # a patch builds on the one before it, so every one is sent
+        assert connection.sent == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+
+    run(test)
+
+
+def test_a_full_queue_drops_under_the_drop_policy():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p", max_size=2, policy=OverflowPolicy.DROP)
+        assert outbox.put(event(0))
+        assert outbox.put(event(1))
+        assert not outbox.put(event(2))
+        assert outbox.dropped == 1
+        assert not outbox.closed
+        await settle()
+        assert connection.sent == [[{"n": 0}, {"n": 1}]]
+        assert connection.closed is None
+
+        # and takes frames again once it has drained
+        assert outbox.put(event(3))
+        await settle()
+        assert connection.sent[1:] == [{"n": 3}]
+
+    run(test)
+
+
+def test_a_full_queue_disconnects_under_the_disconnect_policy():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(
+            connection, "p", max_size=2, policy=OverflowPolicy.DISCONNECT
+        )
+        assert outbox.put(event(0))
+        assert outbox.put(event(1))
+        assert not outbox.put(event(2))
+        assert outbox.closed
+        assert not outbox.put(event(3))
+        await settle()
+        assert connection.sent == []
+        assert connection.closed is not None and connection.closed[0] == 1013
+
+    run(test)
+
+
+def test_a_snapshot_makes_room_in_a_full_queue():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p", max_size=2)
+        outbox.put(event(0), STATE)
+        outbox.put(event(1), STATE)
+        assert outbox.put(event(2), SNAPSHOT)
+        assert not outbox.closed
+        await settle()
+        assert connection.sent == [{"n": 2}]
+
+    run(test)
+
+
+def test_congestion_and_waiting_for_space():
+    async def test() -> None:
+        connection = Connection()
+        outbox = Outbox(connection, "p", max_size=8, batch_size=1)
+        for number in range(4):
+            outbox.put(event(number), EVENT)
+        assert outbox.congested
+        await asyncio.wait_for(outbox.wait_for_space(), 1.0)
+        assert len(outbox.frames) <= 2
+
+    run(test)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+from config import ServerConfig
+from encoding import select_subprotocol
+from player import Player
+from ratelimit import RateLimiter, TokenBucket
+from room import Room
+from server import MafiaServer
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now: float = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Connection:
+    subprotocol = None
+
+    def __init__(self) -> None:
+        self.events: List[Dict[str, Any]] = []
+
+    async def send(self, frame: bytes, text: bool = False) -> None:
+        data = json.loads(frame)
+        self.events.extend(data if isinstance(data, list) else [data])
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        pass
+
+
+def test_a_bucket_spends_its_burst_then_refills_at_its_rate():
+    bucket = TokenBucket(2.0, 3.0, 0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    # half a second at two a second is one token
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+    # a long pause refills only up to the burst
+    assert [bucket.take(60.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_types_without_a_limit_share_the_fallback_bucket():
+    clock = Clock()
+    limiter = RateLimiter({"chat": (1.0, 1.0), "*": (1.0, 2.0)}, clock)
+    assert limiter.allow("chat")
+    assert not limiter.allow("chat")
+    assert limiter.allow("vote")
+    assert limiter.allow("resync")
+    assert not limiter.allow("vote")
+    clock.now += 1.0
+    assert limiter.allow("chat") and limiter.allow("vote")
+    assert RateLimiter({"chat": (1.0, 1.0)}, clock).allow("vote")
+
+
+def test_admit_sends_one_notice_per_burst():
+    async def test() -> None:
+        clock = Clock()
+        server = MafiaServer(ServerConfig())
+        room = Room("ABCD")
+        connection = Connection()
+        player = Player(connection, "p0", limits={"chat": (1.0, 2.0)})
+        player.limiter.clock = room.limiter.clock = clock
+
+        admitted = [await server.admit(room, player, "chat") for _ in range(5)]
+        assert admitted == [True, True, False, False, False]
+        clock.now += 1.0
+        assert await server.admit(room, player, "chat")
+        assert not await server.admit(room, player, "chat")
+        await player.outbox.close()
+
+        notices = [event for event in connection.events if event["type"] == "error"]
+        assert [notice["code"] for notice in notices] == ["rate_limited"] * 2
+
+    asyncio.run(test())
+
+
+def test_the_room_bucket_caps_everyone_in_it():
+    async def test() -> None:
+        clock = Clock()
+        server = MafiaServer(ServerConfig())
+        room = Room("ABCD", limits={"chat": (1.0, 3.0)})
+        room.limiter.clock = clock
+        players = [Player(Connection(), f"p{number}") for number in range(4)]
+        admitted = [await server.admit(room, player, "chat") for player in players]
+        assert admitted == [True, True, True, False]
+        for player in players:
+            await player.outbox.close()
+
+    asyncio.run(test())
+
+
+def test_lobby_messages_are_limited_per_connection():
+    async def test() -> None:
+        config = ServerConfig()
+        config.lobby_limits = {"list_rooms": (0.01, 2.0)}
+        server = MafiaServer(config)
+        async with serve(
+            server.handler, "127.0.0.1", 0, select_subprotocol=select_subprotocol
+        ) as listener:
+            url = f"ws://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+            events: List[Dict[str, Any]] = []
+            async with connect(url) as websocket:
+                for _ in range(5):
+                    await websocket.send(json.dumps({"type": "list_rooms"}))
+                # anything unlimited still goes through afterwards
+                await websocket.send(json.dumps({"type": "new_room", "name": "p0"}))
+                async for frame in websocket:
+                    data = json.loads(frame)
+                    events.extend(data if isinstance(data, list) else [data])
+                    if any(event["type"] == "room_created" for event in events):
+                        break
+            kinds = [event["type"] for event in events]
+            assert kinds.count("room_list") == 2
+            errors = [event["code"] for event in events if event["type"] == "error"]
+            assert errors == ["rate_limited"]
+
+    asyncio.run(test())
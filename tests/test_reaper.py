@@ -0,0 +1,28 @@
+from enums import GamePhase
+from player import Player
+from reaper import RoomReaper
+from room import Room
+
+
+def room_in(phase: GamePhase) -> Room:
+    room = Room("ABCD")
+    room.add_player(Player(None, "host"))
+    room.phase = phase
+    return room
+
+
+def test_idle_eviction_skips_running_games():
+    reaper = RoomReaper(idle_ttl=10.0, finished_ttl=0.0, abandoned_ttl=0.0)
+    for phase in (GamePhase.NIGHT, GamePhase.DAY):
+        assert reaper.reason(room_in(phase), 100.0) is None
+    assert reaper.reason(room_in(GamePhase.WAITING), 100.0) == "idle"
+    assert reaper.reason(room_in(GamePhase.FINISHED), 100.0) == "idle"
+    assert reaper.reason(room_in(GamePhase.WAITING), 5.0) is None
+
+
+def test_abandoned_games_are_evicted_mid_game():
+    reaper = RoomReaper(idle_ttl=0.0, finished_ttl=0.0, abandoned_ttl=10.0)
+    room = room_in(GamePhase.DAY)
+    for player in room.players.values():
+        player.outbox.closed = True
+    assert reaper.reason(room, 100.0) == "abandoned"
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.asyncio.server import serve
+
+from config import ServerConfig
+from encoding import select_subprotocol
+from roles import Detective, Mafia
+from room import Room
+from server import MafiaServer
+
+
+class Client:
+    # a player's connection, keeping every event it is sent
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.events: List[Dict[str, Any]] = []
+        self.websocket: Optional[ClientConnection] = None
+        self.reader: Optional["asyncio.Task[None]"] = None
+
+    async def open(self, url: str, first: Dict[str, Any]) -> None:
+        self.websocket = await connect(url)
+        self.reader = asyncio.create_task(self.read(self.websocket))
+        await self.websocket.send(json.dumps(first))
+
+    async def read(self, websocket: ClientConnection) -> None:
+        async for frame in websocket:
+            data = json.loads(frame)
+            self.events.extend(data if isinstance(data, list) else [data])
+
+    async def expect(self, kind: str) -> Dict[str, Any]:
+        for _ in range(200):
+            for event in self.events:
+                if event["type"] == kind:
+                    return event
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"{self.name} got no {kind}: {self.events}")
+
+    async def close(self) -> None:
+        assert self.websocket is not None and self.reader is not None
+        await self.websocket.close()
+        await self.reader
+
+    @property
+    def last_seq(self) -> int:
+        return max((event["seq"] for event in self.events if "seq" in event), default=0)
+
+    def messages(self) -> List[str]:
+        return [
+            event["chat"]["message"]
+            for event in self.events
+            if event["type"] == "chat_message"
+        ]
+
+
+async def settle() -> None:
+    await asyncio.sleep(0.1)
+
+
+def test_a_resumed_villager_only_gets_what_it_may_see():
+    async def test() -> None:
+        server = MafiaServer(ServerConfig())
+        async with serve(
+            server.handler, "127.0.0.1", 0, select_subprotocol=select_subprotocol
+        ) as listener:
+            url = f"ws://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+            clients: Dict[str, Client] = {}
+            host = clients["p0"] = Client("p0")
+            await host.open(url, {"type": "new_room", "name": "p0"})
+            code: str = (await host.expect("room_created"))["room_code"]
+            for number in range(1, 6):
+                client = clients[f"p{number}"] = Client(f"p{number}")
+                await client.open(
+                    url, {"type": "join_room", "room_code": code, "name": client.name}
+                )
+                await client.expect("room_joined")
+
+            room: Room = server.rooms[code]
+            room.rng = random.Random(3)
+            assert room.begin()
+            room.begin_night()
+            await room.broadcast_game_state()
+            mafia = [p for p in room.players.values() if isinstance(p.role, Mafia)]
+            detective = next(
+                p for p in room.players.values() if isinstance(p.role, Detective)
+            )
+            villager = next(
+                p for p in room.players.values() if p.role.name == "Villager"
+            )
+            away = clients[villager.name]
+
+            await room.send_chat(mafia[0].id, "secret before")
+            await room.add_event("public before")
+            await settle()
+            last_seq: int = away.last_seq
+            token: str = (await away.expect("room_joined"))["resume_token"]
+            await away.close()
+            await settle()
+
+            await room.send_chat(mafia[0].id, "secret while away")
+            await room.night_action(detective.id, mafia[0].id)
+            await room.add_event("public while away")
+            await settle()
+            assert any("is mafia" in m for m in clients[detective.name].messages())
+
+            back = Client(villager.name)
+            await back.open(
+                url,
+                {
+                    "type": "resume",
+                    "room_code": code,
+                    "token": token,
+                    "last_seq": last_seq,
+                },
+            )
+            await back.expect("resumed")
+            await back.expect("state_snapshot")
+            await settle()
+
+            replayed = [event for event in back.events if "seq" in event]
+            assert replayed and all(event["seq"] > last_seq for event in replayed)
+            assert back.messages() == ["public while away"]
+            assert "secret before" not in away.messages()
+            await back.close()
+            for client in clients.values():
+                if client is not away:
+                    await client.close()
+
+    asyncio.run(test())
+
+
+def test_an_unknown_token_gets_session_expired():
+    async def test() -> None:
+        server = MafiaServer(ServerConfig())
+        async with serve(
+            server.handler, "127.0.0.1", 0, select_subprotocol=select_subprotocol
+        ) as listener:
+            url = f"ws://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+            host = Client("p0")
+            await host.open(url, {"type": "new_room", "name": "p0"})
+            created = await host.expect("room_created")
+
+            stale = Client("p1")
+            await stale.open(
+                url,
+                {"type": "resume", "room_code": created["room_code"], "token": "nope"},
+            )
+            error = await stale.expect("error")
+            assert error["code"] == "session_expired"
+
+            # a real token for a room that has since closed is just as stale
+            await host.websocket.send(json.dumps({"type": "leave_room"}))
+            await settle()
+            assert created["room_code"] not in server.rooms
+            late = Client("p0")
+            await late.open(
+                url,
+                {
+                    "type": "resume",
+                    "room_code": created["room_code"],
+                    "token": created["resume_token"],
+                },
+            )
+            assert (await late.expect("error"))["code"] == "session_expired"
+            for client in (host, stale, late):
+                await client.close()
+
+    asyncio.run(test())
@@ -0,0 +1,40 @@
+import asyncio
+
+from player import Player
+from roles import MAFIA, VILLAGER
+from room import MAFIA_ONLY, Room
+
+
+def seated(room: Room, name: str) -> Player:
+    player = Player(None, name)
+    room.add_player(player)
+    return player
+
+
+def test_only_living_mafia_see_the_mafia_channel():
+    room = Room("ABCD")
+    mafia = seated(room, "mafia")
+    villager = seated(room, "villager")
+    mafia.set_role(MAFIA)
+    villager.set_role(VILLAGER)
+    assert room.can_see(mafia, MAFIA_ONLY)
+    assert not room.can_see(villager, MAFIA_ONLY)
+
+    mafia.is_alive = False
+    assert not room.can_see(mafia, MAFIA_ONLY)
+    assert room.can_see(mafia, None)
+    assert room.can_see(mafia, mafia.id)
+    assert not room.can_see(mafia, villager.id)
+
+
+def test_start_errors_are_not_kept_for_replay():
+    async def start() -> Room:
+        room = Room("ABCD")
+        host = seated(room, "host")
+        room.host = host.id
+        await room.start_game(host.id)
+        return room
+
+    room = asyncio.run(start())
+    assert room.seq == 0
+    assert not room.history
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import random
+from typing import Any, Dict, List
+
+from config import RoomConfig
+from enums import GamePhase
+from player import Player
+from ratelimit import ROOM_LIMITS
+from roles import Detective, Doctor, Mafia
+from room import Room
+
+
+def night_room() -> Room:
+    # eight seated, one gone (a free seat), one villager dead, every night role
+    # acted, with mafia chat, a detective result and public events in the logs
+    room = Room("ABCD", RoomConfig(chat_size=8, event_size=4, history_size=16))
+    room.rng = random.Random(7)
+    players: List[Player] = [Player(None, f"p{number}") for number in range(9)]
+    for player in players:
+        room.add_player(player)
+    room.remove_player(players[3].id)
+    assert room.begin()
+    room.begin_night()
+    return room
+
+
+def by_role(room: Room, role: type) -> List[Player]:
+    return [p for p in room.players.values() if isinstance(p.role, role)]
+
+
+async def play_night(room: Room) -> None:
+    mafia = by_role(room, Mafia)
+    town = [p for p in room.players.values() if not isinstance(p.role, Mafia)]
+    villagers = [p for p in town if not p.is_night_role()]
+    room.mark_dead(villagers[-1])
+    for number in range(12):
+        await room.add_event(f"event {number}")
+    await room.send_chat(mafia[0].id, "the doctor first")
+    for player in mafia:
+        await room.night_action(player.id, by_role(room, Doctor)[0].id)
+    await room.night_action(by_role(room, Doctor)[0].id, villagers[0].id)
+    await room.night_action(by_role(room, Detective)[0].id, mafia[0].id)
+
+
+def messages(room: Room) -> List[Any]:
+    # event log entries without their timestamps
+    return [entry[:2] + entry[3:] for entry in room.event_log.dump()[2]]
+
+
+def state(room: Room) -> Dict[str, Any]:
+    # what a snapshot has to carry over, less the deadline
+    data = room.snapshot()
+    del data["remaining"]
+    return data
+
+
+def test_a_room_survives_a_snapshot_round_trip():
+    async def test() -> None:
+        room = night_room()
+        await play_night(room)
+        data: Dict[str, Any] = json.loads(json.dumps(room.snapshot()))
+        restored = Room.restore(data, ROOM_LIMITS, lambda name: Player(None, name))
+
+        assert state(restored) == state(room)
+        assert restored.phase == GamePhase.NIGHT
+        assert abs(restored.phase_timer - room.phase_timer) < 1.0
+        assert restored.free_seats == room.free_seats == [3]
+        assert (restored.alive_mafia, restored.alive_town) == (
+            room.alive_mafia,
+            room.alive_town,
+        )
+        assert restored.chat_log.dump() == room.chat_log.dump()
+        # the ring has wrapped
+        assert len(room.event_log) == 4 and room.event_log.last_seq == 12
+        for player_id, player in room.players.items():
+            twin = restored.players[player_id]
+            assert (twin.name, twin.token, twin.seat) == (
+                player.name,
+                player.token,
+                player.seat,
+            )
+            assert type(twin.role) is type(player.role)
+            assert (twin.is_alive, twin.has_acted) == (
+                player.is_alive,
+                player.has_acted,
+            )
+
+    asyncio.run(test())
+
+
+def test_a_resumed_game_plays_on_like_the_original():
+    async def test() -> None:
+        room = night_room()
+        await play_night(room)
+        data: Dict[str, Any] = json.loads(json.dumps(room.snapshot()))
+        restored = Room.restore(data, ROOM_LIMITS, lambda name: Player(None, name))
+
+        # every night role has acted, so both resolve the night at once and
+        # wait out the day that follows
+        room.resume_game()
+        restored.resume_game()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        for game in (room, restored):
+            assert game.phase == GamePhase.DAY
+            assert game.game_task is not None
+            game.game_task.cancel()
+
+        assert list(restored.killed_players) == list(room.killed_players)
+        assert list(restored.protected_players) == list(room.protected_players)
+        assert restored.flags == room.flags
+        assert restored.pending_voters == room.pending_voters
+        assert messages(restored) == messages(room)
+        assert restored.seq == room.seq
+
+    asyncio.run(test())
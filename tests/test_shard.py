@@ -0,0 +1,93 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+from codes import RoomCodeAllocator, decode_code, encode_code
+from config import ServerConfig
+from encoding import select_subprotocol
+from server import MafiaServer
+from shard import LocalRoomDirectory, shard_for
+
+
+def test_decode_round_trips_encode():
+    for value in (0, 1, 35, 36, 1295, 36**4 - 1):
+        assert decode_code(encode_code(value, 4)) == value
+
+
+def test_decode_ignores_case_and_rejects_other_characters():
+    assert decode_code("ab12") == decode_code("AB12")
+    with pytest.raises(ValueError):
+        decode_code("AB-1")
+
+
+def test_shard_for_routes_codes_to_the_shard_that_allocated_them():
+    for num_shards in (1, 2, 3, 7):
+        for shard in range(num_shards):
+            allocator = RoomCodeAllocator(shard=shard, num_shards=num_shards)
+            for _ in range(50):
+                assert shard_for(allocator.allocate(), num_shards) == shard
+
+
+def test_shard_for_spreads_codes_across_shards():
+    counts = [0, 0, 0, 0]
+    for value in range(400):
+        counts[shard_for(encode_code(value, 4), 4)] += 1
+    assert counts == [100, 100, 100, 100]
+
+
+def test_directory_claim_is_first_come():
+    directory = LocalRoomDirectory()
+    assert directory.claim("ABCD", 1)
+    assert not directory.claim("ABCD", 1)
+    assert not directory.claim("ABCD", 2)
+    assert directory.lookup("ABCD") == 1
+
+
+def test_directory_release_frees_the_code():
+    directory = LocalRoomDirectory()
+    directory.claim("ABCD", 0)
+    directory.release("ABCD")
+    assert directory.lookup("ABCD") is None
+    assert directory.claim("ABCD", 3)
+    assert directory.lookup("ABCD") == 3
+    # releasing an unknown code is a no-op
+    directory.release("WXYZ")
+
+
+def test_directory_shares_the_mapping_it_is_given():
+    rooms = {}
+    first = LocalRoomDirectory(rooms)
+    second = LocalRoomDirectory(rooms)
+    assert first.claim("ABCD", 0)
+    assert not second.claim("ABCD", 1)
+    assert second.lookup("ABCD") == 0
+
+
+def test_an_unreachable_owner_leaves_the_client_in_the_lobby(tmp_path: Path):
+    async def test() -> None:
+        directory = LocalRoomDirectory()
+        room_code: str = RoomCodeAllocator(shard=1, num_shards=2).allocate()
+        assert directory.claim(room_code, 1)
+        peers = [str(tmp_path / "0.sock"), str(tmp_path / "1.sock")]
+        server = MafiaServer(ServerConfig(), 0, 2, directory, peers)
+        async with serve(
+            server.handler, "127.0.0.1", 0, select_subprotocol=select_subprotocol
+        ) as listener:
+            url = f"ws://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+            async with connect(url) as websocket:
+                await websocket.send(
+                    json.dumps(
+                        {"type": "join_room", "room_code": room_code, "name": "p0"}
+                    )
+                )
+                error = json.loads(await websocket.recv())
+                assert error["code"] == "room_moving"
+                # still connected, so the client can retry or do something else
+                await websocket.send(json.dumps({"type": "list_rooms"}))
+                assert json.loads(await websocket.recv())["type"] == "room_list"
+
+    asyncio.run(test())
@@ -0,0 +1,57 @@
+import asyncio
+import sqlite3
+
+from config import ServerConfig
+from server import MafiaServer
+from snapshot import SnapshotStore
+
+
+def owner_of(path: str, room_code: str) -> str:
+    connection = sqlite3.connect(path)
+    try:
+        (owner,) = connection.execute(
+            "SELECT owner FROM rooms WHERE room_code = ?", (room_code,)
+        ).fetchone()
+        return owner
+    finally:
+        connection.close()
+
+
+def test_a_live_owner_keeps_its_rooms(tmp_path):
+    path = str(tmp_path / "rooms.db")
+    old, new = SnapshotStore(path), SnapshotStore(path)
+    old.write([("ABCD", {"room": "old"})], set())
+    new.write([("ABCD", {"room": "new"}), ("WXYZ", {"room": "new"})], set())
+    assert owner_of(path, "ABCD") == old.owner
+    assert owner_of(path, "WXYZ") == new.owner
+    assert new.read_stored() == {"ABCD", "WXYZ"}
+
+    # once the old process lets go, its rooms are anyone's
+    old.release()
+    new.write([("ABCD", {"room": "new"})], set())
+    assert owner_of(path, "ABCD") == new.owner
+
+
+def test_codes_held_by_another_process_are_not_issued(tmp_path):
+    path = str(tmp_path / "rooms.db")
+    old = SnapshotStore(path)
+    old.write([("ABCD", {"room": "old"})], set())
+
+    config = ServerConfig()
+    config.snapshot_path = path
+    server = MafiaServer(config)
+    assert server.snapshots is not None
+
+    async def reserve() -> None:
+        assert server.snapshots is not None
+        await server.reserve_stored(server.snapshots)
+
+    asyncio.run(reserve())
+    assert "ABCD" in server.room_codes.live
+
+    # the old process closes the room, and the code is free again
+    old.write([], {"ABCD"})
+    asyncio.run(reserve())
+    assert "ABCD" not in server.room_codes.live
+    server.snapshots.executor.shutdown()
+    old.executor.shutdown()
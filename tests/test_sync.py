@@ -0,0 +1,123 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+from player import Player
+from room import Room
+
+
+class Connection:
+    subprotocol = None
+
+    def __init__(self) -> None:
+        self.events: List[Dict[str, Any]] = []
+
+    async def send(self, frame: bytes, text: bool = False) -> None:
+        data = json.loads(frame)
+        self.events.extend(data if isinstance(data, list) else [data])
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        pass
+
+    def of(self, *kinds: str) -> List[Dict[str, Any]]:
+        return [event for event in self.events if event["type"] in kinds]
+
+
+async def settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def seated_room(players: int) -> "tuple[Room, List[Player]]":
+    room = Room("ABCD")
+    seated: List[Player] = []
+    for number in range(players):
+        player = Player(Connection(), f"p{number}")
+        room.add_player(player)
+        seated.append(player)
+        await room.send_player_state(player)
+        await settle()
+    return room, seated
+
+
+def test_state_versions_go_up_by_one_per_flush():
+    async def test() -> None:
+        room, players = await seated_room(6)
+        connection: Connection = players[0].websocket
+        assert room.begin()
+        room.begin_night()
+        await room.broadcast_game_state()
+        await settle()
+        # nothing changed, so nothing is sent and no version is used up
+        await room.broadcast_game_state()
+        await settle()
+        room.mark_dead(players[1])
+        await room.broadcast_game_state()
+        await settle()
+        room.begin_day()
+        await room.broadcast_game_state()
+        await settle()
+
+        versions = [e["version"] for e in connection.of("state_snapshot", "state_patch")]
+        assert connection.of("state_snapshot")[0]["version"] == 1
+        assert versions == list(range(1, len(versions) + 1))
+        assert len(connection.of("state_patch")) == 2
+        assert connection.of("players_patch")[-1]["changed"][0]["is_alive"] is False
+
+    asyncio.run(test())
+
+
+def test_roster_patches_chain_from_the_snapshot():
+    async def test() -> None:
+        room, players = await seated_room(4)
+        connection: Connection = players[0].websocket
+        for number in range(4, 7):
+            late = Player(Connection(), f"p{number}")
+            room.add_player(late)
+            await room.broadcast_game_state()
+            await settle()
+        room.remove_player(players[2].id)
+        await room.broadcast_game_state()
+        await settle()
+
+        version: int = connection.of("state_snapshot")[0]["roster_version"]
+        patches = connection.of("players_patch")
+        assert len(patches) >= 4
+        for patch in patches:
+            assert patch["base"] == version
+            assert patch["version"] == version + 1
+            version = patch["version"]
+        assert version == room.roster_version
+        assert patches[-1]["removed"] == [players[2].id]
+
+        # a late joiner starts from a snapshot at the current roster version
+        joiner: Connection = room.players[late.id].websocket
+        snapshot = joiner.of("state_snapshot")[0]
+        assert snapshot["roster_version"] <= room.roster_version
+        for patch in joiner.of("players_patch"):
+            assert patch["base"] >= snapshot["roster_version"]
+
+    asyncio.run(test())
+
+
+def test_rebind_starts_over_from_a_snapshot():
+    async def test() -> None:
+        room, players = await seated_room(3)
+        player = players[0]
+        old: Connection = player.websocket
+        room.add_player(Player(Connection(), "p3"))
+        await room.broadcast_game_state()
+        await settle()
+        last: int = old.of("state_snapshot", "state_patch")[-1]["version"]
+
+        new = Connection()
+        player.rebind(new)
+        await room.send_player_state(player)
+        await settle()
+        first = new.of("state_snapshot", "state_patch", "players_patch")[0]
+        assert first["type"] == "state_snapshot"
+        assert first["version"] == last + 1
+        assert first["roster_version"] == room.roster_version
+        assert len(first["players"]) == 4
+
+    asyncio.run(test())
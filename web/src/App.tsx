@@ -1,11 +1,14 @@
-import { Button, Input } from "@headlessui/react";
+import { Button, Checkbox, Field, Input, Label } from "@headlessui/react";
 import { useState, useEffect } from "react";
 import Game from "./Game";
+import Spectate from "./Spectate";
+import RoomList from "./components/RoomList";
 import { useGameState } from "./hooks/useGameState";
 
 export default function App() {
     const [name, setName] = useState("");
     const [joinCode, setJoinCode] = useState("");
+    const [isPublic, setIsPublic] = useState(false);
 
     const {
         connected,
@@ -14,19 +17,34 @@ export default function App() {
         roomCode,
         playerId,
         isInGame,
+        isSpectating,
+        queuedWith,
+        roomList,
         createRoom,
         joinRoom,
+        spectateRoom,
+        stopSpectating,
+        quickMatch,
+        leaveQueue,
+        listRooms,
         vote,
         nightAction,
         sendChat,
         startGame,
         replayGame,
         disbandRoom,
+        loadEarlierChat,
     } = useGameState();
 
     const handleNewGame = () => {
         if (name.trim()) {
-            createRoom(name.trim());
+            createRoom(name.trim(), isPublic);
+        }
+    };
+
+    const handleQuickMatch = () => {
+        if (name.trim()) {
+            quickMatch(name.trim());
         }
     };
 
@@ -36,12 +54,35 @@ export default function App() {
         }
     };
 
+    const handleWatchGame = () => {
+        if (joinCode.trim()) {
+            spectateRoom(joinCode.trim());
+        }
+    };
+
     useEffect(() => {
         if (error) {
             setJoinCode("");
         }
     }, [error]);
 
+    useEffect(() => {
+        if (connected && !isInGame) {
+            listRooms(0);
+        }
+    }, [connected, isInGame]);
+
+    if (isSpectating && connected && roomCode) {
+        return (
+            <Spectate
+                gameData={gameData}
+                roomCode={roomCode}
+                onStopSpectating={stopSpectating}
+                error={error}
+            />
+        );
+    }
+
     if (isInGame && connected && roomCode) {
         return (
             <Game
@@ -54,6 +95,7 @@ export default function App() {
                 onStartGame={startGame}
                 onReplayGame={replayGame}
                 onDisbandRoom={disbandRoom}
+                onLoadEarlierChat={loadEarlierChat}
                 error={error}
             />
         );
@@ -95,21 +137,68 @@ export default function App() {
                         className="p-3 bg-green-500 text-white rounded-lg hover:bg-green-600 disabled:opacity-50"
                         onClick={handleJoinGame}
                         disabled={
-                            !connected || !name.trim() || !joinCode.trim()
+                            !connected ||
+                            !name.trim() ||
+                            !joinCode.trim() ||
+                            queuedWith !== null
                         }
                     >
                         Join
                     </Button>
+                    <Button
+                        className="p-3 bg-gray-500 text-white rounded-lg hover:bg-gray-600 disabled:opacity-50"
+                        onClick={handleWatchGame}
+                        disabled={
+                            !connected ||
+                            !joinCode.trim() ||
+                            queuedWith !== null
+                        }
+                    >
+                        Watch
+                    </Button>
                 </div>
 
                 <Button
                     className="w-full p-3 bg-blue-500 text-white rounded-lg hover:bg-blue-600 disabled:opacity-50"
                     onClick={handleNewGame}
-                    disabled={!connected || !name.trim()}
+                    disabled={!connected || !name.trim() || queuedWith !== null}
                 >
                     {connected ? "Create New Game" : "Connecting..."}
                 </Button>
 
+                <Field className="flex items-center gap-2">
+                    <Checkbox
+                        checked={isPublic}
+                        onChange={setIsPublic}
+                        className="size-4 rounded border bg-white data-[checked]:bg-blue-500"
+                    />
+                    <Label className="text-sm">List my game publicly</Label>
+                </Field>
+
+                {queuedWith === null ? (
+                    <Button
+                        className="w-full p-3 bg-purple-500 text-white rounded-lg hover:bg-purple-600 disabled:opacity-50"
+                        onClick={handleQuickMatch}
+                        disabled={!connected || !name.trim()}
+                    >
+                        Quick Match
+                    </Button>
+                ) : (
+                    <Button
+                        className="w-full p-3 bg-gray-500 text-white rounded-lg hover:bg-gray-600"
+                        onClick={leaveQueue}
+                    >
+                        Finding players ({queuedWith} waiting)... Cancel
+                    </Button>
+                )}
+
+                <RoomList
+                    roomList={roomList}
+                    canJoin={connected && !!name.trim() && queuedWith === null}
+                    onJoin={(code) => joinRoom(name.trim(), code)}
+                    onPage={listRooms}
+                />
+
                 <p className="text-sm text-gray-500 text-center">
                     {connected ? "Connected" : "Disconnected"}
                 </p>
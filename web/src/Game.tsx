@@ -17,6 +17,7 @@ interface GameProps {
     onStartGame: () => void;
     onReplayGame: () => void;
     onDisbandRoom: () => void;
+    onLoadEarlierChat: () => void;
     error: string;
 }
 
@@ -30,6 +31,7 @@ export default function Game({
     onStartGame,
     onReplayGame,
     onDisbandRoom,
+    onLoadEarlierChat,
     error,
 }: GameProps) {
     const [selectedTarget, setSelectedTarget] = useState("");
@@ -112,6 +114,8 @@ export default function Game({
                         chat={chat}
                         playerInfo={playerInfo}
                         onSendChat={onSendChat}
+                        hasMoreChat={gameData.hasMoreChat}
+                        onLoadEarlierChat={onLoadEarlierChat}
                     />
                 </div>
             </div>
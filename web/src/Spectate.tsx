@@ -0,0 +1,90 @@
+import { Button } from "@headlessui/react";
+import type { GameData } from "./types";
+import RoomInfo from "./components/RoomInfo";
+import PlayersList from "./components/PlayersList";
+import ChatPanel from "./components/ChatPanel";
+import Error from "./components/Error";
+
+interface SpectateProps {
+    gameData: GameData;
+    roomCode: string;
+    onStopSpectating: () => void;
+    error: string;
+}
+
+export default function Spectate({
+    gameData,
+    roomCode,
+    onStopSpectating,
+    error,
+}: SpectateProps) {
+    const { gameState, players, chat, spectators } = gameData;
+
+    if (!gameState) {
+        return (
+            <div className="flex justify-center items-center h-screen">
+                <div className="text-xl">Loading game...</div>
+            </div>
+        );
+    }
+
+    return (
+        <div className="flex flex-col h-screen">
+            <div className="flex-none border-b">
+                <RoomInfo roomCode={roomCode} />
+
+                <div className="p-4 border-b-1 flex flex-row justify-between">
+                    <div className="text-left">
+                        <p className="text-lg">
+                            Phase:{" "}
+                            <span className="font-semibold">
+                                {gameState.phase}
+                            </span>
+                        </p>
+                        {(gameState.phase === "night" ||
+                            gameState.phase === "day") && (
+                            <p className="text-lg">
+                                Time remaining:{" "}
+                                <span className="font-semibold">
+                                    {gameState.time_remaining}s
+                                </span>
+                            </p>
+                        )}
+                        {gameState.game_result && (
+                            <p className="text-lg font-semibold">
+                                {gameState.game_result}
+                            </p>
+                        )}
+                        <p className="text-sm text-gray-500">
+                            Watching with {spectators}{" "}
+                            {spectators === 1 ? "spectator" : "spectators"}
+                        </p>
+                    </div>
+                    <Button
+                        className="self-start p-2 bg-gray-500 text-white rounded hover:bg-gray-600"
+                        onClick={onStopSpectating}
+                    >
+                        Stop Watching
+                    </Button>
+                </div>
+
+                <Error error={error} />
+            </div>
+
+            <div className="flex flex-1 min-h-0 bg-gray-50">
+                <div className="w-1/3 border-r min-h-0 flex flex-col">
+                    <PlayersList players={players} />
+                </div>
+                <div className="w-2/3 min-h-0 flex flex-col">
+                    <ChatPanel
+                        chat={chat}
+                        playerInfo={null}
+                        onSendChat={() => {}}
+                        hasMoreChat={false}
+                        onLoadEarlierChat={() => {}}
+                    />
+                </div>
+            </div>
+        </div>
+    );
+}
@@ -4,14 +4,19 @@ import type { ChatMessage, PlayerInfo } from "../types";
 
 interface ChatPanelProps {
     chat: ChatMessage[];
-    playerInfo: PlayerInfo;
+    // null for spectators, who can read the chat but not write to it
+    playerInfo: PlayerInfo | null;
     onSendChat: (message: string) => void;
+    hasMoreChat: boolean;
+    onLoadEarlierChat: () => void;
 }
 
 export default function ChatPanel({
     chat,
     playerInfo,
     onSendChat,
+    hasMoreChat,
+    onLoadEarlierChat,
 }: ChatPanelProps) {
     const [chatMessage, setChatMessage] = useState("");
     const chatContainerRef = useRef<HTMLDivElement>(null);
@@ -26,7 +31,12 @@ export default function ChatPanel({
 
     const handleChatSubmit = (e: React.FormEvent) => {
         e.preventDefault();
-        if (chatMessage.trim() && playerInfo.can_chat && playerInfo.is_alive) {
+        if (
+            playerInfo &&
+            chatMessage.trim() &&
+            playerInfo.can_chat &&
+            playerInfo.is_alive
+        ) {
             onSendChat(chatMessage.trim());
             setChatMessage("");
         }
@@ -39,8 +49,16 @@ export default function ChatPanel({
                 ref={chatContainerRef}
                 className="flex-1 min-h-0 overflow-y-auto mb-4 border p-3 rounded bg-gray-50"
             >
-                {chat.map((msg, index) => (
-                    <div key={index} className="mb-1">
+                {hasMoreChat && (
+                    <Button
+                        onClick={onLoadEarlierChat}
+                        className="mb-2 text-sm text-blue-600 hover:underline"
+                    >
+                        Load earlier messages
+                    </Button>
+                )}
+                {chat.map((msg) => (
+                    <div key={msg.seq} className="mb-1">
                         <span
                             className={
                                 msg.is_server
@@ -54,33 +72,38 @@ export default function ChatPanel({
                     </div>
                 ))}
             </div>
-            <form onSubmit={handleChatSubmit} className="flex gap-2 flex-none">
-                <Input
-                    type="text"
-                    className="flex-1 p-2 border rounded focus:ring-2 focus:ring-blue-500 focus:outline-none disabled:bg-gray-100"
-                    placeholder={
-                        !playerInfo.is_alive
-                            ? "You are dead"
-                            : playerInfo.can_chat
-                              ? "Type a message..."
-                              : "Cannot chat during this phase"
-                    }
-                    value={chatMessage}
-                    onChange={(e) => setChatMessage(e.target.value)}
-                    disabled={!playerInfo.can_chat || !playerInfo.is_alive}
-                />
-                <Button
-                    type="submit"
-                    className="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600 disabled:opacity-50"
-                    disabled={
-                        !playerInfo.can_chat ||
-                        !chatMessage.trim() ||
-                        !playerInfo.is_alive
-                    }
+            {playerInfo && (
+                <form
+                    onSubmit={handleChatSubmit}
+                    className="flex gap-2 flex-none"
                 >
-                    Send
-                </Button>
-            </form>
+                    <Input
+                        type="text"
+                        className="flex-1 p-2 border rounded focus:ring-2 focus:ring-blue-500 focus:outline-none disabled:bg-gray-100"
+                        placeholder={
+                            !playerInfo.is_alive
+                                ? "You are dead"
+                                : playerInfo.can_chat
+                                  ? "Type a message..."
+                                  : "Cannot chat during this phase"
+                        }
+                        value={chatMessage}
+                        onChange={(e) => setChatMessage(e.target.value)}
+                        disabled={!playerInfo.can_chat || !playerInfo.is_alive}
+                    />
+                    <Button
+                        type="submit"
+                        className="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600 disabled:opacity-50"
+                        disabled={
+                            !playerInfo.can_chat ||
+                            !chatMessage.trim() ||
+                            !playerInfo.is_alive
+                        }
+                    >
+                        Send
+                    </Button>
+                </form>
+            )}
         </div>
     );
 }
@@ -61,6 +61,7 @@ export default function GameActions({
         return "";
     };
 
+    const minimumPlayers = gameState.minimum_players ?? 6;
     const aliveTargets = players.filter((p) => p.is_alive && p.id !== playerId);
 
     const hasAlreadyActed =
@@ -149,7 +150,7 @@ export default function GameActions({
                                 </span>
                             ))}
                         </div>
-                        {players.length >= 6 && playerInfo.is_host && (
+                        {players.length >= minimumPlayers && playerInfo.is_host && (
                             <Button
                                 className="mt-2 p-2 bg-green-500 text-white rounded hover:bg-green-600"
                                 onClick={onStartGame}
@@ -157,12 +158,12 @@ export default function GameActions({
                                 Start Game
                             </Button>
                         )}
-                        {players.length < 6 && (
+                        {players.length < minimumPlayers && (
                             <p className="text-sm text-gray-500">
-                                Need at least 6 players to start
+                                Need at least {minimumPlayers} players to start
                             </p>
                         )}
-                        {players.length >= 6 && !playerInfo.is_host && (
+                        {players.length >= minimumPlayers && !playerInfo.is_host && (
                             <p className="text-sm text-gray-500">
                                 Waiting for host to start the game
                             </p>
@@ -0,0 +1,69 @@
+import { Button } from "@headlessui/react";
+import type { RoomList as RoomListData } from "../types";
+
+interface RoomListProps {
+    roomList: RoomListData;
+    canJoin: boolean;
+    onJoin: (code: string) => void;
+    onPage: (page: number) => void;
+}
+
+export default function RoomList({
+    roomList,
+    canJoin,
+    onJoin,
+    onPage,
+}: RoomListProps) {
+    const { rooms, page, hasMore } = roomList;
+
+    return (
+        <div className="border p-3 rounded bg-gray-50">
+            <div className="flex justify-between items-center mb-2">
+                <h3 className="font-bold">Open Games</h3>
+                <Button
+                    className="text-sm text-blue-600 hover:underline"
+                    onClick={() => onPage(page)}
+                >
+                    Refresh
+                </Button>
+            </div>
+            {rooms.length === 0 && (
+                <p className="text-sm text-gray-500">No open games.</p>
+            )}
+            {rooms.map((room) => (
+                <div
+                    key={room.room_code}
+                    className="flex justify-between items-center mb-1"
+                >
+                    <span>
+                        <span className="font-semibold">{room.room_code}</span>{" "}
+                        {room.players} players, {room.open_seats} open
+                    </span>
+                    <Button
+                        className="px-2 py-1 bg-green-500 text-white rounded hover:bg-green-600 disabled:opacity-50"
+                        onClick={() => onJoin(room.room_code)}
+                        disabled={!canJoin}
+                    >
+                        Join
+                    </Button>
+                </div>
+            ))}
+            <div className="flex justify-between mt-2 text-sm">
+                <Button
+                    className="text-blue-600 hover:underline disabled:opacity-50"
+                    onClick={() => onPage(page - 1)}
+                    disabled={page === 0}
+                >
+                    Previous
+                </Button>
+                <Button
+                    className="text-blue-600 hover:underline disabled:opacity-50"
+                    onClick={() => onPage(page + 1)}
+                    disabled={!hasMore}
+                >
+                    Next
+                </Button>
+            </div>
+        </div>
+    );
+}
@@ -1,5 +1,6 @@
 import { useState, useEffect, useRef } from "react";
-import type { GameData } from "../types";
+import type { ChatMessage, GameData, Player, RoomList } from "../types";
+import { SUBPROTOCOLS, decodeMessage, encodeMessage } from "../protocol";
 
 interface UseGameStateReturn {
     connected: boolean;
@@ -9,15 +10,24 @@ interface UseGameStateReturn {
     roomCode: string;
     playerId: string;
     isInGame: boolean;
+    isSpectating: boolean;
+    queuedWith: number | null;
+    roomList: RoomList;
 
-    createRoom: (playerName: string) => void;
+    createRoom: (playerName: string, isPublic: boolean) => void;
     joinRoom: (playerName: string, code: string) => void;
+    spectateRoom: (code: string) => void;
+    stopSpectating: () => void;
+    quickMatch: (playerName: string) => void;
+    leaveQueue: () => void;
+    listRooms: (page: number) => void;
     vote: (targetId: string) => void;
     nightAction: (targetId: string) => void;
     sendChat: (message: string) => void;
     startGame: () => void;
     replayGame: () => void;
     disbandRoom: () => void;
+    loadEarlierChat: () => void;
 
     setError: (error: string) => void;
 }
@@ -30,18 +40,45 @@ export function useGameState(): UseGameStateReturn {
         playerInfo: null,
         players: [],
         chat: [],
+        hasMoreChat: false,
+        spectators: 0,
     });
     const [roomCode, setRoomCode] = useState("");
     const [playerId, setPlayerId] = useState("");
     const [isInGame, setIsInGame] = useState(false);
+    const [isSpectating, setIsSpectating] = useState(false);
+    // players waiting in the quick-match queue with us, or null when not queued
+    const [queuedWith, setQueuedWith] = useState<number | null>(null);
+    const [roomList, setRoomList] = useState<RoomList>({
+        rooms: [],
+        page: 0,
+        hasMore: false,
+    });
 
     const wsRef = useRef<WebSocket | null>(null);
     const timerRef = useRef<number | null>(null);
     const isConnectingRef = useRef(false);
+    const stateVersionRef = useRef(0);
+    const rosterVersionRef = useRef(-1);
+    // highest room event seen; after a page reload it starts over so the
+    // server replays the whole backlog
+    const lastSeqRef = useRef(0);
+    // the room being watched, so a dropped spectator can attach again
+    const spectateRef = useRef("");
+
+    const SESSION_KEY = "mafia_session";
+
+    const saveSession = (code: string, token: string) => {
+        sessionStorage.setItem(SESSION_KEY, JSON.stringify({ code, token }));
+    };
+
+    const clearSession = () => {
+        sessionStorage.removeItem(SESSION_KEY);
+    };
 
     const sendMessage = (message: any) => {
         if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
-            wsRef.current.send(JSON.stringify(message));
+            wsRef.current.send(encodeMessage(wsRef.current.protocol, message));
         } else {
             console.log("WebSocket is not connected");
         }
@@ -53,18 +90,38 @@ export function useGameState(): UseGameStateReturn {
         }
 
         isConnectingRef.current = true;
-        wsRef.current = new WebSocket("ws://192.168.0.21:8081");
+        wsRef.current = new WebSocket("ws://192.168.0.21:8081", SUBPROTOCOLS);
+        wsRef.current.binaryType = "arraybuffer";
 
         wsRef.current.onopen = () => {
             isConnectingRef.current = false;
             setConnected(true);
             setError("");
+
+            const saved = sessionStorage.getItem(SESSION_KEY);
+            if (spectateRef.current) {
+                sendMessage({
+                    type: "spectate",
+                    room_code: spectateRef.current,
+                });
+            } else if (saved) {
+                const { code, token } = JSON.parse(saved);
+                sendMessage({
+                    type: "resume",
+                    room_code: code,
+                    token,
+                    last_seq: lastSeqRef.current,
+                });
+            }
         };
 
-        wsRef.current.onclose = () => {
+        wsRef.current.onclose = (event) => {
             isConnectingRef.current = false;
             setConnected(false);
-            setTimeout(() => connect(), 3000);
+            setQueuedWith(null);
+            // a closed room ends its connections normally; come straight back
+            // to the lobby rather than waiting out the retry delay
+            setTimeout(() => connect(), event.code === 1000 ? 0 : 3000);
         };
 
         wsRef.current.onerror = () => {
@@ -74,9 +131,12 @@ export function useGameState(): UseGameStateReturn {
 
         wsRef.current.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
+                const data = decodeMessage(event.data);
                 console.log("Received:", data);
-                handleMessage(data);
+                // events from one server tick arrive together as an array
+                for (const message of Array.isArray(data) ? data : [data]) {
+                    handleMessage(message);
+                }
             } catch (err) {
                 console.error("Failed to parse message:", err);
             }
@@ -133,68 +193,174 @@ export function useGameState(): UseGameStateReturn {
         };
     }, [gameData.gameState?.time_remaining]);
 
+    const resync = () => {
+        sendMessage({
+            type: "resync",
+        });
+    };
+
+    const applyPlayersPatch = (players: Player[], patch: any): Player[] => {
+        const removed = new Set<string>(patch.removed);
+        const changed = new Map<string, Player>(
+            patch.changed.map((p: Player) => [p.id, p]),
+        );
+        const next = players
+            .filter((p) => !removed.has(p.id))
+            .map((p) => {
+                const update = changed.get(p.id);
+                changed.delete(p.id);
+                return update ? { ...p, ...update } : p;
+            });
+        return [...next, ...changed.values()];
+    };
+
+    // chat can arrive both live and from a history page, so merge by seq
+    const mergeChat = (
+        chat: ChatMessage[],
+        incoming: ChatMessage[],
+    ): ChatMessage[] => {
+        const seen = new Set(chat.map((c) => c.seq));
+        const added = incoming.filter((c) => !seen.has(c.seq));
+        if (added.length === 0) {
+            return chat;
+        }
+        return [...chat, ...added].sort((a, b) => a.seq - b.seq);
+    };
+
     const handleMessage = (data: any) => {
+        if (typeof data.seq === "number") {
+            if (data.seq <= lastSeqRef.current) {
+                return;
+            }
+            lastSeqRef.current = data.seq;
+        }
+
         switch (data.type) {
             case "room_created":
+            case "room_joined":
+            case "resumed":
+                setQueuedWith(null);
                 setRoomCode(data.room_code);
                 setPlayerId(data.player_id);
                 setIsInGame(true);
                 setError("");
+                saveSession(data.room_code, data.resume_token);
+                sendMessage({ type: "chat_history" });
                 break;
 
-            case "room_joined":
+            case "state_snapshot":
+                stateVersionRef.current = data.version;
+                rosterVersionRef.current = data.roster_version;
+                setGameData((prev) => ({
+                    ...prev,
+                    gameState: data.game_state,
+                    playerInfo: data.player_info,
+                    players: data.players,
+                }));
+                break;
+
+            case "state_patch":
+                if (data.version !== stateVersionRef.current + 1) {
+                    resync();
+                    break;
+                }
+                stateVersionRef.current = data.version;
+                setGameData((prev) => ({
+                    ...prev,
+                    gameState:
+                        prev.gameState && data.game_state
+                            ? { ...prev.gameState, ...data.game_state }
+                            : prev.gameState,
+                    playerInfo:
+                        prev.playerInfo && data.player_info
+                            ? { ...prev.playerInfo, ...data.player_info }
+                            : prev.playerInfo,
+                }));
+                break;
+
+            case "queued":
+                setQueuedWith(data.position);
+                break;
+
+            case "queue_left":
+                setQueuedWith(null);
+                break;
+
+            case "room_list":
+                setRoomList({
+                    rooms: data.rooms,
+                    page: data.page,
+                    hasMore: data.has_more,
+                });
+                break;
+
+            case "spectating":
                 setRoomCode(data.room_code);
-                setPlayerId(data.player_id);
                 setIsInGame(true);
+                setIsSpectating(true);
                 setError("");
                 break;
 
-            case "game_state":
+            case "spectator_state":
+                // every frame to a spectator carries the whole public state
                 setGameData((prev) => ({
                     ...prev,
-                    gameState: {
-                        phase: data.phase,
-                        time_remaining: data.time_remaining,
-                        game_result: data.game_result,
-                    },
+                    gameState: data.game_state,
+                    players: data.players,
+                    spectators: data.spectators,
                 }));
                 break;
 
-            case "player_info":
+            case "players_patch":
+                if (data.base !== rosterVersionRef.current) {
+                    resync();
+                    break;
+                }
+                rosterVersionRef.current = data.version;
                 setGameData((prev) => ({
                     ...prev,
-                    playerInfo: data,
+                    players: applyPlayersPatch(prev.players, data),
                 }));
                 break;
 
-            case "players_update":
+            case "chat_message":
                 setGameData((prev) => ({
                     ...prev,
-                    players: data.players,
+                    chat: mergeChat(prev.chat, [data.chat]),
                 }));
                 break;
 
-            case "chat_message":
+            case "chat_history":
                 setGameData((prev) => ({
                     ...prev,
-                    chat: [...prev.chat, data.chat],
+                    chat: mergeChat(prev.chat, data.chat),
+                    hasMoreChat: data.has_more,
                 }));
                 break;
 
             case "room_disbanded":
-                setIsInGame(false);
-                setRoomCode("");
-                setPlayerId("");
-                setGameData({
-                    gameState: null,
-                    playerInfo: null,
-                    players: [],
-                    chat: [],
-                });
+                clearSession();
+                leaveRoom();
                 setError(data.message || "Room was disbanded");
                 break;
 
             case "error":
+                // a quick match that could not be formed ends the wait
+                setQueuedWith(null);
+                if (
+                    data.code === "not_found" ||
+                    data.code === "spectators_full"
+                ) {
+                    spectateRef.current = "";
+                } else if (data.code === "session_expired") {
+                    clearSession();
+                    lastSeqRef.current = 0;
+                    setIsInGame(false);
+                } else if (data.code === "room_moving") {
+                    // a restarting server still holds the room; reconnecting
+                    // retries the resume once it has been handed over
+                    wsRef.current?.close();
+                }
                 setError(data.message);
                 break;
 
@@ -203,10 +369,50 @@ export function useGameState(): UseGameStateReturn {
         }
     };
 
-    const createRoom = (playerName: string) => {
+    const leaveRoom = () => {
+        spectateRef.current = "";
+        lastSeqRef.current = 0;
+        setIsInGame(false);
+        setIsSpectating(false);
+        setRoomCode("");
+        setPlayerId("");
+        setGameData({
+            gameState: null,
+            playerInfo: null,
+            players: [],
+            chat: [],
+            hasMoreChat: false,
+            spectators: 0,
+        });
+    };
+
+    const createRoom = (playerName: string, isPublic: boolean) => {
         sendMessage({
             type: "new_room",
             name: playerName,
+            public: isPublic,
+        });
+    };
+
+    const quickMatch = (playerName: string) => {
+        sendMessage({
+            type: "quick_match",
+            name: playerName,
+        });
+    };
+
+    const leaveQueue = () => {
+        sendMessage({
+            type: "leave_queue",
+        });
+    };
+
+    const listRooms = (page: number) => {
+        sendMessage({
+            type: "list_rooms",
+            phase: "waiting",
+            min_seats: 1,
+            page,
         });
     };
 
@@ -218,6 +424,20 @@ export function useGameState(): UseGameStateReturn {
         });
     };
 
+    const spectateRoom = (code: string) => {
+        spectateRef.current = code.toUpperCase();
+        sendMessage({
+            type: "spectate",
+            room_code: spectateRef.current,
+        });
+    };
+
+    const stopSpectating = () => {
+        // spectators send nothing, so leaving is just a fresh connection
+        leaveRoom();
+        wsRef.current?.close();
+    };
+
     const vote = (targetId: string) => {
         sendMessage({
             type: "vote",
@@ -257,6 +477,13 @@ export function useGameState(): UseGameStateReturn {
         });
     };
 
+    const loadEarlierChat = () => {
+        sendMessage({
+            type: "chat_history",
+            before: gameData.chat.length > 0 ? gameData.chat[0].seq : undefined,
+        });
+    };
+
     return {
         connected,
         error,
@@ -264,14 +491,23 @@ export function useGameState(): UseGameStateReturn {
         roomCode,
         playerId,
         isInGame,
+        isSpectating,
+        queuedWith,
+        roomList,
         createRoom,
         joinRoom,
+        spectateRoom,
+        stopSpectating,
+        quickMatch,
+        leaveQueue,
+        listRooms,
         vote,
         nightAction,
         sendChat,
         startGame,
         replayGame,
         disbandRoom,
+        loadEarlierChat,
         setError,
     };
 }
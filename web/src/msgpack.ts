@@ -0,0 +1,188 @@
+// minimal MessagePack for the binary wire protocol: nil, booleans, numbers,
+// strings, arrays and maps, which is everything the server sends
+
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
+
+class Writer {
+    buffer = new Uint8Array(256);
+    view = new DataView(this.buffer.buffer);
+    length = 0;
+
+    reserve(size: number) {
+        if (this.length + size <= this.buffer.length) {
+            return;
+        }
+        const next = new Uint8Array(Math.max(this.buffer.length * 2, this.length + size));
+        next.set(this.buffer);
+        this.buffer = next;
+        this.view = new DataView(next.buffer);
+    }
+
+    byte(value: number) {
+        this.reserve(1);
+        this.buffer[this.length++] = value;
+    }
+
+    uint16(value: number) {
+        this.reserve(2);
+        this.view.setUint16(this.length, value);
+        this.length += 2;
+    }
+
+    uint32(value: number) {
+        this.reserve(4);
+        this.view.setUint32(this.length, value);
+        this.length += 4;
+    }
+
+    float64(value: number) {
+        this.reserve(8);
+        this.view.setFloat64(this.length, value);
+        this.length += 8;
+    }
+
+    bytes(value: Uint8Array) {
+        this.reserve(value.length);
+        this.buffer.set(value, this.length);
+        this.length += value.length;
+    }
+
+    header(size: number, fix: number, fixLimit: number, tag16: number, tag32: number) {
+        if (size < fixLimit) {
+            this.byte(fix | size);
+        } else if (size < 0x10000) {
+            this.byte(tag16);
+            this.uint16(size);
+        } else {
+            this.byte(tag32);
+            this.uint32(size);
+        }
+    }
+
+    value(value: any) {
+        if (value === null || value === undefined) {
+            this.byte(0xc0);
+        } else if (value === true || value === false) {
+            this.byte(value ? 0xc3 : 0xc2);
+        } else if (typeof value === "number") {
+            if (Number.isInteger(value) && value >= 0 && value < 0x80) {
+                this.byte(value);
+            } else if (Number.isInteger(value) && value < 0 && value >= -32) {
+                this.byte(value & 0xff);
+            } else if (Number.isInteger(value) && value >= 0 && value < 0x100000000) {
+                this.byte(0xce);
+                this.uint32(value);
+            } else {
+                this.byte(0xcb);
+                this.float64(value);
+            }
+        } else if (typeof value === "string") {
+            const encoded = textEncoder.encode(value);
+            if (encoded.length < 32) {
+                this.byte(0xa0 | encoded.length);
+            } else if (encoded.length < 0x100) {
+                this.byte(0xd9);
+                this.byte(encoded.length);
+            } else {
+                this.header(encoded.length, 0, 0, 0xda, 0xdb);
+            }
+            this.bytes(encoded);
+        } else if (Array.isArray(value)) {
+            this.header(value.length, 0x90, 16, 0xdc, 0xdd);
+            value.forEach((item) => this.value(item));
+        } else {
+            const entries = Object.entries(value).filter(([, v]) => v !== undefined);
+            this.header(entries.length, 0x80, 16, 0xde, 0xdf);
+            entries.forEach(([key, item]) => {
+                this.value(key);
+                this.value(item);
+            });
+        }
+    }
+}
+
+class Reader {
+    view: DataView;
+    bytes: Uint8Array;
+    offset = 0;
+
+    constructor(buffer: ArrayBuffer) {
+        this.view = new DataView(buffer);
+        this.bytes = new Uint8Array(buffer);
+    }
+
+    string(length: number): string {
+        const value = textDecoder.decode(
+            this.bytes.subarray(this.offset, this.offset + length),
+        );
+        this.offset += length;
+        return value;
+    }
+
+    array(length: number): any[] {
+        const out = [];
+        for (let i = 0; i < length; i++) {
+            out.push(this.value());
+        }
+        return out;
+    }
+
+    map(length: number): Record<string, any> {
+        const out: Record<string, any> = {};
+        for (let i = 0; i < length; i++) {
+            const key = this.value();
+            out[key] = this.value();
+        }
+        return out;
+    }
+
+    next(size: number, read: (offset: number) => number): number {
+        const value = read(this.offset);
+        this.offset += size;
+        return value;
+    }
+
+    value(): any {
+        const tag = this.bytes[this.offset++];
+        const v = this.view;
+        if (tag < 0x80) return tag;
+        if (tag < 0x90) return this.map(tag & 0x0f);
+        if (tag < 0xa0) return this.array(tag & 0x0f);
+        if (tag < 0xc0) return this.string(tag & 0x1f);
+        if (tag >= 0xe0) return tag - 0x100;
+        switch (tag) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xca: return this.next(4, (o) => v.getFloat32(o));
+            case 0xcb: return this.next(8, (o) => v.getFloat64(o));
+            case 0xcc: return this.next(1, (o) => v.getUint8(o));
+            case 0xcd: return this.next(2, (o) => v.getUint16(o));
+            case 0xce: return this.next(4, (o) => v.getUint32(o));
+            case 0xcf: return this.next(8, (o) => Number(v.getBigUint64(o)));
+            case 0xd0: return this.next(1, (o) => v.getInt8(o));
+            case 0xd1: return this.next(2, (o) => v.getInt16(o));
+            case 0xd2: return this.next(4, (o) => v.getInt32(o));
+            case 0xd3: return this.next(8, (o) => Number(v.getBigInt64(o)));
+            case 0xd9: return this.string(this.next(1, (o) => v.getUint8(o)));
+            case 0xda: return this.string(this.next(2, (o) => v.getUint16(o)));
+            case 0xdb: return this.string(this.next(4, (o) => v.getUint32(o)));
+            case 0xdc: return this.array(this.next(2, (o) => v.getUint16(o)));
+            case 0xdd: return this.array(this.next(4, (o) => v.getUint32(o)));
+            case 0xde: return this.map(this.next(2, (o) => v.getUint16(o)));
+            case 0xdf: return this.map(this.next(4, (o) => v.getUint32(o)));
+        }
+        throw new Error(`Unsupported MessagePack tag 0x${tag.toString(16)}`);
+    }
+}
+
+export function pack(value: any): Uint8Array {
+    const writer = new Writer();
+    writer.value(value);
+    return writer.buffer.subarray(0, writer.length);
+}
+
+export function unpack(buffer: ArrayBuffer): any {
+    return new Reader(buffer).value();
+}
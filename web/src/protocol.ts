@@ -0,0 +1,150 @@
+import { pack, unpack } from "./msgpack";
+
+// wire tables for the binary protocol; must match encoding.py on the server
+const WIRE_KEYS: Record<string, string> = {
+    type: "t",
+    message: "m",
+    room_code: "rc",
+    chat: "c",
+    name: "n",
+    version: "v",
+    target: "tg",
+    seq: "s",
+    resume_token: "rt",
+    player_id: "pi",
+    timestamp: "ts",
+    sender: "sd",
+    is_host: "ih",
+    is_alive: "ia",
+    id: "i",
+    votes_needed: "vn",
+    votes: "vs",
+    voter: "vr",
+    token: "tk",
+    roster_version: "rv",
+    role_description: "rd",
+    role: "r",
+    removed: "rm",
+    players: "p",
+    player_info: "pf",
+    phase: "ph",
+    limit: "l",
+    last_seq: "ls",
+    is_server: "is",
+    has_voted: "hv",
+    has_more: "hm",
+    has_acted: "ha",
+    game_state: "g",
+    game_result: "gr",
+    code: "cd",
+    changed: "ch",
+    can_chat: "cc",
+    can_act_at_night: "cn",
+    before: "b",
+    base: "bs",
+    time_remaining: "tr",
+    minimum_players: "mp",
+    settings: "st",
+    spectators: "sp",
+    rooms: "ro",
+    page: "pg",
+    open_seats: "os",
+    min_seats: "ms",
+    position: "po",
+    public: "pu",
+};
+
+// message types and phases travel as their index in these lists
+const WIRE_ENUMS: Record<string, string[]> = {
+    type: [
+        "new_room",
+        "join_room",
+        "resume",
+        "vote",
+        "night_action",
+        "chat",
+        "chat_history",
+        "start_game",
+        "replay_game",
+        "resync",
+        "disband_room",
+        "leave_room",
+        "room_created",
+        "room_joined",
+        "resumed",
+        "state_snapshot",
+        "state_patch",
+        "players_patch",
+        "chat_message",
+        "player_joined",
+        "player_left",
+        "vote_cast",
+        "room_disbanded",
+        "error",
+        "spectate",
+        "spectating",
+        "spectator_state",
+        "list_rooms",
+        "room_list",
+        "quick_match",
+        "queued",
+        "leave_queue",
+        "queue_left",
+    ],
+    phase: ["waiting", "night", "day", "finished"],
+};
+
+const LONG_KEYS: Record<string, string> = Object.fromEntries(
+    Object.entries(WIRE_KEYS).map(([key, short]) => [short, key]),
+);
+
+const compact = (value: any): any => {
+    if (Array.isArray(value)) {
+        return value.map(compact);
+    }
+    if (value === null || typeof value !== "object") {
+        return value;
+    }
+    const out: Record<string, any> = {};
+    for (const [key, item] of Object.entries(value)) {
+        const code = WIRE_ENUMS[key]?.indexOf(item as string) ?? -1;
+        out[WIRE_KEYS[key] ?? key] = code >= 0 ? code : compact(item);
+    }
+    return out;
+};
+
+const expand = (value: any): any => {
+    if (Array.isArray(value)) {
+        return value.map(expand);
+    }
+    if (value === null || typeof value !== "object") {
+        return value;
+    }
+    const out: Record<string, any> = {};
+    for (const [short, item] of Object.entries(value)) {
+        const key = LONG_KEYS[short] ?? short;
+        const names = WIRE_ENUMS[key];
+        out[key] =
+            names && typeof item === "number" && item in names
+                ? names[item]
+                : expand(item);
+    }
+    return out;
+};
+
+// offered in order of preference; servers that negotiate neither speak JSON
+export const SUBPROTOCOLS = ["mafia.msgpack", "mafia.json"];
+
+export function encodeMessage(protocol: string, message: any): string | Uint8Array {
+    if (protocol === "mafia.msgpack") {
+        return pack(compact(message));
+    }
+    return JSON.stringify(message);
+}
+
+export function decodeMessage(data: string | ArrayBuffer): any {
+    if (typeof data === "string") {
+        return JSON.parse(data);
+    }
+    return expand(unpack(data));
+}
@@ -23,13 +23,29 @@ export interface GameState {
     phase: "waiting" | "night" | "day" | "finished";
     time_remaining: number;
     game_result?: string;
+    minimum_players?: number;
 }
 
 export interface ChatMessage {
+    seq: number;
     sender: string;
     message: string;
     timestamp: number;
-    is_server: boolean;
+    is_server?: boolean;
+}
+
+export interface RoomListing {
+    room_code: string;
+    phase: GameState["phase"];
+    players: number;
+    open_seats: number;
+    settings: Record<string, number>;
+}
+
+export interface RoomList {
+    rooms: RoomListing[];
+    page: number;
+    hasMore: boolean;
 }
 
 export interface GameData {
@@ -37,4 +53,6 @@ export interface GameData {
     playerInfo: PlayerInfo | null;
     players: Player[];
     chat: ChatMessage[];
+    hasMoreChat: boolean;
+    spectators: number;
 }